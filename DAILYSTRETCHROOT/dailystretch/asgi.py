@@ -12,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'dailystretch.settings')
+# Route the JSON API to the async views (see dailystretch/urls.py)
+os.environ.setdefault('SERVER_MODE', 'asgi')
 
 application = get_asgi_application()
@@ -44,10 +44,13 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',  # Added for Render static handling
+    'dailystretch_app.metrics.MetricsMiddleware',  # Per-view latency/SQL metrics, Server-Timing
+    'dailystretch_app.query_audit.QueryAuditMiddleware',  # DEBUG only: warns about N+1 query patterns
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'dailystretch_app.profiling.ProfilingMiddleware',  # Opt-in request profiles, see profiling.py
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -70,6 +73,12 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'dailystretch.wsgi.application'
+ASGI_APPLICATION = 'dailystretch.asgi.application'
+
+# "wsgi" (gunicorn sync workers, the default) or "asgi" (gunicorn with uvicorn
+# workers, see Procfile). In asgi mode the JSON API routes use the native async
+# views from dailystretch_app/async_views.py. asgi.py sets this automatically.
+SERVER_MODE = os.environ.get("SERVER_MODE", "wsgi")
 
 # ------------------------------
 # Database Configuration
@@ -78,8 +87,15 @@ DATABASE_URL = os.environ.get("DATABASE_URL")
 
 if DATABASE_URL:
     DATABASES = {
-        'default': dj_database_url.config(default=DATABASE_URL, conn_max_age=600, ssl_require=True)
+        # Persistent connections are per thread; under ASGI the async ORM runs
+        # queries on executor threads, so connections are closed per request there
+        'default': dj_database_url.config(default=DATABASE_URL,
+                                          conn_max_age=0 if SERVER_MODE == "asgi" else 600,
+                                          ssl_require=True)
     }
+    # Needed behind a transaction-mode pooler (pgbouncer, Supabase port 6543)
+    DATABASES['default']['DISABLE_SERVER_SIDE_CURSORS'] = os.environ.get(
+        "DISABLE_SERVER_SIDE_CURSORS", str(DATABASES['default'].get('PORT') in (6543, '6543'))) == "True"
 else:
     try:
         # Try Supabase connection
@@ -92,6 +108,9 @@ else:
                 'HOST': 'aws-1-ap-southeast-1.pooler.supabase.com',
                 'PORT': '6543',
                 'OPTIONS': {'sslmode': 'require'},
+                # Port 6543 is the transaction-mode pooler: consecutive statements
+                # may reach different backends, so cursors cannot outlive a transaction
+                'DISABLE_SERVER_SIDE_CURSORS': True,
             }
         }
     except Exception:
@@ -104,6 +123,79 @@ else:
         }
 
 
+# ------------------------------
+# Cache
+# ------------------------------
+# Must be shared by all gunicorn workers: cached snapshots (e.g. the routine
+# catalog) are invalidated by bumping a version key, and every worker has to
+# see the bump. Set REDIS_URL to use Redis; otherwise a local disk cache is used.
+REDIS_URL = os.environ.get("REDIS_URL")
+
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.environ.get("CACHE_DIR", os.path.join(BASE_DIR, '.cache')),
+        }
+    }
+
+
+# ------------------------------
+# Supabase profile sync
+# ------------------------------
+# Profile changes are queued in ProfileSyncOutbox and sent by the
+# `manage.py sync_supabase_profiles` worker; nothing is queued when unset.
+SUPABASE_URL = os.environ.get("SUPABASE_URL", "")
+SUPABASE_ANON_KEY = os.environ.get("SUPABASE_ANON_KEY", "")
+
+
+# ------------------------------
+# Request metrics (dailystretch_app.metrics)
+# ------------------------------
+# Each gunicorn worker writes its counters to a file in METRICS_DIR and
+# /metrics sums them, so the directory must be shared by all workers of a host.
+# /metrics is readable by superusers, with "Authorization: Bearer <METRICS_TOKEN>"
+# when a token is set, or by anyone in DEBUG when it is not.
+METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "True") == "True"
+METRICS_DIR = os.environ.get("METRICS_DIR", "")
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN", "")
+
+
+# ------------------------------
+# Request profiling (dailystretch_app.profiling)
+# ------------------------------
+# Profiles are taken for "?_profile=1" from superusers, for requests with an
+# "X-DS-Profile" token from "manage.py profile_token", and for this fraction of
+# all requests. Browse them in the admin panel's Profiles tab.
+PROFILING_ENABLED = os.environ.get("PROFILING_ENABLED", "True") == "True"
+PROFILE_SAMPLE_RATE = float(os.environ.get("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_INTERVAL_MS = float(os.environ.get("PROFILE_INTERVAL_MS", "5"))
+PROFILE_DIR = os.environ.get("PROFILE_DIR", "")
+PROFILE_MAX_FILES = int(os.environ.get("PROFILE_MAX_FILES", "200"))
+PROFILE_MAX_AGE_DAYS = int(os.environ.get("PROFILE_MAX_AGE_DAYS", "7"))
+
+# In DEBUG, a request running one query shape this many times is logged as a likely N+1
+QUERY_REPEAT_THRESHOLD = int(os.environ.get("QUERY_REPEAT_THRESHOLD", "3"))
+
+
+# ------------------------------
+# Authentication
+# ------------------------------
+# Log in with a username or an email address, matched case-insensitively.
+# ModelBackend stays listed so sessions created before the switch, which
+# store its path, still load their user instead of being logged out.
+AUTHENTICATION_BACKENDS = [
+    'dailystretch_app.backends.EmailOrUsernameBackend',
+    'django.contrib.auth.backends.ModelBackend',
+]
+
 # ------------------------------
 # Password validation
 # ------------------------------
@@ -17,9 +17,12 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path
 from dailystretch_app import views
+from dailystretch_app import async_views
 from django.conf import settings
 from django.conf.urls.static import static
 
+# Under ASGI the small JSON API views are served by their native async versions
+api_views = async_views if settings.SERVER_MODE == 'asgi' else views
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -43,10 +46,22 @@ urlpatterns = [
     path('main/admin/routine/delete/<int:routine_id>/', views.delete_routine, name='delete_routine'),
     path('main/admin/routine/update/<int:routine_id>/', views.update_routine, name='update_routine'),
     path('main/admin/user/toggle/', views.toggle_admin_status, name='toggle_admin_status'),
-    path('favorite-toggle/', views.favorite_toggle, name='favorite_toggle'),
-    path('favorite-list/', views.favorite_list, name='favorite_list'),
+    path('main/admin/routines/', views.api_admin_table, {'table': 'routines'}, name='admin_routines'),
+    path('main/admin/routines/<int:routine_id>/', views.api_admin_routine, name='admin_routine'),
+    path('main/admin/users/', views.api_admin_table, {'table': 'users'}, name='admin_users'),
+    path('main/admin/analytics/', views.api_admin_analytics, name='admin_analytics'),
+    path('main/admin/profiles/', views.api_admin_profiles, name='admin_profiles'),
+    path('main/admin/profiles/<str:profile_id>/', views.api_admin_profile, name='admin_profile'),
+    path('favorite-toggle/', api_views.favorite_toggle, name='favorite_toggle'),
+    path('favorite-list/', api_views.favorite_list, name='favorite_list'),
+    path('api/favorites/', api_views.api_favorites, name='api_favorites'),
     # API
-    path('api/routines/', views.api_routines, name='api_routines'),
-    path('api/set-theme/', views.api_set_theme, name='api_set_theme'),
+    path('api/routines/', api_views.api_routines, name='api_routines'),
+    path('api/routines/search/', views.api_search_routines, name='api_search_routines'),
+    path('api/routines/popular/', views.api_popular_routines, name='api_popular_routines'),
+    path('api/sessions/', views.api_sessions, name='api_sessions'),
+    path('api/set-theme/', api_views.api_set_theme, name='api_set_theme'),
+    path('api/bootstrap/', views.api_bootstrap, name='api_bootstrap'),
+    path('metrics', views.metrics_view, name='metrics'),
 ]+ static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
 
@@ -0,0 +1,112 @@
+"""Server-side pages for the admin panel's routine and user tables.
+
+The panel fetches one page at a time as JSON (see admin_panel.js) instead of
+rendering every row into the segment. Each table projects only the columns
+it shows with ``only()``; favorite counts come from the denormalized
+``RoutineStats.favorite_count`` and ``Profile.favorite_count`` through a join
+(routines without a stats row count 0), so a page is two queries
+(COUNT and the page itself) however many rows it holds.
+"""
+from dataclasses import dataclass
+
+from django.contrib.auth.models import User
+from django.db.models import F, Q
+from django.db.models.functions import Coalesce
+
+from .models import Routine
+
+DEFAULT_PAGE_SIZE = 25
+MAX_PAGE_SIZE = 100
+MAX_QUERY_LENGTH = 100
+
+
+@dataclass(frozen=True)
+class AdminTable:
+    fields: tuple
+    sorts: tuple
+    default_sort: str
+    search_fields: tuple
+
+    def queryset(self):
+        raise NotImplementedError
+
+    def row(self, obj):
+        return {f: getattr(obj, f) for f in self.fields}
+
+
+class RoutineTable(AdminTable):
+    def queryset(self):
+        fields = [f for f in self.fields if f != 'favorite_count']
+        return Routine.objects.only(*fields).annotate(
+            favorite_count=Coalesce(F('stats__favorite_count'), 0))
+
+
+class UserTable(AdminTable):
+    def queryset(self):
+        fields = [f for f in self.fields if f != 'favorite_count']
+        return User.objects.only(*fields).annotate(
+            favorite_count=Coalesce(F('profile__favorite_count'), 0))
+
+
+TABLES = {
+    'routines': RoutineTable(
+        fields=('id', 'title', 'category', 'difficulty', 'duration_minutes', 'duration_text', 'favorite_count'),
+        sorts=('id', 'title', 'category', 'difficulty', 'duration_minutes', 'favorite_count'),
+        default_sort='-id',
+        search_fields=('title', 'category'),
+    ),
+    'users': UserTable(
+        fields=('id', 'username', 'email', 'is_superuser', 'date_joined', 'last_login', 'favorite_count'),
+        sorts=('id', 'username', 'email', 'date_joined', 'last_login', 'favorite_count'),
+        default_sort='id',
+        search_fields=('username', 'email'),
+    ),
+}
+
+
+def _int_param(params, name, default, minimum, maximum=None):
+    try:
+        value = int(params.get(name) or default)
+    except ValueError:
+        raise ValueError(f'{name} must be an integer')
+    if value < minimum:
+        raise ValueError(f'{name} must be >= {minimum}')
+    return min(value, maximum) if maximum else value
+
+
+def get_page(name, params):
+    """One page of an admin table from request params; raises ValueError on bad input.
+
+    Params: q= (substring match on the table's search fields), sort= (a
+    column name, '-' prefix for descending), page= (from 1), page_size=.
+    """
+    table = TABLES[name]
+    sort = params.get('sort') or table.default_sort
+    if sort.lstrip('-') not in table.sorts:
+        raise ValueError(f"sort must be one of {', '.join(table.sorts)} (optionally prefixed with '-')")
+    page = _int_param(params, 'page', 1, 1)
+    page_size = _int_param(params, 'page_size', DEFAULT_PAGE_SIZE, 1, MAX_PAGE_SIZE)
+
+    qs = table.queryset()
+    q = (params.get('q') or '').strip()[:MAX_QUERY_LENGTH]
+    if q:
+        match = Q()
+        for field in table.search_fields:
+            match |= Q(**{f'{field}__icontains': q})
+        qs = qs.filter(match)
+    # id breaks ties so rows never repeat or vanish between pages
+    tiebreak = '-id' if sort.startswith('-') else 'id'
+    qs = qs.order_by(sort, tiebreak) if sort.lstrip('-') != 'id' else qs.order_by(sort)
+
+    total = qs.count()
+    offset = (page - 1) * page_size
+    rows = [table.row(obj) for obj in qs[offset:offset + page_size]] if offset < total else []
+    return {
+        'results': rows,
+        'page': page,
+        'page_size': page_size,
+        'total': total,
+        'pages': (total + page_size - 1) // page_size,
+        'sort': sort,
+        'q': q,
+    }
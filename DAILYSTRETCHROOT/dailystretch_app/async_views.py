@@ -0,0 +1,95 @@
+"""Native async versions of the small JSON API views.
+
+Routed instead of their sync twins in views.py when SERVER_MODE is "asgi"
+(see dailystretch/urls.py). Under WSGI every async view would pay for an
+event loop hop per request, so the sync versions stay the default there.
+Behaviour and response shapes match views.py exactly.
+"""
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.decorators import login_required
+from django.http import JsonResponse, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.views.decorators.http import require_POST
+
+from .models import UserSettings, Favorite
+from . import catalog
+from . import favorites
+
+
+@login_required(login_url='login')
+async def api_routines(request):
+    if catalog.wants_query(request.GET):
+        try:
+            query = catalog.parse_query(request.GET)
+        except ValueError as e:
+            return JsonResponse({'ok': False, 'error': str(e)}, status=400)
+        if query.limit is None:
+            response = StreamingHttpResponse(
+                catalog.astream_json_array(query),
+                content_type='application/json')
+        else:
+            rows, next_cursor = await catalog.afetch_page(query)
+            response = JsonResponse(rows, safe=False)
+            if next_cursor is not None:
+                response['X-Next-Cursor'] = str(next_cursor)
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
+
+    snapshot = await sync_to_async(catalog.get_snapshot)()
+    response = get_conditional_response(request, etag=snapshot.etag)
+    if response is None:
+        response = HttpResponse(snapshot.body, content_type='application/json')
+    response['ETag'] = snapshot.etag
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+@login_required
+@require_POST
+async def favorite_toggle(request):
+    user = await request.auser()
+    routine_id = request.POST.get("routine_id")
+    if not routine_id:
+        return JsonResponse({"ok": False, "error": "Missing ID"}, status=400)
+    try:
+        routine_id = int(routine_id)
+    except ValueError:
+        return JsonResponse({"ok": False, "error": "Invalid ID"}, status=400)
+    favorited = await sync_to_async(favorites.toggle)(user.id, routine_id)
+    if favorited is None:
+        return JsonResponse({"ok": False, "error": "Invalid ID"}, status=404)
+    return JsonResponse({"ok": True, "favorited": favorited})
+
+
+@login_required
+@require_POST
+async def api_favorites(request):
+    user = await request.auser()
+    try:
+        add_ids, remove_ids, replace = favorites.parse_request(request.body)
+    except ValueError as e:
+        return JsonResponse({'ok': False, 'error': str(e)}, status=400)
+    ids = await sync_to_async(favorites.apply)(user.id, add_ids, remove_ids, replace)
+    return JsonResponse({'ok': True, 'favorites': ids, 'count': len(ids)})
+
+
+@login_required
+async def favorite_list(request):
+    user = await request.auser()
+    favorites = [rid async for rid in Favorite.objects.filter(user=user).values_list('routine_id', flat=True)]
+    return JsonResponse(favorites, safe=False)
+
+
+@login_required(login_url='login')
+@require_POST
+async def api_set_theme(request):
+    try:
+        theme = request.POST.get('theme', '').lower().strip()
+        if theme not in ('light', 'dark'):
+            return JsonResponse({'ok': False, 'error': 'Invalid theme'}, status=400)
+        user = await request.auser()
+        await UserSettings.objects.aupdate_or_create(user=user, defaults={'theme': theme})
+        return JsonResponse({'ok': True})
+    except Exception as e:
+        return JsonResponse({'ok': False, 'error': str(e)}, status=500)
@@ -0,0 +1,152 @@
+"""Off-request avatar processing.
+
+Uploads are stored as-is and an ``AvatarJob`` is queued in the same
+transaction. ``manage.py process_avatars`` then renders each upload into
+square, EXIF-rotated, metadata-free WebP and JPEG variants at
+``Profile.AVATAR_SIZES``. Until that happens ``Profile.avatar_url`` falls back
+to the original file.
+"""
+import hashlib
+import io
+from datetime import timedelta
+
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+from .fragments import bump_user_version_on_commit
+from .models import AvatarJob, Profile
+
+VARIANT_DIR = 'profile_pictures/variants'
+SAVE_OPTIONS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+# Refuse decompression bombs well before Pillow's own (warning-only) limit
+MAX_PIXELS = 40_000_000
+
+
+def enqueue_avatar_job(profile):
+    """Queue the profile's current picture for processing. Call inside the saving transaction."""
+    if not profile.profile_picture:
+        return None
+    return AvatarJob.objects.create(profile=profile, source=profile.profile_picture.name)
+
+
+def _normalized(fileobj):
+    image = Image.open(fileobj)
+    if image.width * image.height > MAX_PIXELS:
+        raise ValueError(f'Image too large: {image.width}x{image.height}')
+    image = ImageOps.exif_transpose(image)
+    if image.mode in ('RGBA', 'LA', 'P'):
+        # Flatten transparency onto white; JPEG has no alpha channel
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel('A'))
+        return background
+    return image.convert('RGB')
+
+
+def render_variants(fileobj):
+    """Yield (size_key, fmt, bytes) for every variant of the image in ``fileobj``.
+
+    Variants are re-encoded from pixels only, so EXIF/ICC/XMP metadata is dropped.
+    """
+    image = _normalized(fileobj)
+    for key, px in Profile.AVATAR_SIZES.items():
+        square = ImageOps.fit(image, (px, px), Image.LANCZOS)
+        for fmt in Profile.AVATAR_FORMATS:
+            pil_format, options = SAVE_OPTIONS[fmt]
+            buf = io.BytesIO()
+            square.save(buf, pil_format, **options)
+            yield key, fmt, buf.getvalue()
+
+
+def process_profile_avatar(profile):
+    """Render and store variants for the profile's current picture."""
+    field = profile.profile_picture
+    storage = field.storage
+    source = field.name
+    stem = hashlib.sha1(source.encode('utf-8')).hexdigest()[:12]
+
+    shared = getattr(storage, 'content_addressed', False)
+    variants = None
+    if shared:
+        # Same bytes, same variants: reuse another profile's renders (e.g. the default picture)
+        donor = (Profile.objects.filter(profile_picture=source, avatar_variants__source=source)
+                 .exclude(pk=profile.pk).values_list('avatar_variants', flat=True).first())
+        variants = donor
+    if variants is None:
+        variants = {'source': source}
+        with storage.open(source, 'rb') as f:
+            for key, fmt, data in render_variants(f):
+                ext = 'jpg' if fmt == 'jpeg' else fmt
+                name = storage.save(f'{VARIANT_DIR}/{stem}_{key}.{ext}', ContentFile(data))
+                variants.setdefault(key, {})[fmt] = name
+
+    old = profile.avatar_variants or {}
+    # Only publish if the picture did not change while we were rendering
+    updated = Profile.objects.filter(pk=profile.pk, profile_picture=source).update(avatar_variants=variants)
+    if updated:
+        # The update() skips the Profile save signal; cached segments show these URLs
+        bump_user_version_on_commit(profile.user_id)
+    if shared:
+        # Content-addressed files may be referenced by other profiles
+        return bool(updated)
+    stale = variants if not updated else old
+    for key in Profile.AVATAR_SIZES:
+        for name in (stale.get(key) or {}).values():
+            try:
+                storage.delete(name)
+            except Exception:
+                pass
+    return bool(updated)
+
+
+class AvatarWorker:
+    # Claimed jobs are hidden from other workers for this long
+    LEASE = timedelta(minutes=5)
+
+    def __init__(self, batch_size=20, max_attempts=5, log=None):
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.log = log or (lambda msg: None)
+
+    def claim(self):
+        now = timezone.now()
+        with transaction.atomic():
+            jobs = list(AvatarJob.objects.select_for_update(skip_locked=True)
+                        .select_related('profile')
+                        .filter(next_attempt_at__lte=now).order_by('id')[:self.batch_size])
+            if jobs:
+                AvatarJob.objects.filter(id__in=[j.id for j in jobs]).update(next_attempt_at=now + self.LEASE)
+        return jobs
+
+    def run_once(self):
+        """Process one batch. Returns (processed, skipped, failed)."""
+        processed = skipped = failed = 0
+        for job in self.claim():
+            profile = job.profile
+            if profile.profile_picture.name != job.source or profile.avatar_ready:
+                # Superseded by a newer upload, or already done
+                job.delete()
+                skipped += 1
+                continue
+            try:
+                process_profile_avatar(profile)
+            except Exception as e:
+                attempts = job.attempts + 1
+                self.log(f'Avatar job {job.id} failed (attempt {attempts}): {e}')
+                failed += 1
+                if attempts >= self.max_attempts or isinstance(e, (ValueError, OSError)):
+                    # Unreadable or missing images will not get better; keep the original
+                    job.delete()
+                else:
+                    AvatarJob.objects.filter(pk=job.pk).update(
+                        attempts=attempts, last_error=str(e)[:1000],
+                        next_attempt_at=timezone.now() + timedelta(seconds=30 * 2 ** attempts))
+            else:
+                job.delete()
+                processed += 1
+        return processed, skipped, failed
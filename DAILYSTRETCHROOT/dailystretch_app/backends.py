@@ -0,0 +1,82 @@
+"""Case-insensitive user lookups and login by username or email.
+
+Usernames and emails are unique regardless of case: migration 0022 adds
+unique indexes on ``lower(username)`` and ``lower(nullif(email, ''))`` (the
+NULLIF lets any number of accounts have no email). Lookups have to be written
+against the same expressions for the database to use those indexes:
+``username__iexact`` compiles to ``UPPER(...)`` on PostgreSQL, which neither
+index serves, so every check goes through ``users_matching`` instead.
+
+``EmailOrUsernameBackend`` comes first in AUTHENTICATION_BACKENDS, so the login
+form accepts either identifier and resolves it in one query. ModelBackend is
+kept after it for sessions that still name it.
+"""
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.db.models import CharField, Func, Q
+from django.db.models.functions import Lower
+
+User = get_user_model()
+
+
+class _EmailKey(Func):
+    # The '' stays a literal: SQLite only matches an index expression to
+    # query text that is identical, and a bound parameter is not
+    template = "LOWER(NULLIF(%(expressions)s, ''))"
+    output_field = CharField()
+
+
+def users_matching(username=None, email=None):
+    """Users whose username or email equals the given values, ignoring case.
+
+    Empty values match nobody.
+    """
+    return _matching([username] if username else [], [email] if email else [])
+
+
+def taken_identifiers(usernames, emails):
+    """The lowercased usernames and emails from the given ones that existing users already have."""
+    usernames = {u.lower() for u in usernames if u}
+    emails = {e.lower() for e in emails if e}
+    taken_usernames, taken_emails = set(), set()
+    for username, email in _matching(usernames, emails).values_list('username', 'email'):
+        taken_usernames.add(username.lower())
+        taken_emails.add(email.lower())
+    return taken_usernames & usernames, taken_emails & emails
+
+
+def _matching(usernames, emails):
+    condition = Q()
+    if usernames:
+        condition |= Q(username_lower__in=[u.lower() for u in usernames])
+    if emails:
+        condition |= Q(email_lower__in=[e.lower() for e in emails])
+    if not condition:
+        return User.objects.none()
+    return User.objects.alias(
+        username_lower=Lower('username'),
+        email_lower=_EmailKey('email'),
+    ).filter(condition)
+
+
+class EmailOrUsernameBackend(ModelBackend):
+    """ModelBackend that also accepts an email address, both matched case-insensitively."""
+
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        if username is None:
+            username = kwargs.get(User.USERNAME_FIELD)
+        if username is None or password is None:
+            return None
+        identifier = username.strip()
+        # At most two rows: one by username, another whose email is that text
+        candidates = list(users_matching(username=identifier, email=identifier)[:2])
+        if not candidates:
+            # Hash anyway, so response time does not reveal whether the account exists
+            User().set_password(password)
+            return None
+        # A username match wins over someone else's email
+        candidates.sort(key=lambda u: u.username.lower() != identifier.lower())
+        user = candidates[0]
+        if user.check_password(password) and self.user_can_authenticate(user):
+            return user
+        return None
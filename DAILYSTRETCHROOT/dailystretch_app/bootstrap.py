@@ -0,0 +1,42 @@
+"""Per-user bootstrap payload for the /main/ shell.
+
+Everything the shell needs for first paint (settings, theme, profile summary
+and favorites) is loaded in two queries: the request's UserContext (the user
+joined to its settings and profile rows) and the favorite routine ids.
+"""
+from .models import Favorite
+
+
+def build_bootstrap(context):
+    user = context.user
+    # Missing rows show up as unsaved defaults in the context; nothing is created
+    user_settings = context.settings
+    profile = context.profile
+    favorite_ids = list(Favorite.objects.filter(user=user).values_list('routine_id', flat=True))
+
+    theme = user_settings.theme or 'light'
+    return {
+        'ok': True,
+        'user': {
+            'id': user.pk,
+            'username': user.username,
+            'email': user.email,
+            'is_superuser': user.is_superuser,
+        },
+        'theme': theme,
+        'settings': {
+            'study_duration': user_settings.study_duration,
+            'break_duration': user_settings.break_duration,
+            'theme': theme,
+        },
+        'profile': {
+            'bio': profile.bio,
+            'date_of_birth': profile.date_of_birth.isoformat() if profile.date_of_birth else None,
+            'profile_picture_url': profile.avatar_url('md'),
+            'avatar_urls': profile.avatar_urls,
+        },
+        'favorites': {
+            'ids': favorite_ids,
+            'count': len(favorite_ids),
+        },
+    }
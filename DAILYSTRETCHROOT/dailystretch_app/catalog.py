@@ -0,0 +1,253 @@
+"""Cached, versioned snapshot of the routine catalog.
+
+The catalog is serialized once per version into JSON bytes and kept in the
+shared cache. ``Routine`` save/delete signals bump the version (see models.py),
+so readers only touch the database after the catalog actually changed.
+"""
+import hashlib
+import json
+import threading
+import time
+from dataclasses import dataclass, replace
+
+from django.core.cache import cache
+from django.db import transaction
+
+from .metrics import record_cache
+
+ROUTINE_FIELDS = ('id', 'title', 'description', 'category',
+                  'difficulty', 'duration_text', 'duration_minutes', 'instructions')
+
+VERSION_KEY = 'routines:catalog:version'
+SNAPSHOT_KEY = 'routines:catalog:snapshot:{}'
+REBUILD_LOCK_KEY = 'routines:catalog:rebuild:{}'
+
+SNAPSHOT_TIMEOUT = 60 * 60 * 24
+REBUILD_LOCK_TIMEOUT = 30
+# How long a worker waits for another worker's rebuild before building itself
+REBUILD_WAIT = 3.0
+REBUILD_POLL = 0.05
+
+_process_lock = threading.Lock()
+
+
+@dataclass(frozen=True)
+class CatalogSnapshot:
+    version: int
+    etag: str
+    body: bytes
+
+
+def _initial_version():
+    # Time-based so a version key lost to eviction never reuses an old number
+    return int(time.time() * 1000)
+
+
+def get_version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, _initial_version(), None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def bump_version():
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, _initial_version(), None)
+
+
+def bump_version_on_commit():
+    """Bump once the surrounding transaction commits, so a concurrent rebuild
+    can never store pre-commit rows under the new version."""
+    transaction.on_commit(bump_version)
+
+
+def _build():
+    from .models import Routine
+
+    rows = list(Routine.objects.order_by('id').values(*ROUTINE_FIELDS))
+    # Escape '<' so the same bytes are safe to inline inside a <script> tag
+    text = json.dumps(rows, separators=(',', ':')).replace('<', '\\u003c')
+    body = text.encode('utf-8')
+    etag = '"%s"' % hashlib.sha256(body).hexdigest()[:32]
+    return etag, body
+
+
+def _rebuild(version, key):
+    lock_key = REBUILD_LOCK_KEY.format(version)
+    if not cache.add(lock_key, 1, REBUILD_LOCK_TIMEOUT):
+        # Another worker is rebuilding this version; wait for its result
+        deadline = time.monotonic() + REBUILD_WAIT
+        while time.monotonic() < deadline:
+            time.sleep(REBUILD_POLL)
+            entry = cache.get(key)
+            if entry is not None:
+                return entry
+        return _build()
+    try:
+        entry = _build()
+        cache.set(key, entry, SNAPSHOT_TIMEOUT)
+        return entry
+    finally:
+        cache.delete(lock_key)
+
+
+def get_snapshot():
+    """Return the current catalog snapshot, rebuilding it at most once per version."""
+    version = get_version()
+    key = SNAPSHOT_KEY.format(version)
+    entry = cache.get(key)
+    record_cache('catalog', 'miss' if entry is None else 'hit')
+    if entry is None:
+        with _process_lock:
+            entry = cache.get(key)
+            if entry is None:
+                entry = _rebuild(version, key)
+    etag, body = entry
+    return CatalogSnapshot(version=version, etag=etag, body=body)
+
+
+# ------------------------------
+# Filtered / paginated queries
+# ------------------------------
+QUERY_PARAMS = ('category', 'difficulty', 'min_duration', 'max_duration',
+                'ids', 'fields', 'cursor', 'limit')
+MAX_PAGE_SIZE = 1000
+STREAM_CHUNK_SIZE = 500
+
+
+@dataclass(frozen=True)
+class RoutineQuery:
+    filters: dict
+    fields: tuple
+    cursor: int = None
+    limit: int = None
+
+
+def wants_query(params):
+    """True when the request asks for anything beyond the full cached catalog."""
+    return any(params.get(name) for name in QUERY_PARAMS)
+
+
+def _int_param(params, name, minimum=0):
+    raw = params.get(name)
+    if raw in (None, ''):
+        return None
+    try:
+        value = int(raw)
+    except (TypeError, ValueError):
+        raise ValueError(f'{name} must be an integer')
+    if value < minimum:
+        raise ValueError(f'{name} must be >= {minimum}')
+    return value
+
+
+def parse_query(params):
+    """Build a RoutineQuery from request GET params; raises ValueError on bad input."""
+    filters = {}
+    for name in ('category', 'difficulty'):
+        value = params.get(name, '').strip()
+        if value:
+            filters[name] = value
+    min_duration = _int_param(params, 'min_duration')
+    max_duration = _int_param(params, 'max_duration')
+    if min_duration is not None:
+        filters['duration_minutes__gte'] = min_duration
+    if max_duration is not None:
+        filters['duration_minutes__lte'] = max_duration
+    ids = params.get('ids', '').strip()
+    if ids:
+        try:
+            filters['id__in'] = [int(i) for i in ids.split(',') if i.strip()]
+        except ValueError:
+            raise ValueError('ids must be a comma separated list of integers')
+
+    fields = ROUTINE_FIELDS
+    requested = params.get('fields', '').strip()
+    if requested:
+        names = [f.strip() for f in requested.split(',') if f.strip()]
+        unknown = [f for f in names if f not in ROUTINE_FIELDS]
+        if unknown:
+            raise ValueError('Unknown fields: ' + ', '.join(unknown))
+        # id is always returned so clients can page and look rows up
+        fields = ('id',) + tuple(f for f in ROUTINE_FIELDS if f in names and f != 'id')
+
+    limit = _int_param(params, 'limit', minimum=1)
+    if limit is not None:
+        limit = min(limit, MAX_PAGE_SIZE)
+    return RoutineQuery(filters=filters, fields=fields,
+                        cursor=_int_param(params, 'cursor'), limit=limit)
+
+
+def query_routines(query):
+    from .models import Routine
+
+    qs = Routine.objects.filter(**query.filters)
+    if query.cursor is not None:
+        qs = qs.filter(id__gt=query.cursor)
+    return qs.order_by('id').values(*query.fields)
+
+
+def fetch_page(query):
+    """Return (rows, next_cursor) for a bounded keyset page."""
+    rows = list(query_routines(query)[:query.limit + 1])
+    next_cursor = None
+    if len(rows) > query.limit:
+        rows = rows[:query.limit]
+        next_cursor = rows[-1]['id']
+    return rows, next_cursor
+
+
+def _encode_batch(batch, first):
+    return (('' if first else ',') + ','.join(
+        json.dumps(row, separators=(',', ':')) for row in batch)).encode('utf-8')
+
+
+def _stream_pages(query):
+    # Unbounded results are read as keyset pages of STREAM_CHUNK_SIZE rows, one
+    # short query each. A database cursor held open across the response would
+    # not work behind a transaction-mode pooler (each FETCH may reach another
+    # backend), and a client-side cursor would buffer the whole result.
+    return replace(query, limit=STREAM_CHUNK_SIZE)
+
+
+def stream_json_array(query):
+    """Yield the rows of ``query`` as a JSON array, one page at a time, so the full result never sits in memory."""
+    yield b'['
+    page, first = _stream_pages(query), True
+    while True:
+        rows, next_cursor = fetch_page(page)
+        if rows:
+            yield _encode_batch(rows, first)
+            first = False
+        if next_cursor is None:
+            break
+        page = replace(page, cursor=next_cursor)
+    yield b']'
+
+
+async def astream_json_array(query):
+    """Async twin of stream_json_array for StreamingHttpResponse under ASGI."""
+    yield b'['
+    page, first = _stream_pages(query), True
+    while True:
+        rows, next_cursor = await afetch_page(page)
+        if rows:
+            yield _encode_batch(rows, first)
+            first = False
+        if next_cursor is None:
+            break
+        page = replace(page, cursor=next_cursor)
+    yield b']'
+
+
+async def afetch_page(query):
+    """Async twin of fetch_page."""
+    rows = [row async for row in query_routines(query)[:query.limit + 1]]
+    next_cursor = None
+    if len(rows) > query.limit:
+        rows = rows[:query.limit]
+        next_cursor = rows[-1]['id']
+    return rows, next_cursor
@@ -0,0 +1,46 @@
+"""Request-scoped access to the current user's settings and profile."""
+from django.contrib.auth.models import User
+
+from .models import Profile, UserSettings
+
+
+class UserContext:
+    """The current user's settings and profile, loaded with one joined query.
+
+    Reading never writes: a missing row is represented by an unsaved instance
+    carrying model defaults. Write paths call ``settings_for_write()`` /
+    ``profile_for_write()``, which create the row only when it is missing.
+    Existing users are backfilled by ``manage.py create_profiles``.
+    """
+
+    def __init__(self, user):
+        self.user = User.objects.select_related('usersettings', 'profile').get(pk=user.pk)
+        try:
+            self.settings = self.user.usersettings
+        except UserSettings.DoesNotExist:
+            self.settings = UserSettings(user=self.user)
+        try:
+            self.profile = self.user.profile
+        except Profile.DoesNotExist:
+            self.profile = Profile(user=self.user)
+
+    def settings_for_write(self):
+        if self.settings.pk is None:
+            self.settings, _ = UserSettings.objects.get_or_create(user=self.user)
+        return self.settings
+
+    def profile_for_write(self):
+        if self.profile.pk is None:
+            self.profile, _ = Profile.objects.get_or_create(user=self.user)
+        return self.profile
+
+
+def get_user_context(request):
+    """Return the request's UserContext, loading it on first use.
+
+    Cached on the request, so every caller in the same request shares one query.
+    """
+    context = getattr(request, '_user_context', None)
+    if context is None:
+        context = request._user_context = UserContext(request.user)
+    return context
@@ -0,0 +1,199 @@
+"""Set-based favorite writes.
+
+Adds are one ``INSERT ... SELECT ... ON CONFLICT DO NOTHING`` (ids of routines
+that do not exist are dropped by the SELECT, already-favorited ones by the
+conflict clause) and removes are one ``DELETE ... WHERE routine_id IN``, so
+repeated or concurrent requests converge instead of racing into
+IntegrityErrors.
+
+Both statements return the routine ids they actually changed, and the
+denormalized ``RoutineStats.favorite_count`` / ``Profile.favorite_count``
+counters are moved by exactly that much in the same transaction (an upsert,
+since a routine gets its stats row on its first favorite, and ``F()`` updates),
+which also bumps the user's segment cache version (see fragments.py).
+Favorites removed by cascade are handled by receivers in models.py, and
+``manage.py reconcile_favorite_counts`` repairs any remaining drift.
+"""
+import json
+
+from django.db import connection, transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
+
+from .fragments import bump_user_version_on_commit
+from .models import Favorite, Profile, Routine, RoutineStats
+
+# Largest number of ids accepted in one request
+MAX_BATCH = 500
+TOP_LIMIT = 50
+
+
+def parse_ids(values):
+    """Coerce a list of routine ids from a request body; raises ValueError."""
+    if values is None:
+        return []
+    if not isinstance(values, (list, tuple)):
+        raise ValueError('Expected a list of routine ids')
+    if len(values) > MAX_BATCH:
+        raise ValueError(f'At most {MAX_BATCH} ids per request')
+    ids = []
+    for value in values:
+        if isinstance(value, bool):
+            raise ValueError('Invalid routine id')
+        try:
+            ids.append(int(value))
+        except (TypeError, ValueError):
+            raise ValueError('Invalid routine id')
+    return list(dict.fromkeys(ids))
+
+
+def parse_request(raw_body):
+    """Parse an api_favorites JSON body into (add_ids, remove_ids, replace); raises ValueError.
+
+    The body is ``{"add": [ids], "remove": [ids]}`` or ``{"set": [ids]}``;
+    ``replace`` is None unless ``set`` was given.
+    """
+    body = json.loads(raw_body or b'{}')
+    if not isinstance(body, dict):
+        raise ValueError('Expected a JSON object')
+    replace = parse_ids(body['set']) if 'set' in body else None
+    add_ids = parse_ids(body.get('add'))
+    remove_ids = parse_ids(body.get('remove'))
+    if replace is not None and (add_ids or remove_ids):
+        raise ValueError('Use either set or add/remove')
+    if set(add_ids) & set(remove_ids):
+        raise ValueError('An id cannot be both added and removed')
+    return add_ids, remove_ids, replace
+
+
+def _can_return():
+    return connection.vendor in ('postgresql', 'sqlite') and connection.features.can_return_rows_from_bulk_insert
+
+
+def _increment_routines(routine_ids):
+    if _can_return():
+        # Backends with RETURNING also have ON CONFLICT DO UPDATE
+        table = RoutineStats._meta.db_table
+        sql = (
+            f"INSERT INTO {table} (routine_id, favorite_count) VALUES {', '.join(['(%s, 1)'] * len(routine_ids))} "
+            f"ON CONFLICT (routine_id) DO UPDATE SET favorite_count = {table}.favorite_count + 1"
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(sql, list(routine_ids))
+    else:
+        RoutineStats.objects.bulk_create([RoutineStats(routine_id=rid) for rid in routine_ids],
+                                         ignore_conflicts=True)
+        RoutineStats.objects.filter(routine_id__in=routine_ids).update(favorite_count=F('favorite_count') + 1)
+
+
+def _adjust_counts(user_id, routine_ids, delta):
+    if not routine_ids:
+        return
+    bump_user_version_on_commit(user_id)
+    if delta > 0:
+        _increment_routines(routine_ids)
+        Profile.objects.filter(user_id=user_id).update(favorite_count=F('favorite_count') + len(routine_ids))
+    else:
+        RoutineStats.objects.filter(routine_id__in=routine_ids).update(
+            favorite_count=Greatest(F('favorite_count') - 1, 0))
+        Profile.objects.filter(user_id=user_id).update(
+            favorite_count=Greatest(F('favorite_count') - len(routine_ids), 0))
+
+
+def add(user_id, routine_ids):
+    """Favorite every existing routine in ``routine_ids``. Returns the ids newly added."""
+    if not routine_ids:
+        return []
+    if _can_return():
+        placeholders = ', '.join(['%s'] * len(routine_ids))
+        sql = (
+            f"INSERT INTO {Favorite._meta.db_table} (user_id, routine_id) "
+            f"SELECT %s, r.id FROM {Routine._meta.db_table} r WHERE r.id IN ({placeholders}) "
+            "ON CONFLICT (user_id, routine_id) DO NOTHING RETURNING routine_id"
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [user_id, *routine_ids])
+            added = [row[0] for row in cursor.fetchall()]
+    else:
+        existing = set(Favorite.objects.filter(user_id=user_id, routine_id__in=routine_ids)
+                       .values_list('routine_id', flat=True))
+        added = [rid for rid in Routine.objects.filter(id__in=routine_ids).values_list('id', flat=True)
+                 if rid not in existing]
+        Favorite.objects.bulk_create([Favorite(user_id=user_id, routine_id=rid) for rid in added],
+                                     ignore_conflicts=True)
+    _adjust_counts(user_id, added, +1)
+    return added
+
+
+def _delete(user_id, routine_ids, keep=False):
+    """Delete the user's favorites in ``routine_ids`` (or all but them with ``keep``)."""
+    table = Favorite._meta.db_table
+    if _can_return():
+        sql = f"DELETE FROM {table} WHERE user_id = %s"
+        params = [user_id]
+        if routine_ids:
+            placeholders = ', '.join(['%s'] * len(routine_ids))
+            sql += f" AND routine_id {'NOT IN' if keep else 'IN'} ({placeholders})"
+            params += list(routine_ids)
+        with connection.cursor() as cursor:
+            cursor.execute(sql + " RETURNING routine_id", params)
+            removed = [row[0] for row in cursor.fetchall()]
+    else:
+        qs = Favorite.objects.filter(user_id=user_id)
+        if routine_ids:
+            qs = qs.exclude(routine_id__in=routine_ids) if keep else qs.filter(routine_id__in=routine_ids)
+        removed = list(qs.select_for_update().values_list('routine_id', flat=True))
+        qs.filter(routine_id__in=removed).delete()
+    _adjust_counts(user_id, removed, -1)
+    return removed
+
+
+def remove(user_id, routine_ids):
+    """Unfavorite ``routine_ids``. Returns the ids actually removed."""
+    if not routine_ids:
+        return []
+    return _delete(user_id, routine_ids)
+
+
+def ids_for(user_id):
+    return list(Favorite.objects.filter(user_id=user_id).order_by('routine_id')
+                .values_list('routine_id', flat=True))
+
+
+def apply(user_id, add_ids=(), remove_ids=(), replace=None):
+    """Apply a batch of changes in one transaction and return the resulting id list.
+
+    With ``replace`` the user's favorites become exactly that set (minus
+    routines that do not exist); otherwise ``add_ids`` and ``remove_ids`` are
+    applied, which must not overlap.
+    """
+    with transaction.atomic():
+        if replace is not None:
+            _delete(user_id, replace, keep=True)
+            add(user_id, replace)
+        else:
+            remove(user_id, remove_ids)
+            add(user_id, add_ids)
+        return ids_for(user_id)
+
+
+def toggle(user_id, routine_id):
+    """Flip one favorite. Returns the new state, or None if the routine does not exist."""
+    with transaction.atomic():
+        if remove(user_id, [routine_id]):
+            return False
+        if add(user_id, [routine_id]):
+            return True
+        # Nothing inserted: a concurrent request favorited it first, or no such routine
+        if Routine.objects.filter(pk=routine_id).exists():
+            return True
+        return None
+
+
+def most_favorited(limit=10, fields=('id', 'title', 'category', 'difficulty', 'duration_text')):
+    """Routines with the highest favorite_count, read from routine_stats_popularity_idx."""
+    limit = max(1, min(limit, TOP_LIMIT))
+    return list(Routine.objects.filter(stats__favorite_count__gt=0)
+                .order_by('-stats__favorite_count', 'stats__routine')
+                .annotate(favorite_count=F('stats__favorite_count'))
+                .values(*fields, 'favorite_count')[:limit])
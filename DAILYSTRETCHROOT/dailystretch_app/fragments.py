@@ -0,0 +1,145 @@
+"""Per-user cache of rendered segment HTML.
+
+Each user has a data version in the shared cache. Saves to their User,
+UserSettings or Profile row and changes to their favorites bump it (see the
+receivers in models.py and ``favorites.py``); routine edits bump the catalog
+version, which is part of every key. A segment view wrapped in
+``cached_segment`` therefore has an ETag derived from versions alone:
+
+* a request whose ``If-None-Match`` matches gets a 304 without touching the
+  database or the template engine;
+* otherwise the HTML stored under that ETag is served from the cache, and only
+  a miss renders the template.
+
+Segment templates extend ``segment_base``: main.js asks for the bare fragment
+with an ``X-DS-Segment: 1`` header, and direct navigation gets a full
+document (see ``render_segment``). The two are cached and tagged separately.
+
+Cached HTML is shared by every browser signed in as the user, so it must not
+hold per-browser values: segment forms carry no CSRF token and their scripts
+read it from the ``csrftoken`` cookie, which ``cached_segment`` makes sure is
+set even when the template is never rendered.
+"""
+import hashlib
+import os
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.http import HttpResponse
+from django.middleware.csrf import get_token
+from django.shortcuts import render
+from django.template.loader import get_template
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+
+from . import catalog
+from .metrics import record_cache
+
+USER_VERSION_KEY = 'user:{}:data:version'
+FRAGMENT_KEY = 'segment:{}:{}'
+FRAGMENT_TIMEOUT = 60 * 60 * 24
+
+SEGMENT_HEADER = 'X-DS-Segment'
+FRAGMENT_BASE = 'segments/base_fragment.html'
+DOCUMENT_BASE = 'segments/base_document.html'
+
+_template_stamps = {}
+
+
+def _initial_version():
+    # Time-based so a version key lost to eviction never reuses an old number
+    return int(time.time() * 1000)
+
+
+def get_user_version(user_id):
+    key = USER_VERSION_KEY.format(user_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, _initial_version(), None)
+        version = cache.get(key)
+    return version
+
+
+def bump_user_version(user_id):
+    key = USER_VERSION_KEY.format(user_id)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, _initial_version(), None)
+
+
+def bump_user_version_on_commit(user_id):
+    """Bump after commit, so a concurrent render cannot cache pre-commit data under the new version."""
+    transaction.on_commit(lambda: bump_user_version(user_id))
+
+
+def _template_stamp(template_name):
+    # Changes when the template file does (i.e. on deploy), identically in every worker
+    stamp = _template_stamps.get(template_name)
+    if stamp is None or settings.DEBUG:
+        origin = get_template(template_name).origin.name
+        try:
+            stamp = str(int(os.path.getmtime(origin)))
+        except OSError:
+            stamp = ''
+        _template_stamps[template_name] = stamp
+    return stamp
+
+
+def wants_fragment(request):
+    return request.headers.get(SEGMENT_HEADER) == '1'
+
+
+def render_segment(request, template_name, context=None):
+    """Render a segment as a fragment for main.js or as a full document otherwise."""
+    context = dict(context or {})
+    context['segment_base'] = FRAGMENT_BASE if wants_fragment(request) else DOCUMENT_BASE
+    response = render(request, template_name, context)
+    patch_vary_headers(response, (SEGMENT_HEADER,))
+    return response
+
+
+def segment_etag(template_name, user_id, fragment=False):
+    base = FRAGMENT_BASE if fragment else DOCUMENT_BASE
+    parts = (template_name, _template_stamp(template_name), base, _template_stamp(base), str(user_id),
+             str(get_user_version(user_id)), str(catalog.get_version()))
+    return '"%s"' % hashlib.sha256('|'.join(parts).encode('utf-8')).hexdigest()[:32]
+
+
+def cached_segment(template_name):
+    """Serve GETs of a segment view from the fragment cache, with ETag revalidation.
+
+    Only 200 responses are stored; other methods always reach the view.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view(request, *args, **kwargs)
+            etag = segment_etag(template_name, request.user.id, wants_fragment(request))
+            response = get_conditional_response(request, etag=etag)
+            if response is not None:
+                record_cache('segment', 'not_modified')
+            else:
+                key = FRAGMENT_KEY.format(request.user.id, etag.strip('"'))
+                entry = cache.get(key)
+                record_cache('segment', 'miss' if entry is None else 'hit')
+                if entry is not None:
+                    content_type, body = entry
+                    response = HttpResponse(body, content_type=content_type)
+                else:
+                    response = view(request, *args, **kwargs)
+                    if response.status_code != 200 or response.streaming:
+                        return response
+                    cache.set(key, (response['Content-Type'], response.content), FRAGMENT_TIMEOUT)
+            response['ETag'] = etag
+            # The forms in the page post with the cookie's token; a cache hit never renders {% csrf_token %}
+            get_token(request)
+            patch_vary_headers(response, (SEGMENT_HEADER,))
+            # Revalidate on every tab switch; the browser replays its copy on 304
+            patch_cache_control(response, private=True, no_cache=True)
+            return response
+        return wrapper
+    return decorator
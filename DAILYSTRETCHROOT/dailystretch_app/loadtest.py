@@ -0,0 +1,336 @@
+"""Scripted user journeys for ``manage.py load_test``.
+
+Each virtual user runs on its own thread with one keep-alive connection and
+its own cookie jar, and repeats the journey a new user takes on their first
+visit:
+
+    register -> login -> /main/ -> every segment tab (twice, the second round
+    revalidating with If-None-Match like main.js) -> favorite toggles ->
+    settings save -> favorites tab -> logout
+
+Requests are recorded under a stable endpoint label (``segment:library``,
+``favorite_toggle`` ...), so results from different commits line up. Random
+choices (which routines to favorite, think time) come from one seeded RNG per
+virtual user, so a run is repeatable for a given ``seed``. Only the standard
+library is used, like ``bench_server_modes``.
+"""
+import http.client
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import threading
+import time
+from dataclasses import dataclass, field
+from http.cookies import SimpleCookie
+from urllib.parse import urlencode, urlsplit
+
+import django
+from django.conf import settings
+
+SERVER_COMMANDS = {
+    'wsgi': ['dailystretch.wsgi:application'],
+    'asgi': ['dailystretch.asgi:application', '-k', 'uvicorn_worker.UvicornWorker'],
+}
+SEGMENTS = ('dashboard', 'library', 'favorites', 'profile', 'settings')
+SEGMENT_HEADER = 'X-DS-Segment'
+USERNAME_PREFIX = 'loadtest_'
+PASSWORD = 'loadtest-password-1'
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100.0 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+# ------------------------------
+# Local server
+# ------------------------------
+def start_server(mode, port, workers, threads=1):
+    """Start gunicorn for ``mode`` on 127.0.0.1:``port`` against the configured database."""
+    cmd = [sys.executable, '-m', 'gunicorn', *SERVER_COMMANDS[mode],
+           '-w', str(workers), '-b', f'127.0.0.1:{port}', '--log-level', 'warning']
+    if mode == 'wsgi':
+        cmd += ['--threads', str(threads)]
+    env = dict(os.environ, SERVER_MODE=mode,
+               DJANGO_SETTINGS_MODULE=os.environ.get('DJANGO_SETTINGS_MODULE', 'dailystretch.settings'))
+    return subprocess.Popen(cmd, cwd=settings.BASE_DIR, env=env)
+
+
+def wait_ready(port, proc, timeout=30):
+    """Poll /login/ until the server answers; False if it exited or timed out."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            return False
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=2)
+            conn.request('GET', '/login/')
+            conn.getresponse().read()
+            conn.close()
+            return True
+        except OSError:
+            time.sleep(0.2)
+    return False
+
+
+def stop_server(proc):
+    proc.terminate()
+    try:
+        proc.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+
+
+# ------------------------------
+# Recording
+# ------------------------------
+class Recorder:
+    """Latencies and failures per endpoint label, shared by all virtual users."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = {}
+        self.errors = {}
+        self.statuses = {}
+        self.journeys = 0
+        self.failed_journeys = 0
+
+    def add(self, label, seconds, status, ok):
+        with self._lock:
+            self.latencies.setdefault(label, []).append(seconds)
+            self.statuses.setdefault(label, {}).setdefault(str(status), 0)
+            self.statuses[label][str(status)] += 1
+            if not ok:
+                self.errors[label] = self.errors.get(label, 0) + 1
+
+    def journey_done(self, ok):
+        with self._lock:
+            self.journeys += 1
+            if not ok:
+                self.failed_journeys += 1
+
+    def summary(self, elapsed):
+        endpoints = {}
+        total = errors = 0
+        for label in sorted(self.latencies):
+            values = sorted(self.latencies[label])
+            failed = self.errors.get(label, 0)
+            total += len(values)
+            errors += failed
+            endpoints[label] = {
+                'requests': len(values),
+                'errors': failed,
+                'error_rate': round(failed / len(values), 4),
+                'rps': round(len(values) / elapsed, 2) if elapsed else 0.0,
+                'mean_ms': round(sum(values) / len(values) * 1000, 2),
+                'p50_ms': round(percentile(values, 50) * 1000, 2),
+                'p95_ms': round(percentile(values, 95) * 1000, 2),
+                'p99_ms': round(percentile(values, 99) * 1000, 2),
+                'statuses': self.statuses[label],
+            }
+        every = sorted(v for values in self.latencies.values() for v in values)
+        return {
+            'seconds': round(elapsed, 3),
+            'requests': total,
+            'errors': errors,
+            'error_rate': round(errors / total, 4) if total else 0.0,
+            'rps': round(total / elapsed, 2) if elapsed else 0.0,
+            'journeys': self.journeys,
+            'failed_journeys': self.failed_journeys,
+            'journeys_per_second': round(self.journeys / elapsed, 3) if elapsed else 0.0,
+            'p50_ms': round(percentile(every, 50) * 1000, 2),
+            'p95_ms': round(percentile(every, 95) * 1000, 2),
+            'p99_ms': round(percentile(every, 99) * 1000, 2),
+        }, endpoints
+
+
+class JourneyFailed(Exception):
+    pass
+
+
+# ------------------------------
+# Virtual user
+# ------------------------------
+@dataclass
+class VirtualUser:
+    base_url: str
+    recorder: Recorder
+    rng: random.Random
+    name: str
+    think: float = 0.0
+    favorites: int = 3
+    timeout: float = 30.0
+    cookies: dict = field(default_factory=dict)
+    etags: dict = field(default_factory=dict)
+
+    def __post_init__(self):
+        url = urlsplit(self.base_url)
+        self.host = url.netloc
+        self.prefix = url.path.rstrip('/')
+        self.conn_class = http.client.HTTPSConnection if url.scheme == 'https' else http.client.HTTPConnection
+        self.conn = None
+
+    def _connect(self):
+        self.conn = self.conn_class(self.host, timeout=self.timeout)
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+    def request(self, label, method, path, form=None, headers=None, expect=(200,)):
+        """Send one request, record it under ``label`` and return (status, headers, body)."""
+        headers = dict(headers or {})
+        if self.cookies:
+            headers['Cookie'] = '; '.join(f'{k}={v}' for k, v in self.cookies.items())
+        body = None
+        if form is not None:
+            body = urlencode(form)
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        if method == 'POST' and 'csrftoken' in self.cookies:
+            headers['X-CSRFToken'] = self.cookies['csrftoken']
+            headers['Referer'] = self.base_url
+        if self.conn is None:
+            self._connect()
+        start = time.perf_counter()
+        try:
+            self.conn.request(method, self.prefix + path, body=body, headers=headers)
+            resp = self.conn.getresponse()
+            data = resp.read()
+        except (OSError, http.client.HTTPException) as e:
+            self.recorder.add(label, time.perf_counter() - start, 'error', False)
+            self.close()
+            raise JourneyFailed(f'{label}: {e}')
+        elapsed = time.perf_counter() - start
+        for header in resp.headers.get_all('Set-Cookie') or ():
+            for key, morsel in SimpleCookie(header).items():
+                if morsel['max-age'] == '0' or not morsel.value or morsel.value == '""':
+                    self.cookies.pop(key, None)
+                else:
+                    self.cookies[key] = morsel.value
+        ok = resp.status in expect
+        self.recorder.add(label, elapsed, resp.status, ok)
+        if not ok:
+            raise JourneyFailed(f'{label}: HTTP {resp.status}')
+        if self.think:
+            time.sleep(self.rng.uniform(0, 2 * self.think))
+        return resp.status, resp.headers, data
+
+    def segment(self, name):
+        headers = {SEGMENT_HEADER: '1'}
+        if name in self.etags:
+            headers['If-None-Match'] = self.etags[name]
+        _, resp_headers, _ = self.request(f'segment:{name}', 'GET', f'/main/{name}/',
+                                          headers=headers, expect=(200, 304))
+        if resp_headers.get('ETag'):
+            self.etags[name] = resp_headers['ETag']
+
+    def run_journey(self, iteration):
+        self.cookies.clear()
+        self.etags.clear()
+        username = f'{USERNAME_PREFIX}{self.name}_{iteration}'
+        self.request('register:get', 'GET', '/register/')
+        self.request('register:post', 'POST', '/register/', expect=(302,), form={
+            'csrfmiddlewaretoken': self.cookies.get('csrftoken', ''), 'username': username,
+            'email': f'{username}@example.com', 'password': PASSWORD, 'confirm_password': PASSWORD})
+        self.request('login:get', 'GET', '/login/')
+        self.request('login:post', 'POST', '/login/', expect=(302,), form={
+            'csrfmiddlewaretoken': self.cookies.get('csrftoken', ''), 'username': username, 'password': PASSWORD})
+        if 'sessionid' not in self.cookies:
+            raise JourneyFailed('login:post: no session cookie')
+        self.request('main', 'GET', '/main/')
+
+        for _ in range(2):
+            for name in SEGMENTS:
+                self.segment(name)
+
+        _, _, body = self.request('api_routines:ids', 'GET', '/api/routines/?fields=id&limit=200')
+        ids = [row['id'] for row in json.loads(body)]
+        for routine_id in self.rng.sample(ids, min(self.favorites, len(ids))):
+            self.request('favorite_toggle', 'POST', '/favorite-toggle/', form={'routine_id': routine_id})
+        self.segment('favorites')
+
+        self.request('settings:post', 'POST', '/main/settings/', expect=(302,), form={
+            'csrfmiddlewaretoken': self.cookies.get('csrftoken', ''),
+            'study_duration': self.rng.choice([25, 30, 45, 50]), 'break_duration': self.rng.choice([5, 10, 15])})
+        self.segment('settings')
+        self.request('logout', 'GET', '/logout/', expect=(302,))
+
+
+def run(base_url, users=4, iterations=1, duration=None, seed=0, think=0.0, favorites=3, run_id=None):
+    """Run ``users`` virtual users, each for ``iterations`` journeys or ``duration`` seconds.
+
+    Returns (summary, endpoints, failures) where failures lists the first errors seen.
+    """
+    recorder = Recorder()
+    run_id = run_id or format(int(time.time()), 'x')
+    failures = []
+    failures_lock = threading.Lock()
+    deadline = time.monotonic() + duration if duration else None
+
+    def worker(index):
+        vu = VirtualUser(base_url, recorder, random.Random(f'{seed}:{index}'), f'{run_id}_{index}',
+                         think=think, favorites=favorites)
+        iteration = 0
+        try:
+            while (iteration < iterations) if deadline is None else (time.monotonic() < deadline):
+                try:
+                    vu.run_journey(iteration)
+                    recorder.journey_done(True)
+                except JourneyFailed as e:
+                    recorder.journey_done(False)
+                    with failures_lock:
+                        if len(failures) < 20:
+                            failures.append(str(e))
+                iteration += 1
+        finally:
+            vu.close()
+
+    threads = [threading.Thread(target=worker, args=(i,), daemon=True) for i in range(users)]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    summary, endpoints = recorder.summary(time.perf_counter() - started)
+    return summary, endpoints, failures
+
+
+def environment():
+    """Commit and runtime details stored with each result, to compare runs between commits."""
+    def git(*args):
+        try:
+            return subprocess.run(['git', *args], cwd=settings.BASE_DIR, capture_output=True,
+                                  text=True, timeout=5).stdout.strip() or None
+        except (OSError, subprocess.SubprocessError):
+            return None
+    return {
+        'commit': git('rev-parse', 'HEAD'),
+        'dirty': bool(git('status', '--porcelain', '--untracked-files=no')),
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+    }
+
+
+def compare(current, previous):
+    """Per-endpoint p50/p95/p99 and error-rate deltas against an earlier result file."""
+    rows = []
+    for label, now in current['endpoints'].items():
+        before = previous.get('endpoints', {}).get(label)
+        if not before:
+            continue
+        row = {'endpoint': label}
+        for key in ('p50_ms', 'p95_ms', 'p99_ms', 'rps', 'error_rate'):
+            row[key] = now[key]
+            row[key + '_before'] = before[key]
+            if before[key]:
+                row[key + '_change'] = round((now[key] - before[key]) / before[key], 4)
+        rows.append(row)
+    return rows
@@ -0,0 +1,122 @@
+import http.client
+import itertools
+import json
+import threading
+import time
+from importlib import import_module
+
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from dailystretch_app.loadtest import SERVER_COMMANDS, percentile, start_server, stop_server, wait_ready
+
+
+class Command(BaseCommand):
+    help = ('Benchmark the JSON API under gunicorn sync workers (wsgi) and gunicorn with '
+            'uvicorn workers (asgi). Starts each server locally against the configured '
+            'database and reports requests/second and latency percentiles.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--modes', nargs='+', default=['wsgi', 'asgi'], choices=sorted(SERVER_COMMANDS))
+        parser.add_argument('--paths', nargs='+', default=['/api/routines/', '/favorite-list/'],
+                            help='GET endpoints to exercise (round-robin)')
+        parser.add_argument('--requests', type=int, default=2000, help='Requests per mode')
+        parser.add_argument('--concurrency', type=int, default=32, help='Concurrent client connections')
+        parser.add_argument('--workers', type=int, default=2, help='gunicorn worker processes')
+        parser.add_argument('--threads', type=int, default=1, help='Threads per sync (wsgi) worker')
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument('--json', dest='json_path', help='Also write the results to this JSON file')
+
+    def handle(self, *args, **options):
+        cookie = self._session_cookie()
+        results = []
+        for mode in options['modes']:
+            proc = start_server(mode, options['port'], options['workers'], options['threads'])
+            try:
+                if not wait_ready(options['port'], proc):
+                    raise CommandError('Server did not become ready')
+                # Warm caches and connections so the first mode is not penalised
+                self._run_load(options['port'], options['paths'], cookie, 50, 4)
+                result = self._run_load(options['port'], options['paths'], cookie,
+                                        options['requests'], options['concurrency'])
+            finally:
+                stop_server(proc)
+            result['mode'] = mode
+            results.append(result)
+            self.stdout.write(self._format(result))
+
+        if options['json_path']:
+            with open(options['json_path'], 'w') as f:
+                json.dump({'options': {k: options[k] for k in ('paths', 'requests', 'concurrency', 'workers', 'threads')},
+                           'results': results}, f, indent=2)
+            self.stdout.write(self.style.SUCCESS(f'Wrote {options["json_path"]}'))
+
+    def _session_cookie(self):
+        user, created = User.objects.get_or_create(username='bench_server_modes')
+        if created:
+            user.set_unusable_password()
+            user.save()
+        engine = import_module(settings.SESSION_ENGINE)
+        session = engine.SessionStore()
+        session[SESSION_KEY] = str(user.pk)
+        session[BACKEND_SESSION_KEY] = settings.AUTHENTICATION_BACKENDS[0]
+        session[HASH_SESSION_KEY] = user.get_session_auth_hash()
+        session.create()
+        return f'{settings.SESSION_COOKIE_NAME}={session.session_key}'
+
+    def _run_load(self, port, paths, cookie, total, concurrency):
+        counter = itertools.count()
+        latencies = []
+        errors = []
+        lock = threading.Lock()
+
+        def client():
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+            mine, failed = [], 0
+            while True:
+                n = next(counter)
+                if n >= total:
+                    break
+                path = paths[n % len(paths)]
+                start = time.perf_counter()
+                try:
+                    conn.request('GET', path, headers={'Cookie': cookie})
+                    resp = conn.getresponse()
+                    resp.read()
+                    # A redirect here is usually to the login page: the session was not accepted
+                    if not 200 <= resp.status < 300:
+                        failed += 1
+                except (OSError, http.client.HTTPException):
+                    failed += 1
+                    conn.close()
+                    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+                mine.append(time.perf_counter() - start)
+            conn.close()
+            with lock:
+                latencies.extend(mine)
+                errors.append(failed)
+
+        threads = [threading.Thread(target=client) for _ in range(concurrency)]
+        started = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        elapsed = time.perf_counter() - started
+
+        latencies.sort()
+        return {
+            'requests': len(latencies),
+            'errors': sum(errors),
+            'seconds': round(elapsed, 3),
+            'rps': round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+            'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+            'p95_ms': round(percentile(latencies, 95) * 1000, 2),
+            'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+        }
+
+    def _format(self, r):
+        return (f"{r['mode']:>5}: {r['rps']:>8} req/s  p50 {r['p50_ms']} ms  p95 {r['p95_ms']} ms  "
+                f"p99 {r['p99_ms']} ms  errors {r['errors']}/{r['requests']}")
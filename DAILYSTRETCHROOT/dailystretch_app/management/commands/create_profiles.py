@@ -1,32 +1,39 @@
+from itertools import islice
+
 from django.core.management.base import BaseCommand
 from django.contrib.auth.models import User
-from dailystretch_app.models import Profile
-from django.conf import settings
-import os
-from django.core.files import File
+from dailystretch_app.models import Profile, UserSettings
+from dailystretch_app.storage import default_profile_picture_name
 
 class Command(BaseCommand):
-    help = 'Create Profile objects for users missing them and optionally copy default profile picture.'
+    help = ('Create Profile and UserSettings objects for users missing them and optionally set the shared default profile picture. '
+            'Read-only views never create these rows, so run this after importing users outside the app.')
 
     def add_arguments(self, parser):
-        parser.add_argument('--copy-default', action='store_true', help='Copy static default image into media for each created profile')
+        parser.add_argument('--copy-default', action='store_true', help='Point each created profile at the shared default image')
 
     def handle(self, *args, **options):
         copy_default = options.get('copy_default', False)
-        users = User.objects.all()
+        missing_settings = User.objects.filter(usersettings__isnull=True).values_list('pk', flat=True)
+        settings_created = len(UserSettings.objects.bulk_create(
+            [UserSettings(user_id=pk) for pk in missing_settings], ignore_conflicts=True))
+        self.stdout.write(self.style.SUCCESS(f'User settings created: {settings_created}'))
+
+        picture = None
+        if copy_default:
+            try:
+                # Shared content-addressed file; only the name is stored per profile
+                picture = default_profile_picture_name()
+            except Exception as e:
+                self.stdout.write(self.style.WARNING(f'  -> Failed to set default image: {e}'))
+        extra = {'profile_picture': picture} if picture else {}
+
+        missing = User.objects.filter(profile__isnull=True).values_list('pk', flat=True).iterator(chunk_size=2000)
         created_count = 0
-        for user in users:
-            profile, created = Profile.objects.get_or_create(user=user)
-            if created:
-                created_count += 1
-                self.stdout.write(self.style.SUCCESS(f'Created profile for {user.username}'))
-                if copy_default:
-                    static_default = os.path.join(settings.BASE_DIR, 'static', 'dailystretch_app', 'images', 'profilepicture.png')
-                    if os.path.exists(static_default):
-                        try:
-                            with open(static_default, 'rb') as f:
-                                profile.profile_picture.save('default.png', File(f), save=True)
-                            self.stdout.write(self.style.SUCCESS(f'  -> Copied default image for {user.username}'))
-                        except Exception as e:
-                            self.stdout.write(self.style.WARNING(f'  -> Failed to copy default image: {e}'))
+        while True:
+            batch = list(islice(missing, 2000))
+            if not batch:
+                break
+            created_count += len(Profile.objects.bulk_create(
+                [Profile(user_id=pk, **extra) for pk in batch], ignore_conflicts=True))
         self.stdout.write(self.style.SUCCESS(f'Done. Profiles created: {created_count}'))
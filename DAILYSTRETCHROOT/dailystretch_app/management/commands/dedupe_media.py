@@ -0,0 +1,140 @@
+import hashlib
+import os
+import shutil
+import time
+
+from django.core.management.base import BaseCommand
+
+from dailystretch_app.models import Profile
+from dailystretch_app.storage import HASH_DIR, content_name, profile_picture_storage
+
+CHUNK = 1024 * 1024
+
+
+class Command(BaseCommand):
+    help = ('Collapse per-user copies of profile pictures in MEDIA_ROOT into shared content-addressed '
+            'files, repoint Profile rows at them and optionally delete blobs nothing references.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dir', default='profile_pictures', help='Directory under MEDIA_ROOT to scan')
+        parser.add_argument('--batch-size', type=int, default=500, help='Files per database update batch')
+        parser.add_argument('--dry-run', action='store_true', help='Report what would change without touching anything')
+        parser.add_argument('--gc', action='store_true',
+                            help='Afterwards delete content-addressed files no profile references')
+        parser.add_argument('--gc-grace', type=int, default=3600,
+                            help='Seconds a blob must be untouched before --gc may delete it (protects in-flight uploads)')
+
+    def handle(self, *args, **options):
+        self.storage = profile_picture_storage()
+        self.dry_run = options['dry_run']
+        root = self.storage.path(options['dir'])
+        if not os.path.isdir(root):
+            self.stdout.write(self.style.WARNING(f'{root} does not exist; nothing to do'))
+            return
+
+        stats = {'files': 0, 'bytes': 0, 'written': 0, 'reclaimed': 0, 'rows': 0}
+        batch = []
+        for path in self._walk_legacy(root):
+            old_name = os.path.relpath(path, self.storage.location).replace(os.sep, '/')
+            digest, size = self._hash(path)
+            new_name = content_name(options['dir'].strip('/'), digest, os.path.splitext(path)[1])
+            stats['files'] += 1
+            stats['bytes'] += size
+            if not self.storage.exists(new_name):
+                stats['written'] += 1
+                if not self.dry_run:
+                    self._place(path, self.storage.path(new_name))
+            else:
+                stats['reclaimed'] += size
+            batch.append((old_name, new_name, path))
+            if len(batch) >= options['batch_size']:
+                stats['rows'] += self._flush(batch)
+                batch = []
+        if batch:
+            stats['rows'] += self._flush(batch)
+
+        prefix = 'Would collapse' if self.dry_run else 'Collapsed'
+        self.stdout.write(self.style.SUCCESS(
+            f"{prefix} {stats['files']} files ({stats['bytes']} bytes) into {stats['written']} new blobs; "
+            f"{stats['reclaimed']} bytes were duplicates; {stats['rows']} profiles repointed."))
+        if stats['rows'] and not self.dry_run:
+            self.stdout.write('Run `manage.py process_avatars --backfill --once` to rebuild variants for moved pictures.')
+
+        if options['gc']:
+            self._collect_garbage(root, options['gc_grace'])
+
+    def _walk_legacy(self, root):
+        """Yield files that are not already content-addressed, one at a time."""
+        for dirpath, dirnames, filenames in os.walk(root):
+            # Skip content-addressed trees and resized variants (referenced from avatar_variants)
+            dirnames[:] = [d for d in dirnames if d not in (HASH_DIR, 'variants')]
+            for filename in filenames:
+                if not filename.startswith('.'):
+                    yield os.path.join(dirpath, filename)
+
+    def _hash(self, path):
+        sha = hashlib.sha256()
+        size = 0
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(CHUNK), b''):
+                sha.update(chunk)
+                size += len(chunk)
+        return sha.hexdigest(), size
+
+    def _place(self, src, dst):
+        os.makedirs(os.path.dirname(dst), exist_ok=True)
+        tmp = dst + '.tmp'
+        try:
+            # Hard link when possible: no data copy; the original goes away on flush
+            os.link(src, tmp)
+        except OSError:
+            shutil.copyfile(src, tmp)
+        os.replace(tmp, dst)
+
+    def _flush(self, batch):
+        """Repoint rows for a batch, then delete the old copies (DB first, so a crash loses nothing)."""
+        targets = {}
+        for old_name, new_name, _ in batch:
+            targets.setdefault(new_name, []).append(old_name)
+        if self.dry_run:
+            return sum(Profile.objects.filter(profile_picture__in=olds).count() for olds in targets.values())
+        rows = 0
+        for new_name, olds in targets.items():
+            rows += Profile.objects.filter(profile_picture__in=olds).update(profile_picture=new_name)
+        for _, _, path in batch:
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+        return rows
+
+    def _collect_garbage(self, root, grace):
+        referenced = set()
+        for picture, variants in Profile.objects.values_list('profile_picture', 'avatar_variants').iterator(chunk_size=2000):
+            if picture:
+                referenced.add(picture)
+            for key, value in (variants or {}).items():
+                if isinstance(value, dict):
+                    referenced.update(value.values())
+        cutoff = time.time() - grace
+        removed = freed = 0
+        for dirpath, dirnames, filenames in os.walk(root):
+            if HASH_DIR not in dirpath.split(os.sep):
+                continue
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                name = os.path.relpath(path, self.storage.location).replace(os.sep, '/')
+                if name in referenced or filename.startswith('.'):
+                    continue
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                if stat.st_mtime > cutoff:
+                    continue
+                removed += 1
+                freed += stat.st_size
+                if not self.dry_run:
+                    self.storage.purge(name)
+        prefix = 'Would delete' if self.dry_run else 'Deleted'
+        self.stdout.write(self.style.SUCCESS(f'{prefix} {removed} unreferenced blobs ({freed} bytes).'))
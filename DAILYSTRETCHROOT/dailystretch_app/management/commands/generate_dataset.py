@@ -0,0 +1,240 @@
+import io
+import random
+import time
+from bisect import bisect_left
+from collections import Counter
+from datetime import timedelta
+from itertools import accumulate
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from dailystretch_app import catalog
+from dailystretch_app.models import Favorite, Profile, Routine, RoutineStats, UserSettings
+from dailystretch_app.storage import default_profile_picture_name
+
+PASSWORD = 'dataset-password-1'
+CATEGORIES = ('stretch', 'breathing', 'eye-care', 'meditation')
+DIFFICULTIES = ('beginner', 'intermediate', 'advanced')
+ADJECTIVES = ('Gentle', 'Quick', 'Deep', 'Morning', 'Evening', 'Desk', 'Standing', 'Seated', 'Mindful', 'Focused')
+SUBJECTS = {
+    'stretch': ('Neck Release', 'Shoulder Opener', 'Hip Flow', 'Back Stretch', 'Wrist Relief', 'Full Body Reset'),
+    'breathing': ('Box Breathing', 'Calm Breath', 'Energizing Breath', '4-7-8 Breathing', 'Belly Breathing'),
+    'eye-care': ('Eye Rest', 'Focus Shift', 'Palming', 'Blink Break', 'Eye Rolls'),
+    'meditation': ('Body Scan', 'Breath Awareness', 'Gratitude Pause', 'Walking Meditation', 'Quiet Minute'),
+}
+THEMES = ('light', 'dark')
+
+
+def zipf_sampler(n, s, rng):
+    """Draw ranks 0..n-1 with P(k) proportional to 1 / (k + 1) ** s."""
+    cumulative = list(accumulate(1.0 / (k ** s) for k in range(1, n + 1)))
+    total = cumulative[-1]
+
+    def draw():
+        return min(n - 1, bisect_left(cumulative, rng.random() * total))
+    return draw
+
+
+class Command(BaseCommand):
+    help = ('Generate a synthetic dataset for benchmarking: users with Profile and UserSettings, routines '
+            'spread over every category and difficulty, and favorites with a Zipfian popularity skew '
+            '(a few routines collect most of them). The same --seed always produces the same data. '
+            'Rows are written in bulk_create batches, and favorites with COPY on PostgreSQL. Generated '
+            'usernames and routine slugs start with --prefix; --clear removes an earlier run first. '
+            f"Every generated user's password is '{PASSWORD}'.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000, help='Users to create')
+        parser.add_argument('--routines', type=int, default=500, help='Routines to create')
+        parser.add_argument('--favorites', type=int, default=20000,
+                            help='Approximate number of favorites (per-user counts are random around the mean)')
+        parser.add_argument('--zipf', type=float, default=1.1,
+                            help='Zipf exponent of routine popularity (0 = uniform, larger = more skewed)')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Rows per insert')
+        parser.add_argument('--prefix', default='synth', help='Prefix of generated usernames and routine slugs')
+        parser.add_argument('--clear', action='store_true', help='Delete rows from an earlier run with this prefix')
+        parser.add_argument('--no-copy', action='store_true', help='Use bulk_create for favorites on PostgreSQL too')
+
+    def handle(self, *args, **options):
+        for name in ('users', 'routines', 'favorites', 'batch_size'):
+            if options[name] < 0 or (name == 'batch_size' and options[name] == 0):
+                raise CommandError(f"--{name.replace('_', '-')} must be positive")
+        if options['zipf'] < 0:
+            raise CommandError('--zipf must be zero or more')
+        if options['favorites'] and not (options['users'] and options['routines']):
+            raise CommandError('--favorites needs at least one user and one routine')
+        if not options['prefix'].isidentifier():
+            raise CommandError('--prefix must be letters, digits and underscores')
+
+        self.prefix = options['prefix']
+        self.batch_size = options['batch_size']
+        self.rng = random.Random(options['seed'])
+        self.now = timezone.now()
+
+        if options['clear']:
+            self._clear()
+        elif (User.objects.filter(username__istartswith=f'{self.prefix}_').exists()
+              or Routine.objects.filter(slug__istartswith=f'{self.prefix}-').exists()):
+            raise CommandError(f"Rows with prefix '{self.prefix}' already exist; pass --clear or another --prefix")
+
+        started = time.perf_counter()
+        routine_ids = self._routines(options['routines'])
+        user_ids, per_user = self._users(options['users'], options['favorites'], len(routine_ids))
+        counts = self._favorites(user_ids, per_user, routine_ids, options['zipf'], not options['no_copy'])
+        self._routine_counts(routine_ids, counts)
+        catalog.bump_version()
+        if connection.vendor == 'postgresql':
+            # Fresh planner statistics, so benchmarks see realistic plans straight away
+            with connection.cursor() as cursor:
+                for model in (User, Profile, UserSettings, Routine, RoutineStats, Favorite):
+                    cursor.execute(f'ANALYZE {connection.ops.quote_name(model._meta.db_table)}')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Done in {time.perf_counter() - started:.1f}s: {len(user_ids)} users, {len(routine_ids)} routines, '
+            f'{sum(per_user)} favorites.'))
+
+    def _progress(self, label, done, total, started):
+        elapsed = time.perf_counter() - started
+        self.stdout.write(f'{label}: {done}/{total} ({done / elapsed if elapsed else 0:.0f} rows/s)')
+
+    def _clear(self):
+        users = User.objects.filter(username__istartswith=f'{self.prefix}_')
+        routines = Routine.objects.filter(slug__istartswith=f'{self.prefix}-')
+        with transaction.atomic():
+            counts = (users.count(), routines.count())
+            # Synthetic users only favorite synthetic routines, so their favorites can go
+            # without touching counters; the deletes below fix up everyone else's
+            Favorite.objects.filter(user__in=users).delete()
+            routines.delete()
+            users.delete()
+        catalog.bump_version()
+        self.stdout.write('Cleared %d users and %d routines from an earlier run.' % counts)
+
+    def _routines(self, total):
+        """Create ``total`` routines; returns their ids in creation order."""
+        ids = []
+        started = time.perf_counter()
+        for offset in range(0, total, self.batch_size):
+            batch = []
+            for i in range(offset, min(total, offset + self.batch_size)):
+                category = self.rng.choice(CATEGORIES)
+                minutes = self.rng.choice((1, 2, 3, 4, 5, 5, 7, 10, 10, 15, 20, 30))
+                title = f'{self.rng.choice(ADJECTIVES)} {self.rng.choice(SUBJECTS[category])} {i + 1}'
+                batch.append(Routine(
+                    title=title, slug=f'{self.prefix}-{i + 1}', category=category,
+                    difficulty=self.rng.choice(DIFFICULTIES), duration_minutes=minutes,
+                    duration_text=f'{minutes} min',
+                    description=f'A {minutes}-minute {category.replace("-", " ")} routine.',
+                    instructions=' '.join(self.rng.sample(
+                        ['Sit upright.', 'Relax your shoulders.', 'Breathe in slowly.', 'Hold for a few seconds.',
+                         'Breathe out fully.', 'Repeat on the other side.', 'Close your eyes.',
+                         'Look into the distance.', 'Roll your neck gently.', 'Stretch your arms overhead.'], 4))))
+            with transaction.atomic():
+                created = Routine.objects.bulk_create(batch)
+            ids.extend(self._ids(created, Routine, 'slug'))
+            self._progress('routines', len(ids), total, started)
+        return ids
+
+    def _users(self, total, favorites, routines):
+        """Create users with their Profile and UserSettings rows.
+
+        Returns (ids, favorites per user). Per-user counts are exponentially
+        distributed around the mean, like real activity, and at most half the
+        catalog so sampling distinct routines stays cheap.
+        """
+        password = make_password(PASSWORD)  # one hash, reused: hashing would dominate the run
+        try:
+            picture = {'profile_picture': default_profile_picture_name()}
+        except Exception as e:
+            self.stdout.write(self.style.WARNING(f'Default picture unavailable, using field default: {e}'))
+            picture = {}
+        mean = favorites / total if total else 0
+        cap = max(1, routines // 2)
+        ids, per_user = [], []
+        started = time.perf_counter()
+        for offset in range(0, total, self.batch_size):
+            users, counts = [], []
+            for i in range(offset, min(total, offset + self.batch_size)):
+                username = f'{self.prefix}_user{i + 1}'
+                joined = self.now - timedelta(seconds=self.rng.randrange(365 * 86400))
+                users.append(User(
+                    username=username, email=f'{username}@example.com', password=password,
+                    date_joined=joined,
+                    last_login=joined + (self.now - joined) * self.rng.random() if self.rng.random() < 0.8 else None))
+                counts.append(min(cap, round(self.rng.expovariate(1 / mean))) if mean else 0)
+            with transaction.atomic():
+                users = User.objects.bulk_create(users)
+                batch_ids = self._ids(users, User, 'username')
+                Profile.objects.bulk_create(
+                    [Profile(user_id=uid, favorite_count=n, **picture) for uid, n in zip(batch_ids, counts)])
+                UserSettings.objects.bulk_create([
+                    UserSettings(user_id=uid, study_duration=self.rng.choice((25, 25, 30, 45, 50)),
+                                 break_duration=self.rng.choice((5, 5, 10, 15)), theme=self.rng.choice(THEMES))
+                    for uid in batch_ids])
+            ids.extend(batch_ids)
+            per_user.extend(counts)
+            self._progress('users', len(ids), total, started)
+        return ids, per_user
+
+    def _favorites(self, user_ids, per_user, routine_ids, s, use_copy):
+        """Insert each user's favorites; returns a Counter of favorites per routine id."""
+        # Popularity ranks are shuffled, so the hot routines are spread over the id range
+        ranked = list(routine_ids)
+        self.rng.shuffle(ranked)
+        draw = zipf_sampler(len(ranked), s, self.rng) if ranked else None
+        use_copy = use_copy and connection.vendor == 'postgresql'
+        counts = Counter()
+        rows = []
+        total, done = sum(per_user), 0
+        started = time.perf_counter()
+        for user_id, n in zip(user_ids, per_user):
+            chosen = set()
+            attempts = 0
+            while len(chosen) < n and attempts < 20 * n:
+                chosen.add(ranked[draw()])
+                attempts += 1
+            if len(chosen) < n:
+                # A steep skew rarely reaches the tail; top up uniformly
+                chosen.update(self.rng.sample([r for r in ranked if r not in chosen], n - len(chosen)))
+            for routine_id in sorted(chosen):
+                rows.append((user_id, routine_id))
+            counts.update(chosen)
+            if len(rows) >= self.batch_size:
+                done += self._write_favorites(rows, use_copy)
+                rows = []
+                self._progress('favorites', done, total, started)
+        if rows:
+            done += self._write_favorites(rows, use_copy)
+            self._progress('favorites', done, total, started)
+        return counts
+
+    def _write_favorites(self, rows, use_copy):
+        with transaction.atomic():
+            if use_copy:
+                buffer = io.StringIO(''.join(f'{u}\t{r}\n' for u, r in rows))
+                table = connection.ops.quote_name(Favorite._meta.db_table)
+                # created_at is left to its database default
+                with connection.cursor() as cursor:
+                    cursor.copy_expert(f'COPY {table} (user_id, routine_id) FROM STDIN', buffer)
+            else:
+                Favorite.objects.bulk_create([Favorite(user_id=u, routine_id=r) for u, r in rows])
+        return len(rows)
+
+    def _routine_counts(self, routine_ids, counts):
+        stats = [RoutineStats(routine_id=rid, favorite_count=counts[rid]) for rid in routine_ids if counts[rid]]
+        with transaction.atomic():
+            RoutineStats.objects.bulk_create(stats, batch_size=1000)
+
+    @staticmethod
+    def _ids(objs, model, key):
+        if objs and objs[0].pk is None:
+            # Backends that cannot return ids from a bulk insert
+            ids = dict(model.objects.filter(**{f'{key}__in': [getattr(o, key) for o in objs]})
+                       .values_list(key, 'pk'))
+            return [ids[getattr(o, key)] for o in objs]
+        return [o.pk for o in objs]
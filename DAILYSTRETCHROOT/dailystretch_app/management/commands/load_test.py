@@ -0,0 +1,110 @@
+import json
+import os
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from dailystretch_app import loadtest
+
+
+class Command(BaseCommand):
+    help = ('Replay scripted user journeys (register, login, /main/, every segment tab, favorite toggles, '
+            'settings save, logout) against a running server, or one started with --start, and report '
+            'throughput, latency percentiles and error rates per endpoint. Results are written as JSON '
+            'tagged with the current commit; pass an earlier file to --compare to see the change.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--base-url', default='http://127.0.0.1:8000',
+                            help='Server to test (ignored with --start)')
+        parser.add_argument('--start', choices=sorted(loadtest.SERVER_COMMANDS),
+                            help='Start gunicorn locally in this mode for the run')
+        parser.add_argument('--port', type=int, default=8765, help='Port for --start')
+        parser.add_argument('--workers', type=int, default=2, help='gunicorn worker processes for --start')
+        parser.add_argument('--threads', type=int, default=1, help='Threads per sync worker for --start')
+        parser.add_argument('--users', type=int, default=8, help='Concurrent virtual users')
+        parser.add_argument('--iterations', type=int, default=3, help='Journeys per virtual user')
+        parser.add_argument('--duration', type=float,
+                            help='Run for this many seconds instead of a fixed number of iterations')
+        parser.add_argument('--seed', type=int, default=0, help='Seed for the virtual users\' random choices')
+        parser.add_argument('--think-ms', type=float, default=0,
+                            help='Mean pause between a user\'s requests (0 = closed-loop, maximum load)')
+        parser.add_argument('--favorites', type=int, default=3, help='Favorite toggles per journey')
+        parser.add_argument('--output', help='Result file (default: loadtest-results/<time>-<commit>.json)')
+        parser.add_argument('--compare', help='Earlier result file to compare against')
+        parser.add_argument('--cleanup', action='store_true',
+                            help=f'Delete the {loadtest.USERNAME_PREFIX}* users afterwards (same database only)')
+
+    def handle(self, *args, **options):
+        if options['users'] < 1 or options['iterations'] < 1:
+            raise CommandError('--users and --iterations must be >= 1')
+        previous = None
+        if options['compare']:
+            with open(options['compare']) as f:
+                previous = json.load(f)
+
+        base_url = options['base_url']
+        proc = None
+        if options['start']:
+            proc = loadtest.start_server(options['start'], options['port'], options['workers'], options['threads'])
+            base_url = f'http://127.0.0.1:{options["port"]}'
+            if not loadtest.wait_ready(options['port'], proc):
+                loadtest.stop_server(proc)
+                raise CommandError('Server did not become ready')
+        try:
+            summary, endpoints, failures = loadtest.run(
+                base_url, users=options['users'], iterations=options['iterations'],
+                duration=options['duration'], seed=options['seed'], think=options['think_ms'] / 1000,
+                favorites=options['favorites'])
+        finally:
+            if proc is not None:
+                loadtest.stop_server(proc)
+            if options['cleanup']:
+                deleted, _ = User.objects.filter(username__startswith=loadtest.USERNAME_PREFIX).delete()
+                self.stdout.write(f'Deleted {deleted} rows of load-test users.')
+
+        env = loadtest.environment()
+        result = {
+            'created_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            'environment': env,
+            'options': {k: options[k] for k in ('users', 'iterations', 'duration', 'seed', 'think_ms',
+                                                'favorites', 'start', 'workers', 'threads')},
+            'base_url': base_url,
+            'summary': summary,
+            'endpoints': endpoints,
+            'failures': failures,
+        }
+        self._report(result)
+        if previous is not None:
+            result['compared_to'] = {'commit': previous.get('environment', {}).get('commit'),
+                                     'endpoints': loadtest.compare(result, previous)}
+            self._report_comparison(result['compared_to'])
+
+        path = options['output'] or os.path.join(
+            settings.BASE_DIR, 'loadtest-results',
+            f"{time.strftime('%Y%m%dT%H%M%SZ', time.gmtime())}-{(env['commit'] or 'unknown')[:8]}.json")
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump(result, f, indent=2)
+        self.stdout.write(self.style.SUCCESS(f'Wrote {path}'))
+
+    def _report(self, result):
+        s = result['summary']
+        self.stdout.write(f"{s['journeys']} journeys ({s['failed_journeys']} failed), {s['requests']} requests "
+                          f"in {s['seconds']} s: {s['rps']} req/s, {s['journeys_per_second']} journeys/s, "
+                          f"p50 {s['p50_ms']} ms  p95 {s['p95_ms']} ms  p99 {s['p99_ms']} ms, "
+                          f"errors {s['errors']} ({s['error_rate']:.2%})")
+        self.stdout.write(f"{'endpoint':<22}{'reqs':>7}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'errors':>8}")
+        for label, e in result['endpoints'].items():
+            self.stdout.write(f"{label:<22}{e['requests']:>7}{e['rps']:>9}{e['p50_ms']:>9}{e['p95_ms']:>9}"
+                              f"{e['p99_ms']:>9}{e['errors']:>8}")
+        for failure in result['failures']:
+            self.stderr.write(f'  {failure}')
+
+    def _report_comparison(self, compared):
+        self.stdout.write(f"Compared to {compared['commit'] or 'unknown commit'} (p95, + is slower):")
+        for row in compared['endpoints']:
+            change = row.get('p95_ms_change')
+            delta = f'{change:+.1%}' if change is not None else 'n/a'
+            self.stdout.write(f"  {row['endpoint']:<22}{row['p95_ms_before']:>9} -> {row['p95_ms']:<9}{delta}")
@@ -0,0 +1,42 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from dailystretch_app.avatars import AvatarWorker, enqueue_avatar_job
+from dailystretch_app.models import Profile
+
+
+class Command(BaseCommand):
+    help = 'Resize uploaded profile pictures into WebP/JPEG variants (runs continuously unless --once is given).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Process queued jobs until none are due, then exit')
+        parser.add_argument('--batch-size', type=int, default=20)
+        parser.add_argument('--interval', type=float, default=2.0, help='Seconds to sleep when the queue is empty')
+        parser.add_argument('--backfill', action='store_true',
+                            help='First queue every profile whose picture has no variants yet')
+
+    def handle(self, *args, **options):
+        if options['backfill']:
+            queued = 0
+            for profile in Profile.objects.exclude(profile_picture='').exclude(profile_picture__isnull=True).iterator():
+                if not profile.avatar_ready:
+                    enqueue_avatar_job(profile)
+                    queued += 1
+            self.stdout.write(self.style.SUCCESS(f'Queued {queued} profiles'))
+
+        worker = AvatarWorker(batch_size=options['batch_size'],
+                              log=lambda msg: self.stdout.write(self.style.WARNING(msg)))
+        totals = [0, 0, 0]
+        while True:
+            processed, skipped, failed = worker.run_once()
+            totals = [totals[0] + processed, totals[1] + skipped, totals[2] + failed]
+            idle = not (processed or skipped or failed)
+            if not idle:
+                self.stdout.write(f'Batch: processed {processed}, skipped {skipped}, failed {failed}')
+            if idle and options['once']:
+                break
+            if idle:
+                time.sleep(options['interval'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Done. Processed: {totals[0]}, Skipped: {totals[1]}, Failed: {totals[2]}'))
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from dailystretch_app import profiling
+
+
+class Command(BaseCommand):
+    help = ('Print a signed token for the X-DS-Profile request header. Requests carrying it are profiled '
+            'and show up in the admin panel\'s Profiles tab, whoever is logged in.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--mode', choices=profiling.MODES, default='sample',
+                            help='sample: low-overhead stack sampling (flamegraph); cprofile: exact call timings')
+        parser.add_argument('--max-age', type=int, default=3600, help='Seconds the token stays valid')
+
+    def handle(self, *args, **options):
+        if options['max_age'] < 1:
+            raise CommandError('--max-age must be >= 1')
+        token = profiling.make_token(options['mode'], options['max_age'])
+        self.stdout.write(f'{profiling.HEADER}: {token}')
@@ -0,0 +1,242 @@
+import csv
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+from django.contrib.auth.hashers import identify_hasher, make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models.signals import post_save
+
+from dailystretch_app.backends import taken_identifiers
+from dailystretch_app.models import Profile, UserSettings
+from dailystretch_app.storage import default_profile_picture_name
+
+USER_FIELDS = ('username', 'email', 'first_name', 'last_name')
+SETTINGS_FIELDS = {'study_duration': int, 'break_duration': int, 'theme': str}
+# Same bounds as the settings form; out-of-range values would also trip the
+# columns' CHECK constraints and abort the whole batch
+SETTINGS_RANGES = {'study_duration': (1, 180), 'break_duration': (1, 60)}
+THEMES = ('light', 'dark')
+
+
+def _init_worker(settings_module):
+    # Spawned (non-fork) workers start without Django configured
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', settings_module)
+    import django
+    django.setup()
+
+
+def _hash(password):
+    return make_password(password)
+
+
+def read_rows(stream, fmt):
+    """Yield one dict per input user without loading the whole file."""
+    if fmt == 'csv':
+        for row in csv.DictReader(stream):
+            yield {k.strip(): (v or '').strip() for k, v in row.items() if k}
+        return
+    for lineno, line in enumerate(stream, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            raise CommandError(f'Line {lineno}: invalid JSON ({e})')
+        if not isinstance(row, dict):
+            raise CommandError(f'Line {lineno}: expected a JSON object')
+        yield row
+
+
+class Command(BaseCommand):
+    help = ('Create users from a CSV or NDJSON file (one object per line) in bulk. Each batch of '
+            'User, Profile and UserSettings rows is inserted with bulk_create inside one transaction; '
+            'passwords are hashed in a process pool. Recognised columns: username (required), email, '
+            'first_name, last_name, password, study_duration, break_duration, theme. '
+            'Rows whose username or email is already taken, ignoring case, are skipped; rows with a '
+            'missing username, a non-text password or an out-of-range setting are counted as invalid.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Input file, or '-' for stdin")
+        parser.add_argument('--format', choices=['csv', 'ndjson'],
+                            help='Input format (default: from the file extension, csv for stdin)')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Users per transaction')
+        parser.add_argument('--hash-workers', type=int, default=os.cpu_count() or 1,
+                            help='Processes used for password hashing (0 hashes in this process)')
+        parser.add_argument('--prehashed', action='store_true',
+                            help='Store passwords that are already Django password hashes as-is')
+        parser.add_argument('--send-signals', action='store_true',
+                            help='Send post_save for each created user and let the receivers create Profile and '
+                                 'UserSettings (slow; only needed if other receivers must run)')
+
+    def handle(self, *args, **options):
+        fmt = options['format'] or ('ndjson' if options['path'].endswith(('.ndjson', '.jsonl')) else 'csv')
+        self.prehashed = options['prehashed']
+        self.send_signals = options['send_signals']
+        self.picture = None
+        if not self.send_signals:
+            try:
+                self.picture = default_profile_picture_name()
+            except Exception as e:
+                self.stdout.write(self.style.WARNING(f'Default picture unavailable, using field default: {e}'))
+
+        pool = None
+        if options['hash_workers'] > 0:
+            pool = ProcessPoolExecutor(max_workers=options['hash_workers'], initializer=_init_worker,
+                                       initargs=(os.environ.get('DJANGO_SETTINGS_MODULE', 'dailystretch.settings'),))
+        self.pool = pool
+        self.hash_workers = options['hash_workers']
+
+        if options['path'] == '-':
+            stream = sys.stdin
+        else:
+            try:
+                stream = open(options['path'], newline='', encoding='utf-8-sig')
+            except OSError as e:
+                raise CommandError(str(e))
+
+        totals = {'created': 0, 'skipped': 0, 'invalid': 0}
+        started = time.perf_counter()
+        try:
+            rows = read_rows(stream, fmt)
+            while True:
+                batch = list(islice(rows, options['batch_size']))
+                if not batch:
+                    break
+                created, skipped, invalid = self._provision(batch)
+                totals['created'] += created
+                totals['skipped'] += skipped
+                totals['invalid'] += invalid
+                elapsed = time.perf_counter() - started
+                seen = sum(totals.values())
+                self.stdout.write(f"{seen} rows, {totals['created']} created "
+                                  f"({seen / elapsed if elapsed else 0:.0f} rows/s)")
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+            if pool:
+                pool.shutdown()
+
+        elapsed = time.perf_counter() - started
+        seen = sum(totals.values())
+        self.stdout.write(self.style.SUCCESS(
+            f"Done in {elapsed:.1f}s: {totals['created']} created, {totals['skipped']} existing or duplicate, "
+            f"{totals['invalid']} invalid ({seen / elapsed if elapsed else 0:.0f} rows/s)."))
+
+    def _provision(self, batch):
+        """Insert one batch. Returns (created, skipped, invalid)."""
+        invalid = 0
+        by_username = {}
+        for row in batch:
+            username = str(row.get('username') or '').strip()
+            if not username or len(username) > 150:
+                invalid += 1
+                continue
+            # NDJSON can carry any JSON type; make_password only takes text
+            if row.get('password') is not None and not isinstance(row['password'], str):
+                invalid += 1
+                continue
+            try:
+                self._settings(row)
+            except ValueError:
+                invalid += 1
+                continue
+            # Last occurrence wins within a batch; usernames and emails are unique ignoring case
+            by_username[username.lower()] = row
+
+        emails = [str(row.get('email') or '').strip() for row in by_username.values()]
+        taken_usernames, taken_emails = taken_identifiers(by_username, emails)
+        rows = []
+        for username, row in by_username.items():
+            email = str(row.get('email') or '').strip().lower()
+            if username in taken_usernames or (email and email in taken_emails):
+                continue
+            if email:
+                taken_emails.add(email)
+            rows.append(row)
+        skipped = len(batch) - invalid - len(rows)
+        if not rows:
+            return 0, skipped, invalid
+
+        passwords = self._passwords([row.get('password') or None for row in rows])
+        users = [User(password=password, **{f: str(row.get(f) or '').strip() for f in USER_FIELDS})
+                 for row, password in zip(rows, passwords)]
+
+        with transaction.atomic():
+            users = User.objects.bulk_create(users)
+            if users and users[0].pk is None:
+                # Backends that cannot return ids from a bulk insert
+                ids = dict(User.objects.filter(username__in=[u.username for u in users])
+                           .values_list('username', 'pk'))
+                for user in users:
+                    user.pk = ids[user.username]
+
+            if self.send_signals:
+                for user in users:
+                    post_save.send(sender=User, instance=user, created=True, update_fields=None,
+                                   raw=False, using=user._state.db)
+                for user, row in zip(users, rows):
+                    values = self._settings(row)
+                    if values:
+                        UserSettings.objects.filter(user=user).update(**values)
+                return len(users), skipped, invalid
+
+            profile_extra = {'profile_picture': self.picture} if self.picture else {}
+            Profile.objects.bulk_create([Profile(user=user, **profile_extra) for user in users])
+            UserSettings.objects.bulk_create([UserSettings(user=user, **self._settings(row))
+                                              for user, row in zip(users, rows)])
+        return len(users), skipped, invalid
+
+    def _passwords(self, raw):
+        encoded = [None] * len(raw)
+        todo = []
+        for i, password in enumerate(raw):
+            if password is None:
+                encoded[i] = make_password(None)  # unusable; no hashing cost
+            elif self.prehashed and self._is_hash(password):
+                encoded[i] = password
+            else:
+                todo.append(i)
+        if todo:
+            plain = [raw[i] for i in todo]
+            if self.pool:
+                chunk = max(1, len(plain) // (self.hash_workers * 4))
+                hashed = self.pool.map(_hash, plain, chunksize=chunk)
+            else:
+                hashed = map(_hash, plain)
+            for i, value in zip(todo, hashed):
+                encoded[i] = value
+        return encoded
+
+    @staticmethod
+    def _is_hash(value):
+        try:
+            identify_hasher(value)
+        except ValueError:
+            return False
+        return True
+
+    @staticmethod
+    def _settings(row):
+        """UserSettings values given in ``row``; raises ValueError if one is unusable."""
+        values = {}
+        for field, cast in SETTINGS_FIELDS.items():
+            value = row.get(field)
+            if value in (None, ''):
+                continue
+            try:
+                values[field] = cast(value)
+            except (TypeError, ValueError):
+                raise ValueError(f'{field}: {value!r}')
+            low, high = SETTINGS_RANGES.get(field, (None, None))
+            if low is not None and not low <= values[field] <= high:
+                raise ValueError(f'{field}: {value!r} is outside {low}-{high}')
+        if values.get('theme') not in (None, *THEMES):
+            raise ValueError(f"theme: {values['theme']!r}")
+        return values
@@ -0,0 +1,78 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from dailystretch_app.models import Favorite, Profile, Routine, RoutineStats
+
+# (model, column on the model that Favorite points at, Favorite column)
+TARGETS = {
+    'routines': (RoutineStats, 'routine_id', 'routine_id'),
+    'profiles': (Profile, 'user_id', 'user_id'),
+}
+
+
+class Command(BaseCommand):
+    help = ('Recount RoutineStats.favorite_count and Profile.favorite_count from Favorite rows in chunks and '
+            'fix any that drifted. Safe to run while the site is live.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--only', choices=sorted(TARGETS), help='Reconcile just one side')
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Rows checked per query')
+        parser.add_argument('--dry-run', action='store_true', help='Report drift without fixing it')
+
+    def handle(self, *args, **options):
+        self.verbosity = options['verbosity']
+        names = [options['only']] if options['only'] else sorted(TARGETS)
+        for name in names:
+            missing = 0
+            if name == 'routines':
+                missing = self._create_missing_stats(options['chunk_size'], options['dry_run'])
+            checked, drifted = self._reconcile(*TARGETS[name], options['chunk_size'], options['dry_run'])
+            # With --dry-run the missing rows were not created, so their drift is not in the recount
+            drifted += missing if options['dry_run'] else 0
+            verb = 'would fix' if options['dry_run'] else 'fixed'
+            self.stdout.write(self.style.SUCCESS(f'{name}: checked {checked}, {verb} {drifted}'))
+
+    def _create_missing_stats(self, chunk_size, dry_run):
+        """Give favorited routines without a RoutineStats row one; returns how many lacked it."""
+        missing = Routine.objects.filter(stats__isnull=True, favorite__isnull=False).distinct()
+        if dry_run:
+            return missing.count()
+        created = 0
+        while True:
+            ids = list(missing.order_by('id').values_list('id', flat=True)[:chunk_size])
+            if not ids:
+                return created
+            # A zero row is enough: the recount that follows fills it in
+            RoutineStats.objects.bulk_create([RoutineStats(routine_id=rid) for rid in ids], ignore_conflicts=True)
+            created += len(ids)
+
+    def _reconcile(self, model, key, fav_key, chunk_size, dry_run):
+        # The fix is a correlated-subquery UPDATE, so favorites committed while it
+        # runs are counted by it or by their own F() increment, never both
+        actual_count = Coalesce(Subquery(
+            Favorite.objects.filter(**{fav_key: OuterRef(key)}).order_by()
+            .values(fav_key).annotate(n=Count('*')).values('n')), 0)
+        checked = drifted = 0
+        last_pk = 0
+        while True:
+            rows = list(model.objects.filter(pk__gt=last_pk).order_by('pk')
+                        .values_list('pk', key, 'favorite_count')[:chunk_size])
+            if not rows:
+                break
+            last_pk = rows[-1][0]
+            checked += len(rows)
+            counts = dict(Favorite.objects.filter(**{f'{fav_key}__in': [r[1] for r in rows]}).order_by()
+                          .values(fav_key).annotate(n=Count('*')).values_list(fav_key, 'n'))
+            stale = [pk for pk, value, stored in rows if stored != counts.get(value, 0)]
+            if not stale:
+                continue
+            drifted += len(stale)
+            if self.verbosity >= 2:
+                self.stdout.write(f'{model.__name__} drift: {stale}')
+            if not dry_run:
+                with transaction.atomic():
+                    model.objects.filter(pk__in=stale).update(favorite_count=actual_count)
+        return checked, drifted
+
@@ -1,6 +1,19 @@
-from django.core.management.base import BaseCommand
+import csv
+import json
+import sys
+from itertools import islice
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils.text import slugify
+
+from dailystretch_app import catalog
 from dailystretch_app.models import Routine
 
+# Upserted columns; `slug` is the natural key and is derived from the title when absent
+FIELDS = ('title', 'description', 'category', 'difficulty', 'duration_text', 'duration_minutes', 'instructions')
+READ_SIZE = 64 * 1024
+
 ROUTINES = [
     {
         'title': 'Desk Stretches',
@@ -113,27 +126,191 @@ ROUTINES = [
 ]
 
 
+
+def iter_json_array(stream):
+    """Yield the objects of a top-level JSON array one at a time, reading in chunks."""
+    decoder = json.JSONDecoder()
+    buf = stream.read(READ_SIZE)
+    pos = 0
+    started = False
+    while True:
+        # Skip whitespace and separators
+        while True:
+            while pos < len(buf) and buf[pos] in ' \t\r\n,':
+                pos += 1
+            if pos < len(buf):
+                break
+            buf, pos = stream.read(READ_SIZE), 0
+            if not buf:
+                if started:
+                    raise CommandError('Unexpected end of JSON array')
+                return
+        if not started:
+            if buf[pos] != '[':
+                raise CommandError('Expected a JSON array of routines')
+            started = True
+            pos += 1
+            continue
+        if buf[pos] == ']':
+            return
+        while True:
+            try:
+                obj, end = decoder.raw_decode(buf, pos)
+            except ValueError:
+                more = stream.read(READ_SIZE)
+                if not more:
+                    raise CommandError('Invalid JSON in catalog file')
+                buf, pos = buf[pos:] + more, 0
+                continue
+            if end == len(buf):
+                # A number or literal could continue in the next chunk
+                more = stream.read(READ_SIZE)
+                if more:
+                    buf, pos = buf[pos:] + more, 0
+                    continue
+            break
+        yield obj
+        buf, pos = buf[end:], 0
+
+
+def iter_ndjson(stream):
+    for lineno, line in enumerate(stream, 1):
+        line = line.strip()
+        if line:
+            try:
+                yield json.loads(line)
+            except ValueError as e:
+                raise CommandError(f'Line {lineno}: invalid JSON ({e})')
+
+
+def read_catalog(stream, fmt):
+    if fmt == 'csv':
+        return csv.DictReader(stream)
+    if fmt == 'ndjson':
+        return iter_ndjson(stream)
+    return iter_json_array(stream)
+
+
+def normalize(row):
+    """Map an input record onto Routine columns; returns None if it has no usable key."""
+    if not isinstance(row, dict):
+        return None
+    values = {f: (str(row.get(f) or '').strip()) for f in FIELDS if f != 'duration_minutes'}
+    duration = row.get('duration_minutes')
+    try:
+        values['duration_minutes'] = int(duration) if duration not in (None, '') else None
+    except (TypeError, ValueError):
+        values['duration_minutes'] = None
+    if not values['duration_text'] and values['duration_minutes'] is not None:
+        values['duration_text'] = f"{values['duration_minutes']} min"
+    values['slug'] = slugify(str(row.get('slug') or '').strip() or values['title'])[:200]
+    if not values['title'] or not values['slug']:
+        return None
+    return values
+
+
 class Command(BaseCommand):
-    help = 'Seed default routines into the database (idempotent)'
+    help = ('Upsert routines from a JSON array, NDJSON or CSV catalog file (or the built-in default set) '
+            'in batches, keyed on slug. Unchanged routines are not rewritten.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', help="Catalog file, or '-' for stdin; omit to seed the built-in routines")
+        parser.add_argument('--format', choices=['json', 'ndjson', 'csv'],
+                            help='Input format (default: from the file extension, json for stdin)')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Routines per upsert')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Only report what would be created, updated and pruned (-v 2 lists each change)')
+        parser.add_argument('--prune', action='store_true',
+                            help='Delete routines whose slug is not in the source (and their favorites)')
 
     def handle(self, *args, **options):
-        created = 0
-        updated = 0
-        for r in ROUTINES:
-            obj, was_created = Routine.objects.update_or_create(
-                title=r['title'],
-                defaults={
-                    'description': r.get('description', ''),
-                    'category': r.get('category', ''),
-                    'difficulty': r.get('difficulty', ''),
-                    'duration_text': r.get('duration_text', ''),
-                    'duration_minutes': r.get('duration_minutes'),
-                    'instructions': r.get('instructions', '')
-                }
-            )
-            if was_created:
-                created += 1
+        self.dry_run = options['dry_run']
+        self.verbosity = options['verbosity']
+        path = options['path']
+        stream = None
+        if path is None:
+            records = iter(ROUTINES)
+        else:
+            fmt = options['format'] or {'.csv': 'csv', '.ndjson': 'ndjson', '.jsonl': 'ndjson'}.get(
+                path[path.rfind('.'):].lower(), 'json')
+            if path == '-':
+                stream = sys.stdin
             else:
-                updated += 1
+                try:
+                    stream = open(path, newline='', encoding='utf-8-sig')
+                except OSError as e:
+                    raise CommandError(str(e))
+            records = read_catalog(stream, fmt)
+
+        stats = {'created': 0, 'updated': 0, 'unchanged': 0, 'invalid': 0, 'pruned': 0}
+        seen = set()
+        try:
+            while True:
+                batch = list(islice(records, options['batch_size']))
+                if not batch:
+                    break
+                self._upsert(batch, seen, stats)
+        finally:
+            if stream is not None and stream is not sys.stdin:
+                stream.close()
+
+        if options['prune']:
+            stats['pruned'] = self._prune(seen, options['batch_size'])
+
+        if not self.dry_run and (stats['created'] or stats['updated'] or stats['pruned']):
+            # bulk_create/delete by id bypass the post_save receiver; invalidate explicitly
+            catalog.bump_version_on_commit()
+
+        prefix = 'Dry run' if self.dry_run else 'Seed complete'
         self.stdout.write(self.style.SUCCESS(
-            f'Seed complete. Created: {created}, Updated: {updated}'))
+            f"{prefix}. Created: {stats['created']}, Updated: {stats['updated']}, "
+            f"Unchanged: {stats['unchanged']}, Pruned: {stats['pruned']}, Invalid: {stats['invalid']}"))
+
+    def _upsert(self, batch, seen, stats):
+        rows = {}
+        for record in batch:
+            values = normalize(record)
+            if values is None:
+                stats['invalid'] += 1
+                continue
+            # Last occurrence of a slug wins
+            rows[values['slug']] = values
+        seen.update(rows)
+
+        existing = {r['slug']: r for r in Routine.objects.filter(slug__in=list(rows)).values('slug', *FIELDS)}
+        changed = []
+        for slug, values in rows.items():
+            current = existing.get(slug)
+            if current is None:
+                stats['created'] += 1
+                self._log(f'+ {slug}')
+            else:
+                # Nullable text columns may hold NULL where the source has ''
+                diff = [f for f in FIELDS if current[f] != values[f]
+                        and not (f != 'duration_minutes' and not current[f] and not values[f])]
+                if not diff:
+                    stats['unchanged'] += 1
+                    continue
+                stats['updated'] += 1
+                self._log(f"~ {slug}: {', '.join(diff)}")
+            changed.append(Routine(**values))
+
+        if changed and not self.dry_run:
+            with transaction.atomic():
+                Routine.objects.bulk_create(changed, update_conflicts=True, unique_fields=['slug'],
+                                            update_fields=list(FIELDS))
+
+    def _prune(self, seen, batch_size):
+        stale = [(pk, slug) for pk, slug in Routine.objects.values_list('pk', 'slug').iterator(chunk_size=2000)
+                 if slug not in seen]
+        for _, slug in stale:
+            self._log(f'- {slug}')
+        if not self.dry_run:
+            for i in range(0, len(stale), batch_size):
+                with transaction.atomic():
+                    Routine.objects.filter(pk__in=[pk for pk, _ in stale[i:i + batch_size]]).delete()
+        return len(stale)
+
+    def _log(self, message):
+        if self.verbosity >= 2:
+            self.stdout.write(message)
@@ -0,0 +1,54 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from dailystretch_app.supabase_sync import CircuitBreaker, OutboxWorker
+
+
+class Command(BaseCommand):
+    help = 'Drain the Supabase profile sync outbox (runs continuously unless --once is given).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Process due rows until none are left, then exit')
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument('--interval', type=float, default=2.0, help='Seconds to sleep when the outbox is empty')
+        parser.add_argument('--timeout', type=float, default=5.0, help='HTTP timeout per request')
+        parser.add_argument('--breaker-threshold', type=int, default=5, help='Consecutive failures that open the circuit')
+        parser.add_argument('--breaker-cooldown', type=float, default=30.0, help='Seconds the circuit stays open')
+        parser.add_argument('--supabase-url', default=None, help='Override settings.SUPABASE_URL (e.g. a local stub server)')
+        parser.add_argument('--anon-key', default=None, help='Override settings.SUPABASE_ANON_KEY')
+
+    def handle(self, *args, **options):
+        try:
+            import requests
+        except ImportError:
+            raise CommandError('The requests library is required for the Supabase sync worker.')
+
+        base_url = options['supabase_url'] or getattr(settings, 'SUPABASE_URL', '')
+        anon_key = options['anon_key'] or getattr(settings, 'SUPABASE_ANON_KEY', '')
+        if not base_url or not anon_key:
+            raise CommandError('SUPABASE_URL and SUPABASE_ANON_KEY must be configured.')
+
+        worker = OutboxWorker(
+            requests.Session(), base_url, anon_key,
+            batch_size=options['batch_size'],
+            timeout=options['timeout'],
+            breaker=CircuitBreaker(options['breaker_threshold'], options['breaker_cooldown']),
+            log=lambda msg: self.stdout.write(self.style.WARNING(msg)),
+        )
+        totals = [0, 0, 0]
+        while True:
+            sent, failed, deferred = worker.drain_once()
+            totals = [totals[0] + sent, totals[1] + failed, totals[2] + deferred]
+            if sent or failed or deferred:
+                self.stdout.write(f'Batch: sent {sent}, failed {failed}, deferred {deferred}')
+            idle = not (sent or failed or deferred)
+            if options['once'] and (idle or worker.breaker.is_open):
+                break
+            if idle:
+                time.sleep(options['interval'])
+            elif worker.breaker.is_open:
+                time.sleep(min(worker.breaker.retry_after(), options['interval'] * 5))
+        self.stdout.write(self.style.SUCCESS(
+            f'Done. Sent: {totals[0]}, Failed: {totals[1]}, Deferred: {totals[2]}'))
@@ -0,0 +1,34 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+
+from dailystretch_app import rollups
+
+
+class Command(BaseCommand):
+    help = ('Fold signups, active users, favorites and settings added since the last run into the daily '
+            'rollup tables read by the admin analytics charts. Run it from cron every few minutes; each '
+            'run only reads rows past the stored high-water marks.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--only', choices=rollups.SECTIONS, action='append',
+                            help='Update just this section (repeatable)')
+        parser.add_argument('--lag', type=int, default=int(rollups.DEFAULT_LAG.total_seconds()),
+                            help='Leave rows newer than this many seconds for the next run')
+        parser.add_argument('--chunk-size', type=int, default=rollups.CHUNK_SIZE,
+                            help='Ids folded per transaction')
+        parser.add_argument('--rebuild', action='store_true',
+                            help='Drop all rollups and marks first and recount everything. Favorites saved '
+                                 'before the rollups existed are then counted on the day of that migration.')
+
+    def handle(self, *args, **options):
+        if options['lag'] < 0 or options['chunk_size'] < 1:
+            raise CommandError('--lag must be >= 0 and --chunk-size >= 1')
+        if options['rebuild']:
+            rollups.rebuild()
+            self.stdout.write('Dropped existing rollups.')
+        results = rollups.update_all(lag=timedelta(seconds=options['lag']),
+                                     sections=options['only'] or rollups.SECTIONS,
+                                     chunk_size=options['chunk_size'])
+        for name, count in results.items():
+            self.stdout.write(self.style.SUCCESS(f'{name}: {count}'))
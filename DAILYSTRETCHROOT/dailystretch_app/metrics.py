@@ -0,0 +1,319 @@
+"""Per-view request metrics in Prometheus text format.
+
+``MetricsMiddleware`` times every routed request, counts its SQL queries and
+their time with a connection ``execute_wrapper``, adds a ``Server-Timing``
+header and folds the numbers into this process's in-memory registry: a dict
+update under a lock, cheap enough to leave on in production.
+
+Gunicorn runs several worker processes, so each one periodically writes its
+registry to ``<METRICS_DIR>/<pid>.json`` (atomically, at most every
+``FLUSH_INTERVAL`` seconds, and at exit). ``/metrics`` sums every worker's file.
+Files of workers that have exited are folded into ``archive.json``, so
+counters keep growing across worker restarts instead of going backwards.
+"""
+import atexit
+import contextvars
+import fcntl
+import json
+import os
+import tempfile
+import threading
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connection
+
+# Seconds; tuned for this app's views (most well under 100 ms)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+FLUSH_INTERVAL = 1.0
+ARCHIVE = 'archive.json'
+
+# Cache lookups made while handling the current request, for Server-Timing
+_request_cache_events = contextvars.ContextVar('ds_request_cache_events', default=None)
+
+
+def metrics_dir():
+    return getattr(settings, 'METRICS_DIR', None) or os.path.join(tempfile.gettempdir(), 'dailystretch-metrics')
+
+
+class Registry:
+    """Counters and histograms for one process, keyed by label tuples."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.views = {}    # (view, method, status) -> [count, latency_sum, queries, query_seconds, lat_buckets, q_buckets]
+        self.caches = {}   # (cache, result) -> count
+        self._dirty = False
+        self._last_flush = 0.0
+
+    def observe(self, view, method, status, seconds, queries, query_seconds):
+        key = (view, method, status)
+        with self._lock:
+            entry = self.views.get(key)
+            if entry is None:
+                entry = self.views[key] = [0, 0.0, 0, 0.0, [0] * len(LATENCY_BUCKETS), [0] * len(QUERY_BUCKETS)]
+            entry[0] += 1
+            entry[1] += seconds
+            entry[2] += queries
+            entry[3] += query_seconds
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                if seconds <= bound:
+                    entry[4][i] += 1
+                    break
+            for i, bound in enumerate(QUERY_BUCKETS):
+                if queries <= bound:
+                    entry[5][i] += 1
+                    break
+            self._dirty = True
+
+    def count_cache(self, cache, result):
+        key = (cache, result)
+        with self._lock:
+            self.caches[key] = self.caches.get(key, 0) + 1
+            self._dirty = True
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'views': [[list(k), v[0], v[1], v[2], v[3], list(v[4]), list(v[5])] for k, v in self.views.items()],
+                'caches': [[list(k), n] for k, n in self.caches.items()],
+            }
+
+    def maybe_flush(self):
+        now = time.monotonic()
+        if self._dirty and now - self._last_flush >= FLUSH_INTERVAL:
+            self.flush()
+
+    def flush(self):
+        self._last_flush = time.monotonic()
+        self._dirty = False
+        try:
+            directory = metrics_dir()
+            os.makedirs(directory, exist_ok=True)
+            _write_json(os.path.join(directory, f'{os.getpid()}.json'), self.snapshot())
+        except OSError:
+            pass
+
+
+def _write_json(path, data):
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+    with os.fdopen(fd, 'w') as f:
+        json.dump(data, f, separators=(',', ':'))
+    os.replace(tmp, path)
+
+
+registry = Registry()
+atexit.register(registry.flush)
+
+
+def record_cache(cache, result):
+    """Count a cache lookup (result: 'hit', 'miss' or 'not_modified')."""
+    registry.count_cache(cache, result)
+    events = _request_cache_events.get()
+    if events is not None:
+        events.append(f'{cache}-{result}')
+
+
+# ------------------------------
+# Aggregation across workers
+# ------------------------------
+def _merge(total, data):
+    for labels, count, lat_sum, queries, q_seconds, lat_buckets, q_buckets in data.get('views', []):
+        key = tuple(labels)
+        entry = total['views'].get(key)
+        if entry is None:
+            entry = total['views'][key] = [0, 0.0, 0, 0.0, [0] * len(LATENCY_BUCKETS), [0] * len(QUERY_BUCKETS)]
+        entry[0] += count
+        entry[1] += lat_sum
+        entry[2] += queries
+        entry[3] += q_seconds
+        entry[4] = [a + b for a, b in zip(entry[4], lat_buckets)]
+        entry[5] = [a + b for a, b in zip(entry[5], q_buckets)]
+    for labels, count in data.get('caches', []):
+        key = tuple(labels)
+        total['caches'][key] = total['caches'].get(key, 0) + count
+
+
+def _to_json(total):
+    return {
+        'views': [[list(k), *v[:4], v[4], v[5]] for k, v in total['views'].items()],
+        'caches': [[list(k), n] for k, n in total['caches'].items()],
+    }
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _read(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def collect():
+    """Sum the registries of all live and exited workers."""
+    registry.flush()
+    directory = metrics_dir()
+    os.makedirs(directory, exist_ok=True)
+    total = {'views': {}, 'caches': {}}
+    with open(os.path.join(directory, '.lock'), 'a') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            archive_path = os.path.join(directory, ARCHIVE)
+            archive = {'views': {}, 'caches': {}}
+            _merge(archive, _read(archive_path) or {})
+            archived = False
+            for name in os.listdir(directory):
+                stem, ext = os.path.splitext(name)
+                if ext != '.json' or not stem.isdigit():
+                    continue
+                path = os.path.join(directory, name)
+                data = _read(path)
+                if data is None:
+                    continue
+                if _pid_alive(int(stem)):
+                    _merge(total, data)
+                else:
+                    _merge(archive, data)
+                    os.remove(path)
+                    archived = True
+            if archived:
+                _write_json(archive_path, _to_json(archive))
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+    _merge(total, _to_json(archive))
+    return total
+
+
+def _labels(**labels):
+    return ','.join('%s="%s"' % (k, str(v).replace('\\', '\\\\').replace('"', '\\"')) for k, v in labels.items())
+
+
+def render_prometheus():
+    total = collect()
+    lines = [
+        '# HELP ds_http_request_duration_seconds Time spent handling requests, by URL name.',
+        '# TYPE ds_http_request_duration_seconds histogram',
+    ]
+    views = sorted(total['views'].items())
+    for (view, method, status), (count, lat_sum, _, _, buckets, _) in views:
+        base = dict(view=view, method=method, status=status)
+        cumulative = 0
+        for bound, n in zip(LATENCY_BUCKETS, buckets):
+            cumulative += n
+            lines.append('ds_http_request_duration_seconds_bucket{%s} %d' % (_labels(**base, le=bound), cumulative))
+        lines.append('ds_http_request_duration_seconds_bucket{%s} %d' % (_labels(**base, le='+Inf'), count))
+        lines.append('ds_http_request_duration_seconds_sum{%s} %.6f' % (_labels(**base), lat_sum))
+        lines.append('ds_http_request_duration_seconds_count{%s} %d' % (_labels(**base), count))
+
+    lines += ['# HELP ds_http_request_queries SQL queries per request, by URL name.',
+              '# TYPE ds_http_request_queries histogram']
+    for (view, method, status), (count, _, queries, _, _, buckets) in views:
+        base = dict(view=view, method=method, status=status)
+        cumulative = 0
+        for bound, n in zip(QUERY_BUCKETS, buckets):
+            cumulative += n
+            lines.append('ds_http_request_queries_bucket{%s} %d' % (_labels(**base, le=bound), cumulative))
+        lines.append('ds_http_request_queries_bucket{%s} %d' % (_labels(**base, le='+Inf'), count))
+        lines.append('ds_http_request_queries_sum{%s} %d' % (_labels(**base), queries))
+        lines.append('ds_http_request_queries_count{%s} %d' % (_labels(**base), count))
+
+    lines += ['# HELP ds_http_request_query_seconds_total Time spent in SQL queries, by URL name.',
+              '# TYPE ds_http_request_query_seconds_total counter']
+    for (view, method, status), entry in views:
+        lines.append('ds_http_request_query_seconds_total{%s} %.6f'
+                     % (_labels(view=view, method=method, status=status), entry[3]))
+
+    lines += ['# HELP ds_cache_requests_total Cache lookups by cache and result.',
+              '# TYPE ds_cache_requests_total counter']
+    for (cache, result), n in sorted(total['caches'].items()):
+        lines.append('ds_cache_requests_total{%s} %d' % (_labels(cache=cache, result=result), n))
+    return '\n'.join(lines) + '\n'
+
+
+# ------------------------------
+# Middleware
+# ------------------------------
+class _QueryTimer:
+    __slots__ = ('count', 'seconds')
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.seconds += time.perf_counter() - start
+
+
+class MetricsMiddleware:
+    """Record latency, SQL count/time and cache events per URL name.
+
+    Sits just below WhiteNoise, so static files are not counted. Works for
+    both the WSGI and ASGI stacks; disabled by ``METRICS_ENABLED = False``.
+    Streaming responses are timed up to their first byte.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.enabled = getattr(settings, 'METRICS_ENABLED', True)
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self.enabled:
+            return self.get_response(request)
+        timer, events = _QueryTimer(), []
+        token = _request_cache_events.set(events)
+        start = time.perf_counter()
+        try:
+            with connection.execute_wrapper(timer):
+                response = self.get_response(request)
+        finally:
+            _request_cache_events.reset(token)
+        return self._finish(request, response, time.perf_counter() - start, timer, events)
+
+    async def __acall__(self, request):
+        if not self.enabled:
+            return await self.get_response(request)
+        timer, events = _QueryTimer(), []
+        token = _request_cache_events.set(events)
+        start = time.perf_counter()
+        try:
+            with connection.execute_wrapper(timer):
+                response = await self.get_response(request)
+        finally:
+            _request_cache_events.reset(token)
+        return self._finish(request, response, time.perf_counter() - start, timer, events)
+
+    def _finish(self, request, response, elapsed, timer, events):
+        match = getattr(request, 'resolver_match', None)
+        view = (match.url_name or match.view_name) if match else 'unmatched'
+        registry.observe(view, request.method, f'{response.status_code // 100}xx',
+                         elapsed, timer.count, timer.seconds)
+        registry.maybe_flush()
+
+        timing = ['app;dur=%.1f' % (elapsed * 1000),
+                  'db;dur=%.1f;desc="%d queries"' % (timer.seconds * 1000, timer.count)]
+        timing += ['cache;desc="%s"' % event for event in events]
+        response['Server-Timing'] = ', '.join(timing)
+        return response
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.7 on 2026-10-18 11:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dailystretch_app', '0011_add_theme_to_usersettings'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='routine',
+            index=models.Index(fields=['category', 'difficulty', 'duration_minutes'], name='routine_cat_diff_dur_idx'),
+        ),
+    ]
@@ -0,0 +1,105 @@
+from django.db import migrations
+
+# Full-text search index over routines, maintained by the database itself so
+# every Routine write (including bulk ones) updates it incrementally.
+#
+# Postgres: a stored generated tsvector column with a GIN index.
+# SQLite:   an external-content FTS5 table kept in sync by triggers.
+# Other backends get nothing and dailystretch_app.search falls back to LIKE.
+
+POSTGRES_FORWARD = [
+    """
+    ALTER TABLE dailystretch_app_routine ADD COLUMN search_vector tsvector
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('english', coalesce(title, '')), 'A') ||
+        setweight(to_tsvector('english', coalesce(category, '')), 'B') ||
+        setweight(to_tsvector('english', coalesce(description, '')), 'B') ||
+        setweight(to_tsvector('english', coalesce(instructions, '')), 'C')
+    ) STORED
+    """,
+    "CREATE INDEX routine_search_vector_gin ON dailystretch_app_routine USING gin (search_vector)",
+]
+
+POSTGRES_REVERSE = [
+    "DROP INDEX IF EXISTS routine_search_vector_gin",
+    "ALTER TABLE dailystretch_app_routine DROP COLUMN IF EXISTS search_vector",
+]
+
+SQLITE_FORWARD = [
+    """
+    CREATE VIRTUAL TABLE dailystretch_app_routine_fts USING fts5(
+        title, category, description, instructions,
+        content='dailystretch_app_routine', content_rowid='id',
+        tokenize='porter unicode61'
+    )
+    """,
+    """
+    CREATE TRIGGER dailystretch_app_routine_fts_ai AFTER INSERT ON dailystretch_app_routine BEGIN
+        INSERT INTO dailystretch_app_routine_fts(rowid, title, category, description, instructions)
+        VALUES (new.id, new.title, new.category, new.description, new.instructions);
+    END
+    """,
+    """
+    CREATE TRIGGER dailystretch_app_routine_fts_ad AFTER DELETE ON dailystretch_app_routine BEGIN
+        INSERT INTO dailystretch_app_routine_fts(dailystretch_app_routine_fts, rowid, title, category, description, instructions)
+        VALUES ('delete', old.id, old.title, old.category, old.description, old.instructions);
+    END
+    """,
+    """
+    CREATE TRIGGER dailystretch_app_routine_fts_au AFTER UPDATE ON dailystretch_app_routine BEGIN
+        INSERT INTO dailystretch_app_routine_fts(dailystretch_app_routine_fts, rowid, title, category, description, instructions)
+        VALUES ('delete', old.id, old.title, old.category, old.description, old.instructions);
+        INSERT INTO dailystretch_app_routine_fts(rowid, title, category, description, instructions)
+        VALUES (new.id, new.title, new.category, new.description, new.instructions);
+    END
+    """,
+    "INSERT INTO dailystretch_app_routine_fts(dailystretch_app_routine_fts) VALUES ('rebuild')",
+]
+
+SQLITE_REVERSE = [
+    "DROP TRIGGER IF EXISTS dailystretch_app_routine_fts_ai",
+    "DROP TRIGGER IF EXISTS dailystretch_app_routine_fts_ad",
+    "DROP TRIGGER IF EXISTS dailystretch_app_routine_fts_au",
+    "DROP TABLE IF EXISTS dailystretch_app_routine_fts",
+]
+
+
+def _sqlite_has_fts5(connection):
+    with connection.cursor() as cursor:
+        cursor.execute("PRAGMA compile_options")
+        return any('ENABLE_FTS5' in row[0] for row in cursor.fetchall())
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        statements = POSTGRES_FORWARD
+    elif vendor == 'sqlite' and _sqlite_has_fts5(schema_editor.connection):
+        statements = SQLITE_FORWARD
+    else:
+        return
+    for sql in statements:
+        schema_editor.execute(sql)
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        statements = POSTGRES_REVERSE
+    elif vendor == 'sqlite':
+        statements = SQLITE_REVERSE
+    else:
+        return
+    for sql in statements:
+        schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dailystretch_app', '0012_routine_filter_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
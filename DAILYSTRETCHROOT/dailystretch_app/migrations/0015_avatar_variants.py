@@ -0,0 +1,36 @@
+# Generated by Django 5.2.7 on 2026-10-18 11:57
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dailystretch_app', '0014_profilesyncoutbox'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='avatar_variants',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.CreateModel(
+            name='AvatarJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(max_length=255)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('next_attempt_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('last_error', models.TextField(blank=True)),
+                ('profile', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='dailystretch_app.profile')),
+            ],
+            options={
+                'ordering': ['id'],
+                'indexes': [models.Index(fields=['next_attempt_at', 'id'], name='avatar_job_due_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.7 on 2026-10-18 11:58
+
+import dailystretch_app.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dailystretch_app', '0015_avatar_variants'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='profile',
+            name='profile_picture',
+            field=models.ImageField(blank=True, default='profile_pictures/default.png', null=True, storage=dailystretch_app.storage.profile_picture_storage, upload_to='profile_pictures/'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+from django.db import migrations, models
+from django.utils.text import slugify
+
+
+def populate_slugs(apps, schema_editor):
+    Routine = apps.get_model('dailystretch_app', 'Routine')
+    seen = set()
+    for routine in Routine.objects.order_by('id').only('id', 'title').iterator():
+        base = slugify(routine.title or '')[:180] or 'routine'
+        slug, n = base, 1
+        while slug in seen:
+            n += 1
+            slug = f'{base}-{n}'
+        seen.add(slug)
+        Routine.objects.filter(pk=routine.pk).update(slug=slug)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dailystretch_app', '0016_profile_picture_content_storage'),
+    ]
+
+    operations = [
+        # Nullable first so existing rows can be backfilled; 0018 makes it unique
+        migrations.AddField(
+            model_name='routine',
+            name='slug',
+            field=models.SlugField(max_length=200, null=True, blank=True, db_index=False),
+        ),
+        migrations.RunPython(populate_slugs, migrations.RunPython.noop),
+    ]
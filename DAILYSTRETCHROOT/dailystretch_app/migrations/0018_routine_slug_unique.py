@@ -0,0 +1,32 @@
+from importlib import import_module
+
+from django.db import migrations, models
+
+search_migration = import_module('dailystretch_app.migrations.0013_routine_search')
+
+
+def restore_sqlite_search_triggers(apps, schema_editor):
+    # SQLite applies the AlterField below by rebuilding the table, which drops
+    # the FTS sync triggers created in 0013; put them (and the index) back.
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    if not search_migration._sqlite_has_fts5(schema_editor.connection):
+        return
+    for sql in search_migration.SQLITE_REVERSE + search_migration.SQLITE_FORWARD:
+        schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dailystretch_app', '0017_routine_slug'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='routine',
+            name='slug',
+            field=models.SlugField(max_length=200, unique=True, blank=True),
+        ),
+        migrations.RunPython(restore_sqlite_search_triggers, restore_sqlite_search_triggers),
+    ]
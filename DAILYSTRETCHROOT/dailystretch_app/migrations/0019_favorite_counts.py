@@ -0,0 +1,70 @@
+# Generated by Django 5.2.7 on 2026-10-18 12:05
+
+from importlib import import_module
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+search_migration = import_module('dailystretch_app.migrations.0013_routine_search')
+
+# Only reindex a routine for search when its text changes, not on every
+# favorite_count bump
+SQLITE_FTS_UPDATE_TRIGGER = """
+CREATE TRIGGER dailystretch_app_routine_fts_au
+AFTER UPDATE OF title, category, description, instructions ON dailystretch_app_routine BEGIN
+    INSERT INTO dailystretch_app_routine_fts(dailystretch_app_routine_fts, rowid, title, category, description, instructions)
+    VALUES ('delete', old.id, old.title, old.category, old.description, old.instructions);
+    INSERT INTO dailystretch_app_routine_fts(rowid, title, category, description, instructions)
+    VALUES (new.id, new.title, new.category, new.description, new.instructions);
+END
+"""
+
+
+def backfill_counts(apps, schema_editor):
+    Favorite = apps.get_model('dailystretch_app', 'Favorite')
+    Routine = apps.get_model('dailystretch_app', 'Routine')
+    Profile = apps.get_model('dailystretch_app', 'Profile')
+    per_routine = Favorite.objects.filter(routine=OuterRef('pk')).order_by().values('routine')
+    Routine.objects.update(favorite_count=Coalesce(Subquery(per_routine.annotate(n=Count('*')).values('n')), 0))
+    per_user = Favorite.objects.filter(user=OuterRef('user_id')).order_by().values('user')
+    Profile.objects.update(favorite_count=Coalesce(Subquery(per_user.annotate(n=Count('*')).values('n')), 0))
+
+
+def restore_sqlite_search_triggers(apps, schema_editor):
+    # Adding a column with a default rebuilds the table on SQLite, dropping the
+    # FTS triggers; recreate them with the narrower update trigger.
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    if not search_migration._sqlite_has_fts5(schema_editor.connection):
+        return
+    for sql in search_migration.SQLITE_REVERSE + search_migration.SQLITE_FORWARD:
+        schema_editor.execute(sql)
+    schema_editor.execute("DROP TRIGGER IF EXISTS dailystretch_app_routine_fts_au")
+    schema_editor.execute(SQLITE_FTS_UPDATE_TRIGGER)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dailystretch_app', '0018_routine_slug_unique'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='favorite_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='routine',
+            name='favorite_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='routine',
+            index=models.Index(fields=['-favorite_count', 'id'], name='routine_popularity_idx'),
+        ),
+        migrations.RunPython(backfill_counts, migrations.RunPython.noop),
+        migrations.RunPython(restore_sqlite_search_triggers, migrations.RunPython.noop),
+    ]
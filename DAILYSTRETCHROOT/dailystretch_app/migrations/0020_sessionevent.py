@@ -0,0 +1,51 @@
+# Generated by Django 5.2.7 on 2026-10-18 12:07
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+# Events arrive roughly in started_at order, so a BRIN index (a few pages per
+# million rows, near-free to maintain) serves time-range scans on Postgres.
+# Other backends rely on session_user_time_idx alone.
+POSTGRES_BRIN = "CREATE INDEX session_started_brin ON dailystretch_app_sessionevent USING brin (started_at)"
+
+
+def create_brin_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(POSTGRES_BRIN)
+
+
+def drop_brin_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute("DROP INDEX IF EXISTS session_started_brin")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dailystretch_app', '0019_favorite_counts'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SessionEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('client_id', models.UUIDField()),
+                ('kind', models.CharField(choices=[('study', 'Study'), ('break', 'Break'), ('routine', 'Routine')], max_length=16)),
+                ('started_at', models.DateTimeField()),
+                ('duration_seconds', models.PositiveIntegerField()),
+                ('completed', models.BooleanField(default=True)),
+                ('received_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('routine', models.ForeignKey(blank=True, db_constraint=False, db_index=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, to='dailystretch_app.routine')),
+                ('user', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', 'started_at'], name='session_user_time_idx')],
+                'constraints': [models.UniqueConstraint(fields=('user', 'client_id'), name='session_event_client_uniq')],
+            },
+        ),
+        migrations.RunPython(create_brin_index, drop_brin_index),
+    ]
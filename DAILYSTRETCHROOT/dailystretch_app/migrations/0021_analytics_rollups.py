@@ -0,0 +1,102 @@
+# Generated by Django 5.2.7 on 2026-10-18 12:10
+
+import django.db.models.deletion
+import django.db.models.functions.datetime
+from django.conf import settings
+from django.db import migrations, models
+
+# update_rollups reads logins since its last run as a range on last_login
+LAST_LOGIN_INDEX = "CREATE INDEX IF NOT EXISTS auth_user_last_login_idx ON auth_user (last_login)"
+
+
+def create_last_login_index(apps, schema_editor):
+    schema_editor.execute(LAST_LOGIN_INDEX)
+
+
+def drop_last_login_index(apps, schema_editor):
+    schema_editor.execute("DROP INDEX IF EXISTS auth_user_last_login_idx")
+
+
+def skip_undated_favorites(apps, schema_editor):
+    # Favorites saved before this migration all get today's created_at, so the
+    # favorites rollup starts after them instead of counting them all today
+    Favorite = apps.get_model('dailystretch_app', 'Favorite')
+    RollupState = apps.get_model('dailystretch_app', 'RollupState')
+    last = Favorite.objects.order_by('-id').values_list('id', flat=True).first()
+    if last:
+        RollupState.objects.update_or_create(name='favorites', defaults={'last_id': last})
+
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('dailystretch_app', '0020_sessionevent'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ActiveUserMark',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('day', models.DateField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='DailyUserStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(unique=True)),
+                ('signups', models.PositiveIntegerField(default=0)),
+                ('active_users', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'ordering': ['day'],
+            },
+        ),
+        migrations.CreateModel(
+            name='RollupState',
+            fields=[
+                ('name', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('last_id', models.BigIntegerField(default=0)),
+                ('last_time', models.DateTimeField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='favorite',
+            name='created_at',
+            field=models.DateTimeField(db_default=django.db.models.functions.datetime.Now()),
+        ),
+        migrations.CreateModel(
+            name='DailySettingsSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('setting', models.CharField(max_length=32)),
+                ('value', models.CharField(max_length=32)),
+                ('users', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'ordering': ['day', 'setting', 'value'],
+                'constraints': [models.UniqueConstraint(fields=('day', 'setting', 'value'), name='daily_settings_uniq')],
+            },
+        ),
+        migrations.CreateModel(
+            name='DailyFavoriteStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('category', models.CharField(blank=True, max_length=64)),
+                ('added', models.PositiveIntegerField(default=0)),
+                ('routine', models.ForeignKey(db_constraint=False, db_index=False, on_delete=django.db.models.deletion.DO_NOTHING, to='dailystretch_app.routine')),
+            ],
+            options={
+                'ordering': ['day'],
+                'constraints': [models.UniqueConstraint(fields=('day', 'routine'), name='daily_favorite_day_routine_uniq')],
+            },
+        ),
+        migrations.RunPython(create_last_login_index, drop_last_login_index),
+        migrations.RunPython(skip_undated_favorites, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,64 @@
+from django.db import migrations
+
+# Usernames and emails are unique regardless of case, and looked up through
+# these expressions by dailystretch_app.backends.users_matching. Accounts
+# without an email store '', which NULLIF turns into NULL so they never clash.
+#
+# On Postgres the indexes are built CONCURRENTLY, which does not block writes
+# to auth_user while they build but cannot run inside a transaction, hence
+# atomic = False. An interrupted concurrent build leaves an INVALID index
+# behind; it is dropped and rebuilt on the next run.
+INDEXES = {
+    'auth_user_username_lower_uniq': "ON auth_user (lower(username))",
+    'auth_user_email_lower_uniq': "ON auth_user (lower(nullif(email, '')))",
+}
+
+
+def _check_duplicates(cursor):
+    duplicates = []
+    for column, where in (('username', ''), ('email', "WHERE email <> ''")):
+        cursor.execute(f"SELECT lower({column}) FROM auth_user {where} "
+                       f"GROUP BY lower({column}) HAVING count(*) > 1 LIMIT 10")
+        duplicates += [f'{column} {value!r}' for (value,) in cursor.fetchall()]
+    if duplicates:
+        raise RuntimeError('auth_user has values that differ only in case; merge or rename these accounts '
+                           'before migrating: ' + ', '.join(duplicates))
+
+
+def create_lower_indexes(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor not in ('postgresql', 'sqlite'):
+        return
+    with connection.cursor() as cursor:
+        _check_duplicates(cursor)
+        for name, definition in INDEXES.items():
+            if connection.vendor == 'postgresql':
+                cursor.execute("SELECT NOT indisvalid FROM pg_index WHERE indexrelid = to_regclass(%s)", [name])
+                row = cursor.fetchone()
+                if row and row[0]:
+                    cursor.execute(f"DROP INDEX CONCURRENTLY {name}")
+                cursor.execute(f"CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS {name} {definition}")
+            else:
+                cursor.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS {name} {definition}")
+
+
+def drop_lower_indexes(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor not in ('postgresql', 'sqlite'):
+        return
+    concurrently = 'CONCURRENTLY ' if connection.vendor == 'postgresql' else ''
+    with connection.cursor() as cursor:
+        for name in INDEXES:
+            cursor.execute(f"DROP INDEX {concurrently}IF EXISTS {name}")
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('dailystretch_app', '0021_analytics_rollups'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_lower_indexes, drop_lower_indexes),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-18 12:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dailystretch_app', '0022_user_lower_unique'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profilesyncoutbox',
+            name='leased_until',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,62 @@
+# Generated by Django 5.2.7 on 2026-10-18 13:00
+
+from importlib import import_module
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# Favorite toggles update this narrow table instead of the Routine row, whose
+# stored search_vector Postgres would recompute (and reindex) on every bump
+counts_migration = import_module('dailystretch_app.migrations.0019_favorite_counts')
+
+
+def copy_counts(apps, schema_editor):
+    Routine = apps.get_model('dailystretch_app', 'Routine')
+    RoutineStats = apps.get_model('dailystretch_app', 'RoutineStats')
+    rows = Routine.objects.filter(favorite_count__gt=0).values_list('id', 'favorite_count').iterator(chunk_size=2000)
+    batch = []
+    for routine_id, count in rows:
+        batch.append(RoutineStats(routine_id=routine_id, favorite_count=count))
+        if len(batch) >= 2000:
+            RoutineStats.objects.bulk_create(batch)
+            batch = []
+    RoutineStats.objects.bulk_create(batch)
+
+
+def copy_counts_back(apps, schema_editor):
+    Routine = apps.get_model('dailystretch_app', 'Routine')
+    RoutineStats = apps.get_model('dailystretch_app', 'RoutineStats')
+    for routine_id, count in RoutineStats.objects.values_list('routine_id', 'favorite_count').iterator():
+        Routine.objects.filter(id=routine_id).update(favorite_count=count)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dailystretch_app', '0023_profilesyncoutbox_leased_until'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RoutineStats',
+            fields=[
+                ('routine', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='dailystretch_app.routine')),
+                ('favorite_count', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(copy_counts, copy_counts_back),
+        migrations.RemoveIndex(
+            model_name='routine',
+            name='routine_popularity_idx',
+        ),
+        migrations.RemoveField(
+            model_name='routine',
+            name='favorite_count',
+        ),
+        migrations.AddIndex(
+            model_name='routinestats',
+            index=models.Index(fields=['-favorite_count', 'routine'], name='routine_stats_popularity_idx'),
+        ),
+        # Dropping the column rebuilds the routine table on SQLite, and its FTS triggers with it
+        migrations.RunPython(counts_migration.restore_sqlite_search_triggers, migrations.RunPython.noop),
+    ]
@@ -1,10 +1,13 @@
 from django.db import models
+from django.utils import timezone
+from django.utils.text import slugify
 from django.contrib.auth.models import User
 from django.conf import settings
-from django.db.models.signals import post_save
+from django.db.models import F
+from django.db.models.functions import Greatest, Now
+from django.db.models.signals import post_save, post_delete, pre_delete
 from django.dispatch import receiver
-import os
-from django.core.files import File
+from .storage import default_profile_picture_name, profile_picture_storage
 from django.contrib.postgres.fields import JSONField as PostgresJSONField
 try:
     # Django 3.1+ has JSONField in django.db.models
@@ -14,6 +17,9 @@ except Exception:
 
 class Routine(models.Model):
     title = models.TextField()
+    # Natural key for catalog imports (`manage.py seed_routines`); filled from
+    # the title on first save and kept stable when the title is edited
+    slug = models.SlugField(max_length=200, unique=True, blank=True)
     description = models.TextField(blank=True, null=True)
     category = models.CharField(max_length=64, blank=True, null=True)
     difficulty = models.CharField(max_length=32, blank=True, null=True)
@@ -24,10 +30,57 @@ class Routine(models.Model):
 
     class Meta:
         ordering = ['id']
+        indexes = [
+            # Serves the /api/routines/ category/difficulty/duration filters
+            models.Index(fields=['category', 'difficulty', 'duration_minutes'],
+                         name='routine_cat_diff_dur_idx'),
+        ]
 
     def __str__(self):
         return self.title
 
+    def save(self, *args, **kwargs):
+        if not self.slug:
+            self.slug = self.unique_slug(self.title)
+        super().save(*args, **kwargs)
+
+    @classmethod
+    def unique_slug(cls, title):
+        base = slugify(title or '')[:180] or 'routine'
+        slug, n = base, 1
+        while cls.objects.filter(slug=slug).exists():
+            n += 1
+            slug = f'{base}-{n}'
+        return slug
+
+
+# Invalidate the cached routine catalog whenever a routine changes
+@receiver([post_save, post_delete], sender=Routine)
+def bump_routine_catalog_version(sender, **kwargs):
+    from .catalog import bump_version_on_commit
+    bump_version_on_commit()
+
+
+class RoutineStats(models.Model):
+    """Counters of one routine, kept out of the wide Routine row.
+
+    Favorite toggles update only this row. On Postgres an UPDATE of Routine
+    recomputes the stored search_vector (migration 0013) and, with a counter
+    indexed, cannot be HOT, so every toggle would rewrite its GIN entries.
+    Routines nobody has favorited may have no row; read the count as 0.
+    """
+    routine = models.OneToOneField(Routine, on_delete=models.CASCADE, primary_key=True, related_name='stats')
+    # Denormalized count of Favorite rows, maintained by dailystretch_app.favorites
+    # (see `manage.py reconcile_favorite_counts`)
+    favorite_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            # Serves the most-favorited leaderboard as an index scan
+            models.Index(fields=['-favorite_count', 'routine'], name='routine_stats_popularity_idx'),
+        ]
+
+
 class UserSettings(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
     study_duration = models.PositiveIntegerField(default=25)
@@ -55,10 +108,47 @@ class Profile(models.Model):
     date_of_birth = models.DateField(null=True, blank=True)
     profile_picture = models.ImageField(
         upload_to='profile_pictures/',
+        # Stored by content hash, so identical images (the default picture
+        # above all) exist once on disk however many profiles use them
+        storage=profile_picture_storage,
         default='profile_pictures/default.png',  # <- default image
         blank=True,
         null=True
     )
+    # Resized WebP/JPEG renditions written by `manage.py process_avatars`:
+    # {"source": <profile_picture name>, "sm": {"webp": name, "jpeg": name}, ...}
+    avatar_variants = models.JSONField(default=dict, blank=True)
+    # Denormalized count of the user's Favorite rows, maintained like RoutineStats.favorite_count
+    favorite_count = models.PositiveIntegerField(default=0)
+
+    # Rendered square sizes in px; chosen at 2x the CSS size they are shown at
+    AVATAR_SIZES = {'sm': 80, 'md': 240, 'lg': 512}
+    AVATAR_FORMATS = ('webp', 'jpeg')
+
+    @property
+    def avatar_ready(self):
+        """True when variants exist for the current profile_picture."""
+        variants = self.avatar_variants or {}
+        return bool(self.profile_picture) and variants.get('source') == self.profile_picture.name
+
+    def avatar_url(self, size='md', fmt='jpeg'):
+        """URL of a resized variant, or of the original upload until variants exist."""
+        if not self.profile_picture:
+            return ''
+        if self.avatar_ready:
+            name = self.avatar_variants.get(size, {}).get(fmt)
+            if name:
+                return self.profile_picture.storage.url(name)
+        try:
+            return self.profile_picture.url
+        except Exception:
+            return ''
+
+    @property
+    def avatar_urls(self):
+        """{size: {format: url}} for templates, e.g. profile.avatar_urls.md.webp"""
+        return {size: {fmt: self.avatar_url(size, fmt) for fmt in self.AVATAR_FORMATS}
+                for size in self.AVATAR_SIZES}
 
 
 # Ensure a Profile is created for each new User and populate a default picture
@@ -66,26 +156,190 @@ class Profile(models.Model):
 def create_profile_for_new_user(sender, instance, created, **kwargs):
     if not created:
         return
-    profile = Profile.objects.create(user=instance)
+    # The shared default picture is referenced by name; no per-user file copy
+    try:
+        picture = default_profile_picture_name()
+    except Exception:
+        # If the default image is unavailable, leave the field default alone
+        picture = None
+    if picture:
+        Profile.objects.create(user=instance, profile_picture=picture)
+    else:
+        Profile.objects.create(user=instance)
 
-    # Try to copy the project's static default image into the user's media profile picture
-    default_static_path = os.path.join(
-        settings.BASE_DIR,
-        'static', 'dailystretch_app', 'images', 'profilepicture.png'
-    )
 
-    if os.path.exists(default_static_path):
-        try:
-            with open(default_static_path, 'rb') as f:
-                profile.profile_picture.save('default.png', File(f), save=True)
-        except Exception:
-            # If saving fails, leave the default field alone (it already has a default path)
-            pass
+# Invalidate the user's cached segment HTML (see dailystretch_app.fragments)
+@receiver([post_save, post_delete], sender=User)
+@receiver([post_save, post_delete], sender=UserSettings)
+@receiver([post_save, post_delete], sender=Profile)
+def bump_user_fragment_version(sender, instance, **kwargs):
+    from .fragments import bump_user_version_on_commit
+    bump_user_version_on_commit(instance.pk if sender is User else instance.user_id)
 
 class Favorite(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     routine = models.ForeignKey('Routine', on_delete=models.CASCADE)
+    # Database default so the raw INSERTs in dailystretch_app.favorites set it too
+    created_at = models.DateTimeField(db_default=Now())
 
     class Meta:
         unique_together = ('user', 'routine')
 
+
+# Favorites removed by cascade bypass dailystretch_app.favorites; keep the
+# counters on the other side of each relation in step
+@receiver(pre_delete, sender=Routine)
+def release_routine_favorites(sender, instance, **kwargs):
+    Profile.objects.filter(user__favorite__routine=instance).update(
+        favorite_count=Greatest(F('favorite_count') - 1, 0))
+
+
+@receiver(pre_delete, sender=User)
+def release_user_favorites(sender, instance, **kwargs):
+    RoutineStats.objects.filter(routine__favorite__user=instance).update(
+        favorite_count=Greatest(F('favorite_count') - 1, 0))
+
+
+class ProfileSyncOutbox(models.Model):
+    """Pending Supabase profile updates, written in the same transaction as the
+    profile save and drained by ``manage.py sync_supabase_profiles``."""
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    email = models.EmailField()
+    payload = models.JSONField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    # Set while a worker is sending this user's update; no other worker claims the user until then
+    leased_until = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+
+    class Meta:
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['next_attempt_at', 'id'], name='profile_sync_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"Supabase sync for {self.email}"
+
+
+class AvatarJob(models.Model):
+    """An uploaded profile picture waiting to be resized by ``manage.py process_avatars``."""
+    profile = models.ForeignKey(Profile, on_delete=models.CASCADE)
+    source = models.CharField(max_length=255)
+    created_at = models.DateTimeField(auto_now_add=True)
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+
+    class Meta:
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['next_attempt_at', 'id'], name='avatar_job_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"Avatar job for {self.source}"
+
+
+class SessionEvent(models.Model):
+    """Append-only log of finished timer sessions (pomodoro study/break cycles
+    and library routines), sent from the browser in batches and written by
+    ``dailystretch_app.session_log``.
+
+    Rows are never updated. The only secondary indexes are (user, started_at)
+    for per-user history ranges and (user, client_id) for dropping resent
+    batches; on Postgres a BRIN index on started_at (migration 0020) serves
+    time-range scans at almost no insert cost.
+    """
+    KIND_STUDY = 'study'
+    KIND_BREAK = 'break'
+    KIND_ROUTINE = 'routine'
+    KIND_CHOICES = [
+        (KIND_STUDY, 'Study'),
+        (KIND_BREAK, 'Break'),
+        (KIND_ROUTINE, 'Routine'),
+    ]
+
+    # Covered by session_user_time_idx; no separate FK index to maintain
+    user = models.ForeignKey(User, on_delete=models.CASCADE, db_index=False)
+    # Generated by the browser so a resent beacon is ignored, not duplicated
+    client_id = models.UUIDField()
+    kind = models.CharField(max_length=16, choices=KIND_CHOICES)
+    # Historical reference: deleting a routine must not rewrite millions of log rows
+    routine = models.ForeignKey(Routine, on_delete=models.DO_NOTHING, null=True, blank=True,
+                                db_index=False, db_constraint=False)
+    started_at = models.DateTimeField()
+    duration_seconds = models.PositiveIntegerField()
+    completed = models.BooleanField(default=True)
+    received_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'started_at'], name='session_user_time_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'client_id'], name='session_event_client_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} session for user {self.user_id} at {self.started_at}"
+
+
+# ------------------------------
+# Analytics rollups, maintained by `manage.py update_rollups`
+# (dailystretch_app.rollups); the admin panel charts read only these
+# ------------------------------
+class RollupState(models.Model):
+    """High-water mark of one incremental rollup."""
+    name = models.CharField(max_length=64, primary_key=True)
+    last_id = models.BigIntegerField(default=0)
+    last_time = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} @ {self.last_id or self.last_time}"
+
+
+class DailyUserStats(models.Model):
+    day = models.DateField(unique=True)
+    signups = models.PositiveIntegerField(default=0)
+    active_users = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ['day']
+
+
+class ActiveUserMark(models.Model):
+    """Last day a user was counted in DailyUserStats.active_users, so repeated
+    logins on one day count once."""
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True)
+    day = models.DateField()
+
+
+class DailyFavoriteStats(models.Model):
+    day = models.DateField()
+    # Historical reference, like SessionEvent.routine
+    routine = models.ForeignKey(Routine, on_delete=models.DO_NOTHING, db_index=False, db_constraint=False)
+    category = models.CharField(max_length=64, blank=True)
+    added = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ['day']
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'routine'], name='daily_favorite_day_routine_uniq'),
+        ]
+
+
+class DailySettingsSnapshot(models.Model):
+    """How many users had each value of a setting on a day (last run of the day wins)."""
+    day = models.DateField()
+    setting = models.CharField(max_length=32)
+    value = models.CharField(max_length=32)
+    users = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ['day', 'setting', 'value']
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'setting', 'value'], name='daily_settings_uniq'),
+        ]
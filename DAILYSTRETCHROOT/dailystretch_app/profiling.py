@@ -0,0 +1,412 @@
+"""Opt-in profiling of individual requests.
+
+``ProfilingMiddleware`` profiles a request when one of these asks for it:
+
+* a superuser adds ``?_profile=1`` (or ``?_profile=cprofile``) to the URL;
+* the request carries ``X-DS-Profile: <token>``, a signed token from
+  ``manage.py profile_token``, so a regular user's traffic (or a load test) can
+  be profiled without giving anyone admin rights;
+* a random draw below ``PROFILE_SAMPLE_RATE`` (default 0, i.e. never).
+
+Two modes:
+
+* ``sample`` (default): a background thread snapshots the request thread's
+  stack every ``PROFILE_INTERVAL_MS`` and counts identical stacks. The output
+  is the collapsed ("folded") format read by flamegraph.pl, speedscope and the
+  admin panel's Profiles tab. Overhead is a few percent and does not grow with
+  the number of calls, so it is the one to use on real traffic;
+* ``cprofile``: deterministic ``cProfile`` timings of every call, saved as a
+  ``.prof`` file for pstats/snakeviz. Exact call counts, but slows hot loops
+  (serializing thousands of routines, template rendering) considerably.
+
+Under ASGI (``SERVER_MODE=asgi``) only ``sample`` is available; a request
+for ``cprofile`` is sampled instead, because cProfile sees one thread and
+mixes in every other coroutine the event loop runs. The sampler follows the
+request wherever it runs: the event loop thread while the request's own
+coroutine is executing (async views), and the per-request thread asgiref
+starts for sync code (sync views and middleware).
+
+Each profile is stored in ``PROFILE_DIR`` as ``<id>.json`` (request metadata)
+plus its data file; older ones are pruned beyond ``PROFILE_MAX_FILES`` or
+``PROFILE_MAX_AGE_DAYS``.
+"""
+import cProfile
+import json
+import logging
+import os
+import pstats
+import random
+import re
+import secrets
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+
+from asgiref.sync import SyncToAsync, iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core import signing
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+MODES = ('sample', 'cprofile')
+EXTENSIONS = {'sample': '.folded', 'cprofile': '.prof'}
+QUERY_PARAM = '_profile'
+HEADER = 'X-DS-Profile'
+TOKEN_SALT = 'dailystretch_app.profiling'
+PROFILE_ID_RE = re.compile(r'^[0-9]{8}T[0-9]{6}-[a-z0-9_-]{1,64}-[0-9a-f]{8}$')
+# Longest stack kept per sample, innermost frames first to go
+MAX_STACK_DEPTH = 200
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def profile_dir():
+    return _setting('PROFILE_DIR', None) or os.path.join(tempfile.gettempdir(), 'dailystretch-profiles')
+
+
+def make_token(mode='sample', max_age=3600):
+    """Signed value for the ``X-DS-Profile`` header; valid for ``max_age`` seconds."""
+    if mode not in MODES:
+        raise ValueError(f"mode must be one of {', '.join(MODES)}")
+    return signing.dumps({'mode': mode, 'exp': int(time.time()) + max_age}, salt=TOKEN_SALT)
+
+
+def _token_mode(value):
+    try:
+        data = signing.loads(value, salt=TOKEN_SALT)
+    except signing.BadSignature:
+        return None
+    if not isinstance(data, dict) or data.get('exp', 0) < time.time() or data.get('mode') not in MODES:
+        return None
+    return data['mode']
+
+
+def requested_mode(request, user=None):
+    """(mode, trigger) when this request should be profiled, else (None, None).
+
+    ``user`` defaults to ``request.user``; async callers pass the result of
+    ``request.auser()`` when the query flag is present.
+    """
+    flag = request.GET.get(QUERY_PARAM)
+    if flag is not None:
+        if user is None:
+            user = getattr(request, 'user', None)
+        if user is not None and user.is_authenticated and user.is_superuser:
+            return ('cprofile' if flag == 'cprofile' else 'sample'), 'query'
+    token = request.headers.get(HEADER)
+    if token:
+        mode = _token_mode(token)
+        if mode:
+            return mode, 'header'
+    rate = _setting('PROFILE_SAMPLE_RATE', 0.0)
+    if rate > 0 and random.random() < rate:
+        return 'sample', 'sampled'
+    return None, None
+
+
+# ------------------------------
+# Profilers
+# ------------------------------
+def _frame_label(code):
+    # No ';' allowed in folded stacks; keep the last two path parts for context
+    path = os.path.normpath(code.co_filename).split(os.sep)
+    label = '%s (%s:%d)' % (code.co_name, '/'.join(path[-2:]), code.co_firstlineno)
+    return label.replace(';', ':')
+
+
+class StackSampler(threading.Thread):
+    """Counts the stacks of one request, every ``interval`` seconds.
+
+    ``threads()`` returns the ids of the threads that may be running it. A
+    thread's stack is kept only if the walk outwards reaches ``stop_frame``
+    (the middleware frame that started the profile) or a frame of
+    ``root_code``; anything else is another request sharing the thread.
+    """
+
+    def __init__(self, threads, interval, stop_frame, root_code=None):
+        super().__init__(name='ds-profile-sampler', daemon=True)
+        self.threads = threads
+        self.interval = interval
+        self.stop_frame = stop_frame
+        self.root_code = root_code
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop_event = threading.Event()
+        self._labels = {}
+
+    def _label(self, code):
+        label = self._labels.get(code)
+        if label is None:
+            label = self._labels[code] = _frame_label(code)
+        return label
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            frames = sys._current_frames()
+            sampled = False
+            for thread_id in self.threads():
+                stack = self._stack(frames.get(thread_id))
+                if stack:
+                    stack = stack[-MAX_STACK_DEPTH:]
+                    self.stacks[';'.join(self._label(code) for code in reversed(stack))] += 1
+                    sampled = True
+            if sampled:
+                self.samples += 1
+
+    def _stack(self, frame):
+        # A thread blocked in threading is waiting for the event loop: the
+        # request is running elsewhere (and sampled there) at that moment
+        if frame is None or frame.f_code.co_filename == threading.__file__:
+            return None
+        stack = []
+        while frame is not None:
+            if frame is self.stop_frame or frame.f_code is self.root_code:
+                return stack
+            stack.append(frame.f_code)
+            frame = frame.f_back
+        return None
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+def _sync_threads(context):
+    # The thread asgiref runs sync code in for ``context``, the ThreadSensitiveContext
+    # Django's ASGIHandler opens per request; it starts with the first sync call
+    executor = SyncToAsync.context_to_thread_executor.get(context) if context is not None else None
+    return [t.ident for t in list(getattr(executor, '_threads', ()))]
+
+
+# ------------------------------
+# Storage
+# ------------------------------
+def _slug(value):
+    return re.sub(r'[^a-z0-9_-]+', '-', (value or 'unmatched').lower()).strip('-')[:64] or 'unmatched'
+
+
+def _paths(profile_id, mode):
+    directory = profile_dir()
+    return os.path.join(directory, profile_id + '.json'), os.path.join(directory, profile_id + EXTENSIONS[mode])
+
+
+def save(meta, write_data):
+    """Store one profile; ``write_data(path)`` writes the data file. Returns the profile id."""
+    directory = profile_dir()
+    os.makedirs(directory, exist_ok=True)
+    stamp = timezone.now().strftime('%Y%m%dT%H%M%S')
+    profile_id = f"{stamp}-{_slug(meta['view'])}-{secrets.token_hex(4)}"
+    meta_path, data_path = _paths(profile_id, meta['mode'])
+    write_data(data_path)
+    meta = dict(meta, id=profile_id, data_file=os.path.basename(data_path))
+    with open(meta_path, 'w') as f:
+        json.dump(meta, f)
+    prune()
+    return profile_id
+
+
+def prune():
+    """Drop profiles beyond PROFILE_MAX_FILES or older than PROFILE_MAX_AGE_DAYS."""
+    directory = profile_dir()
+    max_files = _setting('PROFILE_MAX_FILES', 200)
+    cutoff = time.time() - _setting('PROFILE_MAX_AGE_DAYS', 7) * 86400
+    try:
+        entries = sorted(
+            ((e.stat().st_mtime, e.name[:-5]) for e in os.scandir(directory) if e.name.endswith('.json')),
+            reverse=True)
+    except OSError:
+        return
+    for index, (mtime, profile_id) in enumerate(entries):
+        if index >= max_files or mtime < cutoff:
+            delete(profile_id)
+
+
+def delete(profile_id):
+    directory = profile_dir()
+    for ext in ('.json',) + tuple(EXTENSIONS.values()):
+        try:
+            os.remove(os.path.join(directory, profile_id + ext))
+        except FileNotFoundError:
+            pass
+
+
+def list_profiles(limit=100):
+    """Newest-first metadata of stored profiles."""
+    directory = profile_dir()
+    try:
+        entries = sorted(((e.stat().st_mtime, e.name) for e in os.scandir(directory) if e.name.endswith('.json')),
+                         reverse=True)
+    except OSError:
+        return []
+    profiles = []
+    for _, name in entries[:limit]:
+        meta = _read_meta(name[:-5])
+        if meta is not None:
+            profiles.append(meta)
+    return profiles
+
+
+def _read_meta(profile_id):
+    try:
+        with open(os.path.join(profile_dir(), profile_id + '.json')) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def get_profile(profile_id, top=60):
+    """Metadata plus browsable data: folded stacks for ``sample``, the top functions for ``cprofile``.
+
+    Returns None for unknown or malformed ids.
+    """
+    if not PROFILE_ID_RE.match(profile_id):
+        return None
+    meta = _read_meta(profile_id)
+    if meta is None:
+        return None
+    path = data_path(meta)
+    if meta['mode'] == 'sample':
+        stacks = []
+        with open(path) as f:
+            for line in f:
+                stack, _, count = line.rstrip('\n').rpartition(' ')
+                if stack and count.isdigit():
+                    stacks.append([stack, int(count)])
+        return dict(meta, stacks=stacks)
+    stats = pstats.Stats(path)
+    rows = []
+    for (filename, line, func), (_, calls, own, cumulative, _) in stats.stats.items():
+        rows.append({
+            'function': _frame_label(_Code(func, filename, line)),
+            'calls': calls,
+            'own_ms': round(own * 1000, 3),
+            'cumulative_ms': round(cumulative * 1000, 3),
+        })
+    rows.sort(key=lambda r: r['cumulative_ms'], reverse=True)
+    return dict(meta, functions=rows[:top])
+
+
+class _Code:
+    # Stand-in for a code object, so pstats entries get the same labels as samples
+    __slots__ = ('co_name', 'co_filename', 'co_firstlineno')
+
+    def __init__(self, name, filename, line):
+        self.co_name, self.co_filename, self.co_firstlineno = name, filename, line
+
+
+def data_path(meta):
+    return os.path.join(profile_dir(), os.path.basename(meta['data_file']))
+
+
+# ------------------------------
+# Middleware
+# ------------------------------
+class ProfilingMiddleware:
+    """Profile the rest of the stack (view and template rendering) when asked to.
+
+    Sits after AuthenticationMiddleware so the ``?_profile`` flag can check
+    ``is_superuser``. The id of the stored profile is returned in an
+    ``X-DS-Profile-Id`` header. Works for both the WSGI and ASGI stacks, and
+    passes requests nobody asked to profile straight through.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not _setting('PROFILING_ENABLED', True):
+            return self.get_response(request)
+        mode, trigger = requested_mode(request)
+        if mode is None:
+            return self.get_response(request)
+        return self._profile(request, mode, trigger)
+
+    async def __acall__(self, request):
+        if not _setting('PROFILING_ENABLED', True):
+            return await self.get_response(request)
+        user = await request.auser() if QUERY_PARAM in request.GET else None
+        mode, trigger = requested_mode(request, user)
+        if mode is None:
+            return await self.get_response(request)
+        return await self._aprofile(request, trigger)
+
+    def _profile(self, request, mode, trigger):
+        start = time.perf_counter()
+        if mode == 'cprofile':
+            profiler = cProfile.Profile()
+            response = profiler.runcall(self.get_response, request)
+            elapsed = time.perf_counter() - start
+            write_data = profiler.dump_stats
+            samples = None
+        else:
+            thread_id = threading.get_ident()
+            sampler = StackSampler(lambda: (thread_id,), self._interval(), sys._getframe())
+            sampler.start()
+            try:
+                response = self.get_response(request)
+            finally:
+                sampler.stop()
+            elapsed = time.perf_counter() - start
+            samples = sampler.samples
+            write_data = self._folded_writer(sampler)
+        return self._store(request, response, mode, trigger, elapsed, samples, write_data,
+                           getattr(request, 'user', None))
+
+    async def _aprofile(self, request, trigger):
+        start = time.perf_counter()
+        loop_thread = threading.get_ident()
+        context = SyncToAsync.thread_sensitive_context.get(None)
+        sampler = StackSampler(lambda: [loop_thread, *_sync_threads(context)], self._interval(), sys._getframe(),
+                               SyncToAsync.thread_handler.__code__)
+        sampler.start()
+        try:
+            response = await self.get_response(request)
+        finally:
+            sampler.stop()
+        elapsed = time.perf_counter() - start
+        user = await request.auser()
+        return self._store(request, response, 'sample', trigger, elapsed, sampler.samples,
+                           self._folded_writer(sampler), user)
+
+    @staticmethod
+    def _interval():
+        return _setting('PROFILE_INTERVAL_MS', 5) / 1000
+
+    @staticmethod
+    def _folded_writer(sampler):
+        def write_data(path):
+            with open(path, 'w') as f:
+                for stack, count in sampler.stacks.most_common():
+                    f.write(f'{stack} {count}\n')
+        return write_data
+
+    def _store(self, request, response, mode, trigger, elapsed, samples, write_data, user):
+        match = getattr(request, 'resolver_match', None)
+        meta = {
+            'mode': mode,
+            'trigger': trigger,
+            'view': (match.url_name or match.view_name) if match else 'unmatched',
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'duration_ms': round(elapsed * 1000, 2),
+            'samples': samples,
+            'user_id': user.pk if user is not None and user.is_authenticated else None,
+            'created_at': timezone.now().isoformat(),
+        }
+        try:
+            response['X-DS-Profile-Id'] = save(meta, write_data)
+        except OSError:
+            logger.exception('Could not store profile for %s', request.path)
+        return response
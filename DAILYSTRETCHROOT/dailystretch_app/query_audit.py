@@ -0,0 +1,126 @@
+"""Spot N+1 query patterns.
+
+An N+1 shows up as the same statement run once per row of an earlier result:
+identical SQL apart from its parameters. ``QueryRecorder`` reduces every query
+a block of code runs to its *shape* (literals and ``IN`` lists collapsed) and
+reports the shapes seen ``threshold`` or more times, with the app code that
+issued them.
+
+``QueryAuditMiddleware`` applies it to every request in DEBUG, logging a
+warning and listing the offenders in an ``X-DS-Repeated-Queries`` header;
+outside DEBUG it removes itself. The query-budget tests in ``tests.py`` use
+``QueryRecorder`` directly, since the test runner turns DEBUG off.
+"""
+import logging
+import os
+import re
+import sys
+from collections import Counter, defaultdict
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_THRESHOLD = 3
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r'\b\d+(?:\.\d+)?\b')
+_IN_LIST_RE = re.compile(r'\bIN \((?:\s*%s\s*,?)+\)', re.IGNORECASE)
+_VALUES_RE = re.compile(r'\bVALUES\s*(\((?:\s*%s\s*,?)+\)\s*,?\s*)+', re.IGNORECASE)
+_SPACE_RE = re.compile(r'\s+')
+
+
+def query_shape(sql):
+    """SQL with literals, ``IN`` lists and multi-row ``VALUES`` collapsed, so reruns compare equal."""
+    shape = _STRING_RE.sub('?', sql)
+    shape = _NUMBER_RE.sub('?', shape)
+    shape = _IN_LIST_RE.sub('IN (...)', shape)
+    shape = _VALUES_RE.sub('VALUES (...) ', shape)
+    return _SPACE_RE.sub(' ', shape).strip()
+
+
+def _caller():
+    # Innermost frame in this app (other than this module): the line that ran the query
+    frame = sys._getframe(2)
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if filename.startswith(APP_DIR) and filename != __file__ and '/tests' not in filename:
+            return f'{os.path.relpath(filename, os.path.dirname(APP_DIR))}:{frame.f_lineno}'
+        frame = frame.f_back
+    return None
+
+
+class QueryRecorder:
+    """Context manager recording the shape and calling line of each query on ``connection``."""
+
+    def __init__(self, using=connection):
+        self.connection = using
+        self.shapes = Counter()
+        self.callers = defaultdict(Counter)
+        self._wrapper = None
+
+    def __call__(self, execute, sql, params, many, context):
+        shape = query_shape(sql)
+        self.shapes[shape] += 1
+        self.callers[shape][_caller()] += 1
+        return execute(sql, params, many, context)
+
+    def __enter__(self):
+        self._wrapper = self.connection.execute_wrapper(self)
+        self._wrapper.__enter__()
+        return self
+
+    def __exit__(self, *exc):
+        return self._wrapper.__exit__(*exc)
+
+    @property
+    def count(self):
+        return sum(self.shapes.values())
+
+    def repeated(self, threshold=DEFAULT_THRESHOLD):
+        """[(shape, times, {caller: times})] for shapes run ``threshold`` or more times, worst first."""
+        return [(shape, n, dict(self.callers[shape]))
+                for shape, n in self.shapes.most_common() if n >= threshold]
+
+
+class QueryAuditMiddleware:
+    """Warn about likely N+1 patterns in each request; active only in DEBUG.
+
+    Sync and async capable, so it adds no thread hop to the ASGI stack.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.DEBUG:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.threshold = getattr(settings, 'QUERY_REPEAT_THRESHOLD', DEFAULT_THRESHOLD)
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        with QueryRecorder() as recorder:
+            response = self.get_response(request)
+        return self._report(request, response, recorder)
+
+    async def __acall__(self, request):
+        with QueryRecorder() as recorder:
+            response = await self.get_response(request)
+        return self._report(request, response, recorder)
+
+    def _report(self, request, response, recorder):
+        repeated = recorder.repeated(self.threshold)
+        if repeated:
+            for shape, times, callers in repeated:
+                logger.warning('Possible N+1 in %s: %d x %s (from %s)', request.path, times, shape,
+                               ', '.join(f'{c or "?"} x{n}' for c, n in callers.items()))
+            response['X-DS-Repeated-Queries'] = '; '.join(
+                f'{times}x {next(iter(callers)) or "?"}' for _, times, callers in repeated)
+        return response
@@ -0,0 +1,233 @@
+"""Incremental daily rollups behind the admin analytics charts.
+
+``manage.py update_rollups`` calls ``update_all``, which folds rows added since
+the previous run into small per-day tables so the admin panel never scans
+``auth_user`` or ``Favorite``:
+
+* signups and favorites are append-only, so each keeps the highest id it has
+  counted in ``RollupState.last_id`` and reads the next id range in chunks.
+  Rows newer than ``lag`` are left for the next run, which lets transactions
+  that took a lower id but commit late land before the mark passes them;
+* active users are read as a ``last_login`` range since ``last_time``, and
+  ``ActiveUserMark`` makes a user count once per day however often they log in
+  (run at least daily: a user seen on two days between runs counts for the later);
+* settings have no history, so each run replaces today's snapshot of the
+  ``study_duration`` / ``break_duration`` / ``theme`` distributions.
+
+Each section locks its ``RollupState`` row, so overlapping runs serialize
+instead of counting the same rows twice.
+"""
+from collections import Counter
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Count, Max, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import (
+    ActiveUserMark, DailyFavoriteStats, DailySettingsSnapshot, DailyUserStats,
+    Favorite, RollupState, Routine, UserSettings,
+)
+
+SECTIONS = ('signups', 'active_users', 'favorites', 'settings')
+SETTINGS = ('study_duration', 'break_duration', 'theme')
+DEFAULT_LAG = timedelta(seconds=60)
+CHUNK_SIZE = 10000
+# Longest range the analytics endpoint serves
+MAX_DAYS = 366
+
+
+def _lock_state(name):
+    # Caller is inside transaction.atomic()
+    state, _ = RollupState.objects.select_for_update().get_or_create(name=name)
+    return state
+
+
+def _id_ceiling(qs, time_field, last_id, cutoff):
+    """Highest id after ``last_id`` that is safe to count: below the first row newer than ``cutoff``."""
+    qs = qs.filter(id__gt=last_id)
+    newer = (qs.filter(**{f'{time_field}__gt': cutoff}).order_by('id')
+             .values_list('id', flat=True).first())
+    if newer is not None:
+        qs = qs.filter(id__lt=newer)
+    return qs.aggregate(m=Max('id'))['m']
+
+
+def _add_daily_users(column, counts):
+    """Add per-day counts to one DailyUserStats column."""
+    if not counts:
+        return
+    current = dict(DailyUserStats.objects.filter(day__in=list(counts)).values_list('day', column))
+    DailyUserStats.objects.bulk_create(
+        [DailyUserStats(day=day, **{column: current.get(day, 0) + n}) for day, n in counts.items()],
+        update_conflicts=True, unique_fields=['day'], update_fields=[column])
+
+
+def update_signups(cutoff, chunk_size=CHUNK_SIZE):
+    added = 0
+    while True:
+        with transaction.atomic():
+            state = _lock_state('signups')
+            ceiling = _id_ceiling(User.objects.all(), 'date_joined', state.last_id, cutoff)
+            if ceiling is None:
+                return added
+            upper = min(ceiling, state.last_id + chunk_size)
+            rows = (User.objects.filter(id__gt=state.last_id, id__lte=upper)
+                    .annotate(day=TruncDate('date_joined')).order_by()
+                    .values('day').annotate(n=Count('id')).values_list('day', 'n'))
+            counts = dict(rows)
+            _add_daily_users('signups', counts)
+            added += sum(counts.values())
+            state.last_id = upper
+            state.save()
+
+
+def update_active_users(cutoff, chunk_size=CHUNK_SIZE):
+    with transaction.atomic():
+        state = _lock_state('active_users')
+        logins = User.objects.filter(last_login__lte=cutoff)
+        if state.last_time:
+            logins = logins.filter(last_login__gt=state.last_time)
+        logins = (logins.annotate(day=TruncDate('last_login')).order_by()
+                  .values_list('id', 'day').iterator(chunk_size=chunk_size))
+        counts = Counter()
+        batch = []
+        for row in logins:
+            batch.append(row)
+            if len(batch) >= chunk_size:
+                counts.update(_mark_active(batch))
+                batch = []
+        counts.update(_mark_active(batch))
+        _add_daily_users('active_users', counts)
+        state.last_time = cutoff
+        state.save()
+    return sum(counts.values())
+
+
+def _mark_active(rows):
+    """Record (user_id, day) logins; returns the days of users not yet counted for them."""
+    if not rows:
+        return Counter()
+    seen = dict(ActiveUserMark.objects.filter(user_id__in=[uid for uid, _ in rows])
+                .values_list('user_id', 'day'))
+    new = [(uid, day) for uid, day in rows if seen.get(uid) is None or seen[uid] < day]
+    ActiveUserMark.objects.bulk_create(
+        [ActiveUserMark(user_id=uid, day=day) for uid, day in new],
+        update_conflicts=True, unique_fields=['user'], update_fields=['day'])
+    return Counter(day for _, day in new)
+
+
+def update_favorites(cutoff, chunk_size=CHUNK_SIZE):
+    added = 0
+    while True:
+        with transaction.atomic():
+            state = _lock_state('favorites')
+            ceiling = _id_ceiling(Favorite.objects.all(), 'created_at', state.last_id, cutoff)
+            if ceiling is None:
+                return added
+            upper = min(ceiling, state.last_id + chunk_size)
+            rows = list(Favorite.objects.filter(id__gt=state.last_id, id__lte=upper)
+                        .annotate(day=TruncDate('created_at')).order_by()
+                        .values('day', 'routine_id', 'routine__category').annotate(n=Count('id'))
+                        .values_list('day', 'routine_id', 'routine__category', 'n'))
+            if rows:
+                current = {
+                    (day, rid): n for day, rid, n in DailyFavoriteStats.objects
+                    .filter(day__in={r[0] for r in rows}, routine_id__in={r[1] for r in rows})
+                    .values_list('day', 'routine_id', 'added')
+                }
+                DailyFavoriteStats.objects.bulk_create(
+                    [DailyFavoriteStats(day=day, routine_id=rid, category=(category or '')[:64],
+                                        added=current.get((day, rid), 0) + n)
+                     for day, rid, category, n in rows],
+                    update_conflicts=True, unique_fields=['day', 'routine'],
+                    update_fields=['added', 'category'])
+                added += sum(r[3] for r in rows)
+            state.last_id = upper
+            state.save()
+
+
+def update_settings(now):
+    today = timezone.localdate(now)
+    snapshot = []
+    for setting in SETTINGS:
+        rows = UserSettings.objects.order_by().values(setting).annotate(n=Count('id')).values_list(setting, 'n')
+        snapshot += [DailySettingsSnapshot(day=today, setting=setting, value=str(value)[:32], users=n)
+                     for value, n in rows]
+    with transaction.atomic():
+        state = _lock_state('settings')
+        DailySettingsSnapshot.objects.filter(day=today).delete()
+        DailySettingsSnapshot.objects.bulk_create(snapshot)
+        state.last_time = now
+        state.save()
+    return len(snapshot)
+
+
+def update_all(lag=DEFAULT_LAG, sections=SECTIONS, chunk_size=CHUNK_SIZE):
+    """Run the given sections; returns {section: rows folded in (or snapshot rows for settings)}."""
+    now = timezone.now()
+    cutoff = now - lag
+    updaters = {
+        'signups': lambda: update_signups(cutoff, chunk_size),
+        'active_users': lambda: update_active_users(cutoff, chunk_size),
+        'favorites': lambda: update_favorites(cutoff, chunk_size),
+        'settings': lambda: update_settings(now),
+    }
+    return {name: updaters[name]() for name in sections}
+
+
+def rebuild():
+    """Drop every rollup and high-water mark so the next run recounts from scratch."""
+    with transaction.atomic():
+        for model in (DailyUserStats, ActiveUserMark, DailyFavoriteStats, DailySettingsSnapshot, RollupState):
+            model.objects.all().delete()
+
+
+def analytics(days=30, top=10):
+    """Chart data for the admin panel, read from the rollup tables only."""
+    days = max(1, min(days, MAX_DAYS))
+    end = timezone.localdate()
+    start = end - timedelta(days=days - 1)
+    users = {row['day']: row for row in DailyUserStats.objects.filter(day__gte=start)
+             .values('day', 'signups', 'active_users')}
+    favorites_by_day = dict(DailyFavoriteStats.objects.filter(day__gte=start).order_by()
+                            .values('day').annotate(n=Sum('added')).values_list('day', 'n'))
+    series = []
+    for i in range(days):
+        day = start + timedelta(days=i)
+        row = users.get(day, {})
+        series.append({
+            'day': day.isoformat(),
+            'signups': row.get('signups', 0),
+            'active_users': row.get('active_users', 0),
+            'favorites': favorites_by_day.get(day, 0),
+        })
+    categories = list(DailyFavoriteStats.objects.filter(day__gte=start).order_by()
+                      .values('category').annotate(added=Sum('added')).order_by('-added', 'category'))
+    top_routines = list(DailyFavoriteStats.objects.filter(day__gte=start).order_by()
+                        .values('routine_id').annotate(added=Sum('added'))
+                        .order_by('-added', 'routine_id')[:top])
+    # The one non-rollup read: titles of the top routines by primary key
+    titles = dict(Routine.objects.filter(id__in=[r['routine_id'] for r in top_routines])
+                  .values_list('id', 'title'))
+    for row in top_routines:
+        row['title'] = titles.get(row['routine_id'], '(deleted)')
+    latest = DailySettingsSnapshot.objects.aggregate(day=Max('day'))['day']
+    distributions = {setting: [] for setting in SETTINGS}
+    if latest:
+        for setting, value, n in (DailySettingsSnapshot.objects.filter(day=latest)
+                                  .values_list('setting', 'value', 'users')):
+            distributions.setdefault(setting, []).append({'value': value, 'users': n})
+        for values in distributions.values():
+            values.sort(key=lambda v: (not v['value'].isdigit(), int(v['value']) if v['value'].isdigit() else 0,
+                                       v['value']))
+    states = {s.name: s.updated_at for s in RollupState.objects.all()}
+    return {
+        'days': series,
+        'favorites_by_category': categories,
+        'top_routines': top_routines,
+        'settings': {'day': latest.isoformat() if latest else None, 'distributions': distributions},
+        'updated_at': max(states.values()).isoformat() if states else None,
+    }
@@ -0,0 +1,112 @@
+"""Ranked full-text search over routines.
+
+Uses the index created by migration 0013: the ``search_vector`` tsvector
+column on Postgres, or the ``dailystretch_app_routine_fts`` FTS5 table on
+SQLite. Both are maintained by the database on every Routine write. Other
+backends (or SQLite builds without FTS5) fall back to unranked LIKE matching.
+
+Catalog filters (category, difficulty, duration, ids) are applied in the same
+query as the match, on the routine row, so ``limit`` counts filtered results.
+"""
+import re
+
+from django.core.exceptions import EmptyResultSet
+from django.db import connection
+from django.db.models import Q
+
+from .models import Routine
+
+FTS_TABLE = 'dailystretch_app_routine_fts'
+MAX_RESULTS = 100
+MAX_TERMS = 8
+
+_TERM_RE = re.compile(r'\w+', re.UNICODE)
+_fts_tables = {}
+
+
+def tokenize(text):
+    """Split user input into plain word terms; operators are never passed through."""
+    return _TERM_RE.findall(text or '')[:MAX_TERMS]
+
+
+def _has_fts_table():
+    alias = connection.alias
+    if alias not in _fts_tables:
+        _fts_tables[alias] = FTS_TABLE in connection.introspection.table_names()
+    return _fts_tables[alias]
+
+
+def _filter_sql(filters):
+    """Compile catalog filters to an ``AND ...`` fragment over the routine table's columns."""
+    if not filters:
+        return '', []
+    query = Routine.objects.filter(**filters).query
+    sql, params = query.where.as_sql(query.get_compiler(connection=connection), connection)
+    return ' AND ' + sql, list(params)
+
+
+def _postgres_ids(terms, filters, limit):
+    # Every term must match; the last one also as a prefix for search-as-you-type
+    tsquery = ' & '.join(terms[:-1] + [terms[-1] + ':*'])
+    where, params = _filter_sql(filters)
+    sql = (
+        "SELECT dailystretch_app_routine.id FROM dailystretch_app_routine, to_tsquery('english', %s) q "
+        f"WHERE dailystretch_app_routine.search_vector @@ q{where} "
+        "ORDER BY ts_rank_cd(dailystretch_app_routine.search_vector, q) DESC, dailystretch_app_routine.id LIMIT %s"
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [tsquery, *params, limit])
+        return [row[0] for row in cursor.fetchall()]
+
+
+def _sqlite_ids(terms, filters, limit):
+    match = ' '.join('"%s"' % t for t in terms[:-1]) + ' "%s"*' % terms[-1]
+    where, params = _filter_sql(filters)
+    # bm25 weights follow the column order: title, category, description, instructions
+    sql = (
+        f"SELECT {FTS_TABLE}.rowid FROM {FTS_TABLE} "
+        f"JOIN dailystretch_app_routine ON dailystretch_app_routine.id = {FTS_TABLE}.rowid "
+        f"WHERE {FTS_TABLE} MATCH %s{where} "
+        f"ORDER BY bm25({FTS_TABLE}, 10.0, 4.0, 4.0, 1.0), {FTS_TABLE}.rowid LIMIT %s"
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [match.strip(), *params, limit])
+        return [row[0] for row in cursor.fetchall()]
+
+
+def _fallback_ids(terms, filters, limit):
+    qs = Routine.objects.filter(**filters)
+    for term in terms:
+        qs = qs.filter(Q(title__icontains=term) | Q(category__icontains=term) |
+                       Q(description__icontains=term) | Q(instructions__icontains=term))
+    return list(qs.order_by('id').values_list('id', flat=True)[:limit])
+
+
+def search_ids(text, limit=MAX_RESULTS, filters=None):
+    """Return ids of routines matching ``text`` and ``filters``, best match first.
+
+    ``filters`` are lookups on Routine as built by ``catalog.parse_query``.
+    """
+    terms = tokenize(text)
+    if not terms:
+        return []
+    limit = max(1, min(limit, MAX_RESULTS))
+    filters = filters or {}
+    try:
+        if connection.vendor == 'postgresql':
+            return _postgres_ids(terms, filters, limit)
+        if connection.vendor == 'sqlite' and _has_fts_table():
+            return _sqlite_ids(terms, filters, limit)
+    except EmptyResultSet:
+        # The filters can never match, e.g. an empty ids= list
+        return []
+    return _fallback_ids(terms, filters, limit)
+
+
+def search_routines(text, fields, limit=MAX_RESULTS, filters=None):
+    """Return routine dicts (restricted to ``fields``) in rank order."""
+    ids = search_ids(text, limit, filters)
+    if not ids:
+        return []
+    rows = {row['id']: row for row in Routine.objects.filter(id__in=ids).values(*fields)}
+    return [rows[i] for i in ids if i in rows]
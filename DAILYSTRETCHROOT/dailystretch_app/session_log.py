@@ -0,0 +1,86 @@
+"""Batched ingestion for the SessionEvent log.
+
+Browsers queue finished sessions in localStorage and POST them in batches
+(see ``DS.logSession`` in main.js). The endpoint validates a batch and writes
+it with one ``bulk_create(ignore_conflicts=True)`` before answering, so a 2xx
+means the events are stored: the browser only then drops its copy, and a
+batch lost with a killed worker is simply sent again. Resent batches are
+dropped by the (user, client_id) unique constraint.
+"""
+import uuid
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import SessionEvent
+
+MAX_EVENTS_PER_BATCH = 100
+MAX_DURATION = 24 * 60 * 60
+# Events older than this (a long-offline browser) or this far in the future are rejected
+MAX_AGE = timedelta(days=30)
+MAX_SKEW = timedelta(minutes=5)
+
+
+def parse_time(value):
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        # JavaScript Date.now(): milliseconds since the epoch
+        try:
+            return datetime.fromtimestamp(value / 1000.0, tz=dt_timezone.utc)
+        except (OverflowError, OSError, ValueError):
+            return None
+    if isinstance(value, str):
+        parsed = parse_datetime(value)
+        if parsed is not None and timezone.is_naive(parsed):
+            parsed = timezone.make_aware(parsed, dt_timezone.utc)
+        return parsed
+    return None
+
+
+def parse_events(raw, user_id, now=None):
+    """Build unsaved SessionEvents from a decoded beacon batch.
+
+    Returns (events, rejected). Malformed individual events are counted and
+    skipped; a batch that is not a list, or is too large, raises ValueError.
+    """
+    if not isinstance(raw, list):
+        raise ValueError('Expected a list of events')
+    if len(raw) > MAX_EVENTS_PER_BATCH:
+        raise ValueError(f'At most {MAX_EVENTS_PER_BATCH} events per batch')
+    now = now or timezone.now()
+    kinds = {k for k, _ in SessionEvent.KIND_CHOICES}
+    events, rejected = [], 0
+    for item in raw:
+        try:
+            if not isinstance(item, dict) or item.get('kind') not in kinds:
+                raise ValueError
+            client_id = uuid.UUID(str(item['id']))
+            started_at = parse_time(item.get('started_at'))
+            if started_at is None or not (now - MAX_AGE <= started_at <= now + MAX_SKEW):
+                raise ValueError
+            duration = item.get('duration')
+            if isinstance(duration, bool) or not isinstance(duration, (int, float)):
+                raise ValueError
+            duration = int(duration)
+            if not 0 <= duration <= MAX_DURATION:
+                raise ValueError
+            routine_id = item.get('routine_id')
+            if routine_id is not None:
+                routine_id = int(routine_id)
+                if not 0 < routine_id < 2 ** 63:
+                    raise ValueError
+        except (KeyError, TypeError, ValueError):
+            rejected += 1
+            continue
+        events.append(SessionEvent(
+            user_id=user_id, client_id=client_id, kind=item['kind'],
+            routine_id=routine_id if item['kind'] == SessionEvent.KIND_ROUTINE else None,
+            started_at=started_at, duration_seconds=duration,
+            completed=bool(item.get('completed', True)), received_at=now))
+    return events, rejected
+
+
+def write_events(events):
+    SessionEvent.objects.bulk_create(events, batch_size=500, ignore_conflicts=True)
@@ -0,0 +1,86 @@
+"""Content-addressed file storage for profile pictures.
+
+Files are named after the SHA-256 of their bytes
+(``<upload dir>/sha256/ab/abcd...<ext>``), so identical uploads — above all
+the default picture every new user gets — are written once and shared by
+reference. Because a file may be referenced by many rows, ``delete`` is a
+no-op; unreferenced blobs are removed by ``manage.py dedupe_media``.
+"""
+import hashlib
+import os
+import tempfile
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+HASH_DIR = 'sha256'
+
+
+def content_name(dirname, digest, ext):
+    return '/'.join(p for p in (dirname, HASH_DIR, digest[:2], digest + ext.lower()) if p)
+
+
+def is_content_name(name):
+    return f'/{HASH_DIR}/' in f'/{name}'
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    content_addressed = True
+
+    def _save(self, name, content):
+        sha = hashlib.sha256()
+        for chunk in content.chunks():
+            sha.update(chunk)
+        dirname, basename = os.path.split(name)
+        name = content_name(dirname, sha.hexdigest(), os.path.splitext(basename)[1])
+        if self.exists(name):
+            return name
+
+        full_path = self.path(name)
+        directory = os.path.dirname(full_path)
+        os.makedirs(directory, exist_ok=True)
+        # Write to a temp file and rename into place: concurrent writers of the
+        # same bytes simply replace each other with identical content
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.upload-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for chunk in content.chunks():
+                    f.write(chunk)
+            os.chmod(tmp_path, self.file_permissions_mode or 0o644)
+            os.replace(tmp_path, full_path)
+        except BaseException:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+            raise
+        return name
+
+    def delete(self, name):
+        # Shared by reference; see dedupe_media for garbage collection
+        pass
+
+    def purge(self, name):
+        """Actually remove a blob; callers must ensure nothing references it."""
+        super().delete(name)
+
+
+def profile_picture_storage():
+    # No explicit location: follows MEDIA_ROOT/MEDIA_URL, including overrides
+    return ContentAddressedStorage()
+
+
+_default_picture_name = None
+
+
+def default_profile_picture_name():
+    """Storage name of the shared default profile picture, written at most once."""
+    global _default_picture_name
+    if _default_picture_name is None:
+        static_path = os.path.join(settings.BASE_DIR, 'static', 'dailystretch_app', 'images', 'profilepicture.png')
+        with open(static_path, 'rb') as f:
+            _default_picture_name = profile_picture_storage().save('profile_pictures/default.png', File(f))
+    return _default_picture_name
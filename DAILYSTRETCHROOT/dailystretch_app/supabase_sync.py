@@ -0,0 +1,175 @@
+"""Outbox-based Supabase profile sync.
+
+Views call ``enqueue_profile_sync`` inside the transaction that saves the
+profile, so a queued update exists exactly when the save committed. The
+``sync_supabase_profiles`` worker drains the outbox with ``OutboxWorker``:
+users with due rows are claimed in batches, and only each user's newest
+payload is sent, over one pooled HTTP session, with exponential backoff on
+failure. A circuit breaker stops hammering Supabase while it is failing.
+
+A claim leases all of a user's rows, and users with a leased row are skipped,
+so one user's updates are never in flight twice and cannot arrive out of
+order. A successful send deletes every row of that user up to the one sent,
+so an older row backing off after a failure never overwrites newer data.
+"""
+import json
+import random
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from .models import ProfileSyncOutbox
+
+TABLE = 'profiles'
+
+
+def is_configured():
+    return bool(getattr(settings, 'SUPABASE_URL', '') and getattr(settings, 'SUPABASE_ANON_KEY', ''))
+
+
+def build_payload(user, profile):
+    payload = {
+        'username': user.username,
+        'bio': profile.bio or '',
+    }
+    # include profile_picture url if present
+    try:
+        if profile.profile_picture:
+            payload['profile_picture'] = profile.profile_picture.url
+    except Exception:
+        pass
+    return payload
+
+
+def enqueue_profile_sync(user, profile):
+    """Queue the user's current profile for Supabase. Call inside the saving transaction."""
+    if not is_configured() or not user.email:
+        return None
+    return ProfileSyncOutbox.objects.create(user=user, email=user.email,
+                                            payload=build_payload(user, profile))
+
+
+class CircuitBreaker:
+    """Opens after ``threshold`` consecutive failures; after ``cooldown`` seconds
+    one trial request is let through (half-open) to decide whether to close."""
+
+    def __init__(self, threshold=5, cooldown=30.0, clock=time.monotonic):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.clock = clock
+        self.failures = 0
+        self.opened_at = None
+
+    @property
+    def is_open(self):
+        return self.opened_at is not None and self.clock() - self.opened_at < self.cooldown
+
+    def allow(self):
+        return not self.is_open
+
+    def retry_after(self):
+        if self.opened_at is None:
+            return 0.0
+        return max(0.0, self.cooldown - (self.clock() - self.opened_at))
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+
+    def record_failure(self):
+        self.failures += 1
+        if self.failures >= self.threshold:
+            self.opened_at = self.clock()
+
+
+class OutboxWorker:
+    # A claimed user is hidden from other workers for this long
+    LEASE = timedelta(seconds=60)
+
+    def __init__(self, session, base_url, anon_key, batch_size=100, timeout=5.0,
+                 backoff_base=2.0, backoff_max=600.0, breaker=None, log=None):
+        self.session = session
+        self.base_url = base_url.rstrip('/')
+        self.anon_key = anon_key
+        self.batch_size = batch_size
+        self.timeout = timeout
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.breaker = breaker or CircuitBreaker()
+        self.log = log or (lambda msg: None)
+        self.session.headers.update({
+            'apikey': anon_key,
+            'Authorization': f'Bearer {anon_key}',
+            'Content-Type': 'application/json',
+            'Prefer': 'return=minimal',
+        })
+
+    def backoff(self, attempts):
+        delay = min(self.backoff_max, self.backoff_base * (2 ** (attempts - 1)))
+        # Jitter so retries from many users do not line up
+        return timedelta(seconds=random.uniform(delay / 2, delay))
+
+    def claim(self):
+        """Lease users with due rows. Returns {user_id: all their rows, oldest first}."""
+        now = timezone.now()
+        leased = ProfileSyncOutbox.objects.filter(user_id=OuterRef('user_id'), leased_until__gt=now)
+        due = (ProfileSyncOutbox.objects.filter(next_attempt_at__lte=now).exclude(Exists(leased))
+               .order_by('id').values_list('user_id', flat=True)[:self.batch_size])
+        user_ids = list(dict.fromkeys(due))
+        if not user_ids:
+            return {}
+        with transaction.atomic():
+            # Locked in id order, so two workers after the same user queue up here
+            # instead of deadlocking, and the later one sees the other's lease
+            rows = list(ProfileSyncOutbox.objects.select_for_update()
+                        .filter(user_id__in=user_ids).order_by('id'))
+            by_user = {}
+            for row in rows:
+                by_user.setdefault(row.user_id, []).append(row)
+            claimed = {user_id: user_rows for user_id, user_rows in by_user.items()
+                       if not any(r.leased_until and r.leased_until > now for r in user_rows)}
+            if claimed:
+                ProfileSyncOutbox.objects.filter(
+                    id__in=[r.id for user_rows in claimed.values() for r in user_rows]
+                ).update(leased_until=now + self.LEASE)
+        return claimed
+
+    def send(self, row):
+        url = f"{self.base_url}/rest/v1/{TABLE}"
+        resp = self.session.patch(url, params={'email': f'eq.{row.email}'},
+                                  data=json.dumps(row.payload), timeout=self.timeout)
+        if resp.status_code not in (200, 204):
+            raise RuntimeError(f'HTTP {resp.status_code}: {resp.text[:200]}')
+
+    def drain_once(self):
+        """Process one batch. Returns (sent, failed, deferred) counts of users."""
+        sent = failed = deferred = 0
+        for user_id, user_rows in self.claim().items():
+            ids = [r.id for r in user_rows]
+            if not self.breaker.allow():
+                retry_at = timezone.now() + timedelta(seconds=self.breaker.retry_after())
+                ProfileSyncOutbox.objects.filter(id__in=ids).update(next_attempt_at=retry_at, leased_until=None)
+                deferred += 1
+                continue
+            # Coalesce: only the newest queued payload is sent
+            newest = user_rows[-1]
+            try:
+                self.send(newest)
+            except Exception as e:
+                self.breaker.record_failure()
+                attempts = max(r.attempts for r in user_rows) + 1
+                ProfileSyncOutbox.objects.filter(id__in=ids).update(
+                    attempts=attempts, last_error=str(e)[:1000],
+                    next_attempt_at=timezone.now() + self.backoff(attempts), leased_until=None)
+                self.log(f'Sync failed for user {user_id} (attempt {attempts}): {e}')
+                failed += 1
+            else:
+                self.breaker.record_success()
+                # Everything up to the sent row is now stale; rows queued after the claim stay
+                ProfileSyncOutbox.objects.filter(user_id=user_id, id__lte=newest.id).delete()
+                sent += 1
+        return sent, failed, deferred
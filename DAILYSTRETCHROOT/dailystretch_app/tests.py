@@ -1,3 +1,792 @@
-from django.test import TestCase
+"""Query budgets for every URL in dailystretch/urls.py.
 
-# Create your tests here.
+Each ``Case`` requests one URL and states exactly how many SQL queries it may
+run, counting the session and user lookups of a logged-in request. The same
+cases run against a small and a large seeded dataset
+(``SmallDatasetQueryBudgetTests`` / ``LargeDatasetQueryBudgetTests``), so a
+count that grows with the data, such as a query per favorite, fails one of
+the two. Every case is also checked for a query shape run
+``QUERY_REPEAT_THRESHOLD`` times or more (see query_audit.py).
+
+Tests run inside a transaction, so views that use ``transaction.atomic()``
+also count the SAVEPOINT / RELEASE pair it issues there. Caches start empty
+for every case: the budgets are for a cold cache.
+
+Adding a URL without adding a case fails ``test_every_url_has_a_budget``.
+
+``OutboxWorkerTests`` run the Supabase sync worker against a stub HTTP
+server on a background thread, and ``RollupTests`` run update_rollups
+repeatedly to check that its high-water marks neither drop nor recount rows.
+``SegmentCacheTests`` cover what the budgets cannot see with a cold cache:
+hits, 304s, and which saves change a segment's ETag.
+``CaseInsensitiveIdentifierTests`` cover login by username or email and
+the checks that keep both unique regardless of case.
+"""
+import importlib
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+import uuid
+from dataclasses import dataclass, field
+from datetime import datetime, time, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from unittest import mock
+from urllib.parse import parse_qs, urlsplit
+
+import requests
+
+from django.apps import apps
+from django.contrib.auth import SESSION_KEY, authenticate
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLPattern, get_resolver, reverse
+from django.utils import timezone
+
+from . import favorites, profiling, rollups, search
+from .models import (
+    ActiveUserMark, DailyFavoriteStats, DailyUserStats, Favorite, Profile, ProfileSyncOutbox,
+    RollupState, Routine, SessionEvent, UserSettings,
+)
+from .query_audit import DEFAULT_THRESHOLD, QueryRecorder
+from .supabase_sync import CircuitBreaker, OutboxWorker
+
+PASSWORD = 'budget-pass-123'
+# Smallest valid PNG (1x1, transparent)
+PNG = bytes.fromhex(
+    '89504e470d0a1a0a0000000d4948445200000001000000010806000000'
+    '1f15c4890000000d49444154789c6360000002000001e221bc330000000049454e44ae426082')
+
+
+@dataclass(frozen=True)
+class Case:
+    """One request and its query budget.
+
+    ``args`` and string values in ``data`` starting with '@' name entries of
+    the test's ``refs`` (ids of seeded rows), resolved at request time.
+    """
+    url: str
+    budget: int
+    method: str = 'get'
+    user: str = 'member'  # 'member', 'admin' or None for anonymous
+    args: tuple = ()
+    data: dict = field(default_factory=dict)
+    json: object = None
+    headers: dict = field(default_factory=dict)
+    status: int = 200
+
+
+CASES = (
+    # Public pages
+    Case('landing', 0, user=None),
+    Case('login', 0, user=None),
+    Case('login', 9, method='post', user=None, data={'username': 'member', 'password': PASSWORD}, status=302),
+    Case('login', 9, method='post', user=None, data={'username': 'Member@Example.com', 'password': PASSWORD},
+         status=302),
+    Case('logout', 4, status=302),
+    Case('register', 0, user=None),
+    Case('register', 11, method='post', user=None, status=302,
+         data={'username': 'newcomer', 'email': 'newcomer@example.com',
+               'password': PASSWORD, 'confirm_password': PASSWORD}),
+    Case('register', 1, method='post', user=None,
+         data={'username': 'MEMBER', 'email': 'Member@Example.com',
+               'password': PASSWORD, 'confirm_password': PASSWORD}),
+    Case('admin:index', 3, user='admin'),
+
+    # Shell and segments
+    Case('main', 4),
+    Case('dashboard', 3),
+    Case('dashboard', 3, headers={'X-DS-Segment': '1'}),
+    Case('library', 3),
+    Case('favorites', 3),
+    Case('profile', 3),
+    Case('profile', 6, method='post', data={'name': 'member', 'bio': 'Stretching daily'}, status=302),
+    Case('upload_profile_photo', 7, method='post', data={'profile_picture': 'png'}),
+    Case('settings', 3),
+    Case('settings', 4, method='post', data={'study_duration': '30', 'break_duration': '10'}, status=302),
+    Case('admin_panel', 2, user='admin'),
+
+    # Favorites
+    Case('favorite_toggle', 8, method='post', data={'routine_id': '@routine'}),
+    Case('favorite_toggle', 7, method='post', data={'routine_id': '@favorite'}),
+    Case('favorite_list', 3),
+    Case('api_favorites', 11, method='post', json={'add': ['@routine', '@routine2'], 'remove': ['@favorite']}),
+    Case('api_favorites', 11, method='post', json={'set': ['@routine', '@favorite']}),
+
+    # JSON API
+    Case('api_routines', 3),
+    Case('api_routines', 3, data={'category': 'stretch', 'limit': '20'}),
+    Case('api_search_routines', 4, data={'q': 'stretch'}),
+    Case('api_popular_routines', 3),
+    Case('api_sessions', 3),
+    Case('api_sessions', 3, method='post', data={'events': '@events'}),
+    Case('api_set_theme', 4, method='post', data={'theme': 'dark'}),
+    Case('api_bootstrap', 4),
+    Case('metrics', 2, user='admin'),
+
+    # Admin panel
+    Case('add_routine', 4, method='post', user='admin',
+         data={'title': 'Budget Stretch', 'category': 'stretch', 'difficulty': 'beginner',
+               'duration_minutes': '5', 'description': 'd', 'instructions': 'i'}),
+    Case('update_routine', 4, method='post', user='admin', args=('@routine',),
+         data={'title': 'Renamed', 'category': 'stretch', 'difficulty': 'beginner',
+               'duration_minutes': '7', 'description': 'd', 'instructions': 'i'}),
+    # The cascade also deletes the routine's RoutineStats row
+    Case('delete_routine', 7, method='post', user='admin', args=('@favorite',)),
+    Case('toggle_admin_status', 4, method='post', user='admin', data={'user_id': '@member', 'action': 'promote'}),
+    Case('admin_routines', 4, user='admin'),
+    Case('admin_routines', 4, user='admin', data={'q': 'stretch', 'sort': '-favorite_count'}),
+    Case('admin_routine', 3, user='admin', args=('@routine',)),
+    Case('admin_users', 4, user='admin'),
+    Case('admin_users', 4, user='admin', data={'sort': '-favorite_count'}),
+    Case('admin_analytics', 10, user='admin'),
+    Case('admin_profiles', 2, user='admin'),
+    Case('admin_profile', 2, user='admin', args=('@profile',)),
+)
+
+
+class QueryBudgetMixin:
+    """Seeds ``SIZE`` and runs every case in ``CASES`` against it."""
+    SIZE = None  # {'routines', 'users', 'favorites', 'sessions'}
+
+    @classmethod
+    def setUpClass(cls):
+        cls._media_dir = tempfile.mkdtemp()
+        cls._profile_dir = tempfile.mkdtemp()
+        cls._settings = override_settings(
+            CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+            STORAGES={
+                'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+                'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+            },
+            MEDIA_ROOT=cls._media_dir,
+            PROFILE_DIR=cls._profile_dir,
+            PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'],
+            SUPABASE_URL='', SUPABASE_ANON_KEY='',
+            METRICS_ENABLED=False,
+        )
+        cls._settings.enable()
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        cls._settings.disable()
+        shutil.rmtree(cls._media_dir, ignore_errors=True)
+        shutil.rmtree(cls._profile_dir, ignore_errors=True)
+
+    @classmethod
+    def setUpTestData(cls):
+        size = cls.SIZE
+        categories = ('stretch', 'breathing', 'eye-care', 'meditation')
+        Routine.objects.bulk_create([
+            Routine(title=f'Routine {i}', slug=f'routine-{i}', category=categories[i % 4],
+                    difficulty='beginner', duration_minutes=5 + i % 10, duration_text=f'{5 + i % 10} min',
+                    description=f'A {categories[i % 4]} routine', instructions='Breathe and stretch.')
+            for i in range(size['routines'])
+        ])
+        routine_ids = list(Routine.objects.order_by('id').values_list('id', flat=True))
+
+        cls.member = User.objects.create_user('member', 'member@example.com', PASSWORD)
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', PASSWORD)
+        others = User.objects.bulk_create([
+            User(username=f'user{i}', email=f'user{i}@example.com', last_login=timezone.now())
+            for i in range(size['users'])
+        ])
+        UserSettings.objects.bulk_create([UserSettings(user=u) for u in others])
+        Profile.objects.bulk_create([Profile(user=u) for u in others])
+        Favorite.objects.bulk_create([
+            Favorite(user=u, routine_id=rid) for u in others for rid in routine_ids[:size['favorites']]
+        ])
+        # The member's own favorites go through favorites.add so the counters match
+        favorites.add(cls.member.id, routine_ids[:size['favorites']])
+
+        now = timezone.now()
+        SessionEvent.objects.bulk_create([
+            SessionEvent(user=cls.member, client_id=uuid.uuid4(), kind=SessionEvent.KIND_ROUTINE,
+                         routine_id=routine_ids[i % len(routine_ids)], started_at=now - timedelta(minutes=i),
+                         duration_seconds=60, completed=True, received_at=now)
+            for i in range(size['sessions'])
+        ])
+        rollups.update_all(lag=timedelta(0))
+
+        cls.refs = {
+            'member': cls.member.id,
+            'favorite': routine_ids[0],
+            'routine': routine_ids[-1],
+            'routine2': routine_ids[-2],
+            'events': json.dumps([{'id': str(uuid.uuid4()), 'kind': 'study', 'started_at': now.isoformat(),
+                                   'duration': 1500}]),
+        }
+
+    def setUp(self):
+        cache.clear()
+        # Per-process lookups that run once per worker, not per request
+        search._has_fts_table()
+        self.refs = dict(self.refs, profile=profiling.save(
+            {'mode': 'sample', 'view': 'dashboard', 'method': 'GET', 'path': '/main/dashboard/'},
+            lambda path: open(path, 'w').write('main_view (dailystretch_app/views.py:1) 3\n')))
+
+    def resolve(self, value):
+        if isinstance(value, str) and value.startswith('@'):
+            return self.refs[value[1:]]
+        if isinstance(value, list):
+            return [self.resolve(v) for v in value]
+        if isinstance(value, dict):
+            return {k: self.resolve(v) for k, v in value.items()}
+        return value
+
+    def request(self, case):
+        url = reverse(case.url, args=[self.resolve(a) for a in case.args])
+        data = self.resolve(case.data)
+        if data.get('profile_picture') == 'png':
+            data['profile_picture'] = SimpleUploadedFile('avatar.png', PNG, content_type='image/png')
+        if case.json is not None:
+            return self.client.post(url, json.dumps(self.resolve(case.json)),
+                                    content_type='application/json', headers=case.headers)
+        return getattr(self.client, case.method)(url, data, headers=case.headers)
+
+    def test_query_budgets(self):
+        for case in CASES:
+            with self.subTest(url=case.url, method=case.method, data=case.data or case.json):
+                cache.clear()
+                sid = transaction.savepoint()
+                if case.user:
+                    self.client.force_login(self.member if case.user == 'member' else self.admin)
+                try:
+                    with CaptureQueriesContext(connection) as queries, QueryRecorder() as recorder:
+                        response = self.request(case)
+                finally:
+                    transaction.savepoint_rollback(sid)
+                    self.client.logout()
+                self.assertEqual(response.status_code, case.status)
+                sql = '\n'.join(q['sql'] for q in queries.captured_queries)
+                self.assertEqual(len(queries), case.budget,
+                                 f'{case.url}: {len(queries)} queries, budget {case.budget}:\n{sql}')
+                self.assertEqual(recorder.repeated(DEFAULT_THRESHOLD), [],
+                                 f'{case.url}: repeated query shapes (likely N+1)')
+
+
+class SmallDatasetQueryBudgetTests(QueryBudgetMixin, TestCase):
+    SIZE = {'routines': 5, 'users': 3, 'favorites': 2, 'sessions': 2}
+
+
+class LargeDatasetQueryBudgetTests(QueryBudgetMixin, TestCase):
+    SIZE = {'routines': 400, 'users': 60, 'favorites': 150, 'sessions': 300}
+
+
+class UrlCoverageTests(TestCase):
+    def test_every_url_has_a_budget(self):
+        covered = {case.url for case in CASES}
+        missing = [p.name for p in get_resolver().url_patterns
+                   if isinstance(p, URLPattern) and p.name and p.name not in covered]
+        self.assertEqual(missing, [], 'Add a Case to CASES for each new URL')
+
+
+class StubSupabase(ThreadingHTTPServer):
+    """Local stand-in for the Supabase REST API.
+
+    Records every PATCH as (email filter, payload) and answers with the next status
+    in ``statuses``, or 204 once they run out.
+    """
+
+    def __init__(self):
+        self.requests = []
+        self.statuses = []
+        super().__init__(('127.0.0.1', 0), _StubSupabaseHandler)
+
+    @property
+    def url(self):
+        return 'http://%s:%d' % self.server_address
+
+
+class _StubSupabaseHandler(BaseHTTPRequestHandler):
+    def do_PATCH(self):
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        email = parse_qs(urlsplit(self.path).query)['email'][0]
+        self.server.requests.append((email, json.loads(body)))
+        status = self.server.statuses.pop(0) if self.server.statuses else 204
+        self.send_response(status)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+class OutboxWorkerTests(TestCase):
+    """OutboxWorker against a real HTTP server on a background thread."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = StubSupabase()
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = User.objects.bulk_create([
+            User(username=f'sync{i}', email=f'sync{i}@example.com') for i in range(4)])
+
+    def setUp(self):
+        self.server.requests.clear()
+        self.server.statuses.clear()
+        self.now = 0.0
+        self.breaker = CircuitBreaker(threshold=3, cooldown=30.0, clock=lambda: self.now)
+        self.worker = OutboxWorker(requests.Session(), self.server.url, 'anon-key', backoff_base=10.0,
+                                   breaker=self.breaker)
+        self.addCleanup(self.worker.session.close)
+
+    def queue(self, user, bio):
+        return ProfileSyncOutbox.objects.create(user=user, email=user.email, payload={'bio': bio})
+
+    def make_due(self):
+        ProfileSyncOutbox.objects.update(next_attempt_at=timezone.now())
+
+    def test_coalesces_to_newest_payload_per_user(self):
+        first, second = self.users[:2]
+        for bio in ('one', 'two', 'three'):
+            self.queue(first, bio)
+        self.queue(second, 'only')
+
+        self.assertEqual(self.worker.drain_once(), (2, 0, 0))
+        self.assertEqual(self.server.requests, [
+            (f'eq.{first.email}', {'bio': 'three'}),
+            (f'eq.{second.email}', {'bio': 'only'}),
+        ])
+        self.assertFalse(ProfileSyncOutbox.objects.exists())
+
+    def test_server_error_backs_off(self):
+        row = self.queue(self.users[0], 'bio')
+        self.server.statuses.append(503)
+
+        before = timezone.now()
+        self.assertEqual(self.worker.drain_once(), (0, 1, 0))
+        row.refresh_from_db()
+        self.assertEqual(row.attempts, 1)
+        self.assertIn('HTTP 503', row.last_error)
+        # backoff_base=10 with jitter: between 5 and 10 seconds for the first retry
+        self.assertGreaterEqual(row.next_attempt_at, before + timedelta(seconds=5))
+        self.assertLessEqual(row.next_attempt_at, timezone.now() + timedelta(seconds=10))
+
+        # Not due yet: nothing is claimed or sent
+        self.assertEqual(self.worker.drain_once(), (0, 0, 0))
+        self.assertEqual(len(self.server.requests), 1)
+
+        self.make_due()
+        self.server.statuses.append(503)
+        self.assertEqual(self.worker.drain_once(), (0, 1, 0))
+        row.refresh_from_db()
+        self.assertEqual(row.attempts, 2)
+        self.assertGreaterEqual(row.next_attempt_at, timezone.now() + timedelta(seconds=9))
+
+        self.make_due()
+        self.assertEqual(self.worker.drain_once(), (1, 0, 0))
+        self.assertFalse(ProfileSyncOutbox.objects.exists())
+
+    def test_newer_row_supersedes_one_backing_off(self):
+        user = self.users[0]
+        self.queue(user, 'old')
+        self.server.statuses.append(503)
+        self.assertEqual(self.worker.drain_once(), (0, 1, 0))
+
+        # The newer row is due at once; sending it also retires the older row
+        self.queue(user, 'new')
+        self.assertEqual(self.worker.drain_once(), (1, 0, 0))
+        self.assertFalse(ProfileSyncOutbox.objects.exists())
+        self.make_due()
+        self.assertEqual(self.worker.drain_once(), (0, 0, 0))
+        self.assertEqual([payload for _, payload in self.server.requests], [{'bio': 'old'}, {'bio': 'new'}])
+
+    def test_user_in_flight_is_not_claimed_twice(self):
+        first, second = self.users[:2]
+        self.queue(first, 'one')
+        claimed = self.worker.claim()
+        self.assertEqual(list(claimed), [first.id])
+
+        # Another worker skips the leased user, even for a row queued since
+        other = OutboxWorker(requests.Session(), self.server.url, 'anon-key')
+        self.addCleanup(other.session.close)
+        self.queue(first, 'two')
+        self.queue(second, 'only')
+        self.assertEqual(list(other.claim()), [second.id])
+        self.assertEqual(other.claim(), {})
+
+    def test_circuit_breaker_opens_and_closes(self):
+        for user in self.users:
+            self.queue(user, 'bio')
+        self.server.statuses.extend([500, 500, 500])
+
+        # Three failures open the circuit; the fourth user is deferred without a request
+        self.assertEqual(self.worker.drain_once(), (0, 3, 1))
+        self.assertTrue(self.breaker.is_open)
+        self.assertEqual(len(self.server.requests), 3)
+        deferred = ProfileSyncOutbox.objects.get(user=self.users[3])
+        self.assertEqual(deferred.attempts, 0)
+        self.assertGreater(deferred.next_attempt_at, timezone.now() + timedelta(seconds=25))
+
+        # Still open: everything due is deferred
+        self.make_due()
+        self.assertEqual(self.worker.drain_once(), (0, 0, 4))
+        self.assertEqual(len(self.server.requests), 3)
+
+        # After the cooldown a trial request goes through, succeeds and closes the circuit
+        self.now += 30.0
+        self.make_due()
+        self.assertEqual(self.worker.drain_once(), (4, 0, 0))
+        self.assertFalse(self.breaker.is_open)
+        self.assertEqual(self.breaker.failures, 0)
+        self.assertEqual(len(self.server.requests), 7)
+        self.assertFalse(ProfileSyncOutbox.objects.exists())
+
+
+class RollupTests(TestCase):
+    """``manage.py update_rollups`` run repeatedly over changing data."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.routine = Routine.objects.create(title='Neck', slug='neck', category='stretch', difficulty='beginner',
+                                             duration_minutes=5, duration_text='5 min')
+
+    def days_ago(self, days, hour=9):
+        day = timezone.localdate() - timedelta(days=days)
+        return timezone.make_aware(datetime.combine(day, time(hour)))
+
+    def add_users(self, *joined):
+        start = User.objects.count()
+        return User.objects.bulk_create([
+            User(username=f'rollup{start + i}', date_joined=when) for i, when in enumerate(joined)])
+
+    def add_favorites(self, when, count):
+        users = self.add_users(*[when] * count)
+        created = Favorite.objects.bulk_create([Favorite(user=u, routine=self.routine) for u in users])
+        Favorite.objects.filter(id__in=[f.id for f in created]).update(created_at=when)
+
+    def daily_users(self, column):
+        return dict(DailyUserStats.objects.exclude(**{column: 0}).values_list('day', column))
+
+    def daily_favorites(self):
+        return dict(DailyFavoriteStats.objects.values_list('day', 'added'))
+
+    def all_counts(self):
+        return self.daily_users('signups'), self.daily_users('active_users'), self.daily_favorites()
+
+    def update(self, **options):
+        call_command('update_rollups', stdout=io.StringIO(), **options)
+
+    def test_second_run_does_not_double_count(self):
+        self.add_users(self.days_ago(2), self.days_ago(2), self.days_ago(1))
+        self.add_favorites(self.days_ago(1), 2)
+        User.objects.filter(username='rollup0').update(last_login=self.days_ago(1))
+
+        self.update(lag=0)
+        expected = ({self.days_ago(2).date(): 2, self.days_ago(1).date(): 3},
+                    {self.days_ago(1).date(): 1}, {self.days_ago(1).date(): 2})
+        self.assertEqual(self.all_counts(), expected)
+
+        self.update(lag=0)
+        self.assertEqual(self.all_counts(), expected)
+
+    def test_lag_leaves_newer_rows_for_next_run(self):
+        now = timezone.now()
+        old, new, late = self.add_users(now - timedelta(hours=2), now, now - timedelta(hours=2))
+
+        # The mark stops below the first row newer than the cutoff, so ``late``
+        # (an older date_joined behind a newer id) waits as well
+        self.update(lag=3600, only=['signups'])
+        self.assertEqual(RollupState.objects.get(name='signups').last_id, old.id)
+        self.assertEqual(sum(self.daily_users('signups').values()), 1)
+
+        self.update(lag=0, only=['signups'])
+        self.assertEqual(RollupState.objects.get(name='signups').last_id, late.id)
+        self.assertEqual(sum(self.daily_users('signups').values()), 3)
+
+    def test_active_user_counts_once_per_day(self):
+        first, second = self.add_users(self.days_ago(5), self.days_ago(5))
+        day1, day2 = self.days_ago(3).date(), self.days_ago(2).date()
+
+        def login_and_update(users, when):
+            User.objects.filter(id__in=[u.id for u in users]).update(last_login=when)
+            with mock.patch('django.utils.timezone.now', return_value=when + timedelta(minutes=30)):
+                self.update(lag=0, only=['active_users'])
+
+        login_and_update([first], self.days_ago(3, hour=9))
+        login_and_update([first, second], self.days_ago(3, hour=15))
+        self.assertEqual(self.daily_users('active_users'), {day1: 2})
+
+        login_and_update([first], self.days_ago(2, hour=9))
+        login_and_update([first], self.days_ago(2, hour=15))
+        self.assertEqual(self.daily_users('active_users'), {day1: 2, day2: 1})
+        self.assertEqual(dict(ActiveUserMark.objects.values_list('user_id', 'day')),
+                         {first.id: day2, second.id: day1})
+
+    def test_rebuild_counts_favorites_skipped_by_the_migration(self):
+        migration = importlib.import_module('dailystretch_app.migrations.0021_analytics_rollups')
+        migration_day = self.days_ago(3)
+        self.add_favorites(migration_day, 3)
+        migration.skip_undated_favorites(apps, None)
+        self.add_favorites(self.days_ago(1), 1)
+
+        self.update(lag=0)
+        self.assertEqual(self.daily_favorites(), {self.days_ago(1).date(): 1})
+
+        # As the --rebuild help says: the skipped favorites land on the migration's day
+        self.update(lag=0, rebuild=True)
+        expected = {migration_day.date(): 3, self.days_ago(1).date(): 1}
+        self.assertEqual(self.daily_favorites(), expected)
+        self.update(lag=0)
+        self.assertEqual(self.daily_favorites(), expected)
+
+
+# For tests that request pages outside QueryBudgetMixin
+PAGE_TEST_SETTINGS = dict(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    STORAGES={
+        'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+        'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+    },
+    PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'],
+    SUPABASE_URL='', SUPABASE_ANON_KEY='',
+    METRICS_ENABLED=False,
+)
+
+
+@override_settings(**PAGE_TEST_SETTINGS)
+class SegmentCacheTests(TestCase):
+    """``fragments.cached_segment``: what is served from the cache, and to whom."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.member = User.objects.create_user('member', 'member@example.com', PASSWORD)
+        cls.other = User.objects.create_user('other', 'other@example.com', PASSWORD)
+        cls.routine = Routine.objects.create(title='Neck', slug='neck', category='stretch', difficulty='beginner',
+                                             duration_minutes=5, duration_text='5 min')
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.member)
+
+    def get(self, name='dashboard', etag=None, fragment=False):
+        headers = {}
+        if etag:
+            headers['If-None-Match'] = etag
+        if fragment:
+            headers['X-DS-Segment'] = '1'
+        return self.client.get(reverse(name), headers=headers)
+
+    def assertRendered(self, response, rendered=True):
+        self.assertEqual(response.status_code, 200)
+        names = [t.name for t in response.templates]
+        if rendered:
+            self.assertIn('segments/dashboard.html', names)
+        else:
+            self.assertEqual(names, [], 'expected a cache hit')
+
+    def test_repeat_get_is_a_cache_hit_and_revalidates_to_304(self):
+        first = self.get()
+        self.assertRendered(first)
+        etag = first['ETag']
+        self.assertIn('private', first['Cache-Control'])
+
+        again = self.get()
+        self.assertRendered(again, rendered=False)
+        self.assertEqual(again['ETag'], etag)
+        self.assertEqual(again.content, first.content)
+
+        with CaptureQueriesContext(connection) as queries:
+            not_modified = self.get(etag=etag)
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified.content, b'')
+        # Session and user lookups only: neither the view nor the template ran
+        self.assertEqual(len(queries), 2)
+
+    def test_fragment_and_document_are_cached_separately(self):
+        document, fragment = self.get(), self.get(fragment=True)
+        self.assertRendered(document)
+        self.assertRendered(fragment)
+        self.assertNotEqual(document['ETag'], fragment['ETag'])
+        self.assertIn(b'<html', document.content)
+        self.assertNotIn(b'<html', fragment.content)
+        self.assertIn('X-DS-Segment', document['Vary'])
+
+        self.assertEqual(self.get().content, document.content)
+        self.assertEqual(self.get(fragment=True).content, fragment.content)
+        self.assertEqual(self.get(etag=fragment['ETag']).status_code, 200)
+        self.assertEqual(self.get(etag=fragment['ETag'], fragment=True).status_code, 304)
+
+    def test_saves_invalidate_the_segment(self):
+        changes = {
+            'user settings': lambda: UserSettings.objects.get(user=self.member).save(),
+            'profile': lambda: Profile.objects.get(user=self.member).save(update_fields=['bio']),
+            'favorite': lambda: favorites.add(self.member.id, [self.routine.id]),
+            'routine': lambda: Routine.objects.get(pk=self.routine.pk).save(),
+        }
+        for name, change in changes.items():
+            with self.subTest(change=name):
+                before = self.get()
+                with self.captureOnCommitCallbacks(execute=True):
+                    change()
+                after = self.get(etag=before['ETag'])
+                self.assertRendered(after)
+                self.assertNotEqual(after['ETag'], before['ETag'])
+
+    def test_other_users_saves_keep_the_cache(self):
+        etag = self.get()['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            favorites.add(self.other.id, [self.routine.id])
+            Profile.objects.get(user=self.other).save(update_fields=['bio'])
+        self.assertEqual(self.get(etag=etag).status_code, 304)
+
+    def browser(self):
+        client = Client(enforce_csrf_checks=True)
+        client.force_login(self.member)
+        return client
+
+    def test_browsers_of_one_user_post_with_their_own_csrf_token(self):
+        first, second = self.browser(), self.browser()
+        url = reverse('settings')
+        first.get(url)
+        page = second.get(url)
+        self.assertEqual(page.status_code, 200)
+        # Served from the cache, yet this browser still gets a CSRF cookie to post with
+        token = second.cookies['csrftoken'].value
+        self.assertNotEqual(token, first.cookies['csrftoken'].value)
+        self.assertNotIn(first.cookies['csrftoken'].value, page.content.decode())
+
+        response = second.post(url, {'csrfmiddlewaretoken': token, 'study_duration': '40'})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(UserSettings.objects.get(user=self.member).study_duration, 40)
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'],
+                   SUPABASE_URL='', SUPABASE_ANON_KEY='')
+class ProvisionUsersTests(TestCase):
+    """``manage.py provision_users``: bad rows are counted, the rest of their batch still lands."""
+
+    def setUp(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media, ignore_errors=True)
+        override = self.settings(MEDIA_ROOT=media)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def provision(self, rows):
+        with tempfile.NamedTemporaryFile('w', suffix='.ndjson', delete=False) as f:
+            f.write(''.join(json.dumps(row) + '\n' for row in rows))
+        self.addCleanup(os.remove, f.name)
+        out = io.StringIO()
+        call_command('provision_users', f.name, hash_workers=0, stdout=out)
+        return out.getvalue()
+
+    def test_invalid_rows_are_skipped(self):
+        out = self.provision([
+            {'username': 'good', 'password': PASSWORD, 'study_duration': 50, 'break_duration': '10'},
+            {'username': 'negative', 'study_duration': -5},
+            {'username': 'too_long_break', 'break_duration': 61},
+            {'username': 'bad_theme', 'theme': 'neon'},
+            {'username': 'numeric_password', 'password': 12345},
+            {'username': 'plain'},
+        ])
+        self.assertIn('2 created, 0 existing or duplicate, 4 invalid', out)
+        self.assertEqual(set(User.objects.values_list('username', flat=True)), {'good', 'plain'})
+        good = User.objects.get(username='good')
+        self.assertTrue(good.check_password(PASSWORD))
+        self.assertEqual((good.usersettings.study_duration, good.usersettings.break_duration), (50, 10))
+        self.assertFalse(User.objects.get(username='plain').has_usable_password())
+
+
+@override_settings(**PAGE_TEST_SETTINGS)
+class CaseInsensitiveIdentifierTests(TestCase):
+    """Usernames and emails are unique and matched ignoring case (backends.py, migration 0022)."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.member = User.objects.create_user('Member', 'Member@Example.com', PASSWORD)
+
+    def test_login_with_email_in_any_case(self):
+        for identifier in ('member@example.com', 'MEMBER@EXAMPLE.COM', ' Member@Example.com ', 'mEmBeR'):
+            with self.subTest(identifier=identifier):
+                self.assertEqual(authenticate(username=identifier, password=PASSWORD), self.member)
+        self.assertIsNone(authenticate(username='member@example.com', password='wrong-password'))
+
+        response = self.client.post(reverse('login'), {'username': 'MEMBER@example.COM', 'password': PASSWORD})
+        self.assertRedirects(response, reverse('main'), fetch_redirect_response=False)
+        self.assertEqual(int(self.client.session[SESSION_KEY]), self.member.pk)
+
+    def test_username_match_beats_another_accounts_email(self):
+        # One account is named like the other's email address
+        named = User.objects.create_user('sam@example.com', '', 'named-pass-123')
+        emailed = User.objects.create_user('sam', 'Sam@Example.com', 'emailed-pass-123')
+        self.assertEqual(authenticate(username='SAM@example.com', password='named-pass-123'), named)
+        self.assertIsNone(authenticate(username='SAM@example.com', password='emailed-pass-123'))
+        self.assertEqual(authenticate(username='sam', password='emailed-pass-123'), emailed)
+
+    def test_inactive_user_is_rejected(self):
+        User.objects.filter(pk=self.member.pk).update(is_active=False)
+        self.assertIsNone(authenticate(username='member', password=PASSWORD))
+        self.assertIsNone(authenticate(username='member@example.com', password=PASSWORD))
+        response = self.client.post(reverse('login'), {'username': 'member', 'password': PASSWORD})
+        self.assertRedirects(response, reverse('login'), fetch_redirect_response=False)
+        self.assertNotIn(SESSION_KEY, self.client.session)
+
+    def test_register_refuses_case_variants(self):
+        response = self.client.post(reverse('register'), {
+            'username': 'MEMBER', 'email': 'someone@example.com',
+            'password': PASSWORD, 'confirm_password': PASSWORD})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['errors'], {'username': 'Username already exists!'})
+
+        response = self.client.post(reverse('register'), {
+            'username': 'newcomer', 'email': 'MEMBER@example.com',
+            'password': PASSWORD, 'confirm_password': PASSWORD})
+        self.assertEqual(response.context['errors'], {'email': 'Email already in use!'})
+        self.assertEqual(User.objects.count(), 1)
+
+    def test_profile_rename_refuses_case_variant(self):
+        User.objects.create_user('other', 'other@example.com', PASSWORD)
+        self.client.force_login(self.member)
+        response = self.client.post(reverse('profile'), {'name': 'OTHER', 'bio': ''},
+                                    headers={'X-Requested-With': 'XMLHttpRequest'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['error'], 'username_taken')
+        self.member.refresh_from_db()
+        self.assertEqual(self.member.username, 'Member')
+
+        # A change of case to one's own name is allowed
+        response = self.client.post(reverse('profile'), {'name': 'MEMBER', 'bio': ''},
+                                    headers={'X-Requested-With': 'XMLHttpRequest'})
+        self.assertEqual(response.status_code, 200)
+        self.member.refresh_from_db()
+        self.assertEqual(self.member.username, 'MEMBER')
+
+    def test_migration_refuses_duplicates(self):
+        migration = importlib.import_module('dailystretch_app.migrations.0022_user_lower_unique')
+        schema_editor = SimpleNamespace(connection=connection)
+        # Undone with the test's transaction
+        migration.drop_lower_indexes(apps, schema_editor)
+        User.objects.create_user('MEMBER', 'someone@example.com')
+        User.objects.create_user('another', 'member@EXAMPLE.com')
+        User.objects.create_user('no-email-1', '')
+        User.objects.create_user('no-email-2', '')
+
+        with self.assertRaises(RuntimeError) as raised:
+            migration.create_lower_indexes(apps, schema_editor)
+        self.assertIn("username 'member'", str(raised.exception))
+        self.assertIn("email 'member@example.com'", str(raised.exception))
+
+        User.objects.filter(username__in=['MEMBER', 'another']).delete()
+        migration.create_lower_indexes(apps, schema_editor)
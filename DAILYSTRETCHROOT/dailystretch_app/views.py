@@ -4,32 +4,47 @@ from django.contrib.auth import login, logout, authenticate
 from django.contrib.auth.models import User
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
-from django.http import JsonResponse
+from django.http import FileResponse, JsonResponse, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
 from django.conf import settings
-from django.views.decorators.http import require_POST
-from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST, require_http_methods
+from django.views.decorators.csrf import csrf_exempt, ensure_csrf_cookie
+from django.utils.crypto import constant_time_compare
 from django.shortcuts import get_object_or_404
-from .models import Routine, UserSettings, Favorite
+from django.db import IntegrityError, transaction
+from .models import Routine, UserSettings, Favorite, SessionEvent
 from .models import Profile
 from .models import UserSettings, Favorite
+from . import catalog
+from . import search
+from . import favorites
+from . import session_log
+from . import rollups
+from . import admin_tables
+from . import metrics
+from . import profiling
+from .backends import users_matching
+from .bootstrap import build_bootstrap
+from .context import get_user_context
+from .fragments import cached_segment, render_segment
+from .supabase_sync import enqueue_profile_sync
+from .avatars import enqueue_avatar_job
+from .storage import default_profile_picture_name
 import os
 import json
+import logging
 from django.core.files import File
 
+logger = logging.getLogger(__name__)
+
 
 #helper for creating profile with default picture 
 def create_profile_with_default_picture(user):
     profile, created = Profile.objects.get_or_create(user=user)
     if created and not profile.profile_picture:
-        # Path to your static default image
-        default_image_path = os.path.join(
-            settings.BASE_DIR,
-            'static/dailystretch_app/images/profilepicture.png'
-        )
-        
-        # Open the file and save it to the ImageField
-        with open(default_image_path, 'rb') as f:
-            profile.profile_picture.save('default.png', File(f), save=True)
+        # The default image is stored once by content hash and shared by name
+        profile.profile_picture = default_profile_picture_name()
+        profile.save(update_fields=['profile_picture'])
     return profile
 
 
@@ -44,10 +59,12 @@ def register_view(request):
         # REMOVED: Old admin_code and secure_key logic to prevent vulnerability
 
         errors = {}
-        if User.objects.filter(username=username).exists():
-            errors['username'] = 'Username already exists!'
-        if User.objects.filter(email=email).exists():
-            errors['email'] = 'Email already in use!'
+        # One indexed query for both checks; both are unique regardless of case
+        for taken_username, taken_email in users_matching(username, email).values_list('username', 'email'):
+            if taken_username.lower() == username.lower():
+                errors['username'] = 'Username already exists!'
+            if email and taken_email.lower() == email.lower():
+                errors['email'] = 'Email already in use!'
         if password != confirm_password:
             errors['password'] = 'Passwords do not match!'
         elif len(password) < 8:
@@ -57,8 +74,13 @@ def register_view(request):
             context = {'errors': errors, 'username': username, 'email': email}
             return render(request, 'dailystretch_app/register.html', context)
 
-        # Create the user
-        user = User.objects.create_user(username=username, email=email, password=password)
+        # Create the user; the unique indexes catch a concurrent registration of the same name
+        try:
+            with transaction.atomic():
+                user = User.objects.create_user(username=username, email=email, password=password)
+        except IntegrityError:
+            context = {'errors': {'username': 'Username or email already in use!'}, 'username': username, 'email': email}
+            return render(request, 'dailystretch_app/register.html', context)
 
         # 3. FIRST USER STRATEGY (Updated)
         # If this is the ONLY user in the database (count is 1 because we just created them),
@@ -67,7 +89,7 @@ def register_view(request):
             user.is_superuser = True
             user.is_staff = True
             user.save()
-            print(f"DEBUG: First user registered. {user.username} promoted to Admin.")
+            logger.info('First user %s registered and promoted to admin', user.username)
             messages.success(request, 'Account created! You are the first user and have been promoted to Admin.')
         else:
             messages.success(request, 'Account created successfully! Please login.')
@@ -108,30 +130,35 @@ def logout_view(request):
 
 # ====== Home Page (Navbar + Island) ======
 @login_required(login_url='login')
+@ensure_csrf_cookie  # main.js posts favorites and session beacons with the cookie's token
 def main_view(request):
-    # Load theme preference from UserSettings for this user
-    theme = 'light'
-    try:
-        us, _ = UserSettings.objects.get_or_create(user=request.user)
-        theme = us.theme or 'light'
-    except Exception:
-        theme = 'light'
-    return render(request, 'dailystretch_app/main.html', { 'theme': theme })
+    # Settings, theme, profile summary and favorites are inlined into the shell
+    # so first paint needs no further API round trips
+    bootstrap = build_bootstrap(get_user_context(request))
+    return render(request, 'dailystretch_app/main.html', {
+        'theme': bootstrap['theme'],
+        'bootstrap': bootstrap,
+    })
 
 
 # ====== Segment Views ======
 @login_required(login_url='login')
+@cached_segment('segments/dashboard.html')
 def dashboard_segment(request):
-    # Load durations from UserSettings
-    user_settings, _ = UserSettings.objects.get_or_create(user=request.user)
+    # Load durations from UserSettings (read-only; defaults if the row is missing)
+    context = get_user_context(request)
+    user_settings = context.settings
     study_duration = user_settings.study_duration
     break_duration = user_settings.break_duration
     reminder_interval = 30
     
-    # Count the user's favorite routines
-    favorite_count = Favorite.objects.filter(user=request.user).count()
+    # Denormalized on the profile; count directly only if the profile row is missing
+    if context.profile.pk is not None:
+        favorite_count = context.profile.favorite_count
+    else:
+        favorite_count = Favorite.objects.filter(user=request.user).count()
     
-    return render(request, 'segments/dashboard.html', {
+    return render_segment(request, 'segments/dashboard.html', {
         'study_duration': study_duration,
         'break_duration': break_duration,
         'reminder_interval': reminder_interval,
@@ -143,10 +170,7 @@ def dashboard_segment(request):
 def library_segment(request):
     # Pass serialized routines into the template so the frontend can render DB data
     try:
-        qs = Routine.objects.all().values('id', 'title', 'description', 'category',
-                                          'difficulty', 'duration_text', 'duration_minutes', 'instructions')
-        import json
-        routines_json = json.dumps(list(qs))
+        routines_json = catalog.get_snapshot().body.decode('utf-8')
     except Exception:
         routines_json = '[]'
     # Optionally include Supabase keys from settings so the client can fetch directly
@@ -155,15 +179,16 @@ def library_segment(request):
         'SUPABASE_URL': getattr(settings, 'SUPABASE_URL', ''),
         'SUPABASE_ANON_KEY': getattr(settings, 'SUPABASE_ANON_KEY', ''),
     }
-    return render(request, 'segments/library.html', context)
+    return render_segment(request, 'segments/library.html', context)
 
 
 @login_required(login_url='login')
+@cached_segment('segments/favorites.html')
 def favorites_segment(request):
     fav_ids = Favorite.objects.filter(user=request.user).values_list('routine_id', flat=True)
     favorite_routines = Routine.objects.filter(id__in=fav_ids)
     context = {'favorite_routines': favorite_routines}
-    return render(request, 'segments/favorites.html', context)
+    return render_segment(request, 'segments/favorites.html', context)
 
 @login_required
 @require_POST
@@ -172,15 +197,25 @@ def favorite_toggle(request):
     if not routine_id:
         return JsonResponse({"ok": False, "error": "Missing ID"}, status=400)
     try:
-        routine = Routine.objects.get(pk=routine_id)
-    except Routine.DoesNotExist:
+        routine_id = int(routine_id)
+    except ValueError:
+        return JsonResponse({"ok": False, "error": "Invalid ID"}, status=400)
+    favorited = favorites.toggle(request.user.id, routine_id)
+    if favorited is None:
         return JsonResponse({"ok": False, "error": "Invalid ID"}, status=404)
-    fav, created = Favorite.objects.get_or_create(user=request.user, routine=routine)
-    if not created:
-        fav.delete()
-        return JsonResponse({"ok": True, "favorited": False})
-    else:
-        return JsonResponse({"ok": True, "favorited": True})
+    return JsonResponse({"ok": True, "favorited": favorited})
+
+@login_required
+@require_POST
+def api_favorites(request):
+    # Batched favorites: {"add": [ids], "remove": [ids]} or {"set": [ids]} as JSON.
+    # Applied in one transaction; responds with the resulting favorite ids.
+    try:
+        add_ids, remove_ids, replace = favorites.parse_request(request.body)
+    except ValueError as e:
+        return JsonResponse({'ok': False, 'error': str(e)}, status=400)
+    ids = favorites.apply(request.user.id, add_ids, remove_ids, replace)
+    return JsonResponse({'ok': True, 'favorites': ids, 'count': len(ids)})
 
 @login_required
 def favorite_list(request):
@@ -188,13 +223,13 @@ def favorite_list(request):
     return JsonResponse(list(favorites), safe=False)
 
 @login_required(login_url='login')
+@cached_segment('segments/profile.html')
 def profile_segment(request):
-    profile, created = Profile.objects.get_or_create(user=request.user)
+    context = get_user_context(request)
+    profile = context.profile
 
     if request.method == 'POST':
-        print("=== PROFILE UPDATE POST RECEIVED ===")  # for debugging
-        print(request.POST)
-        print(request.FILES)
+        profile = context.profile_for_write()
 
         name = request.POST.get('name', '').strip()
         bio = request.POST.get('bio', '').strip()
@@ -202,52 +237,47 @@ def profile_segment(request):
         profile_picture = request.FILES.get('profile_picture')
 
         profile.bio = bio
+        # Only the edited columns: a full save would write back favorite_count as
+        # read at the start of the request, undoing concurrent favorite toggles
+        edited = ['bio']
         # Update username if provided — validate uniqueness
         if name:
             if name != request.user.username:
-                if User.objects.filter(username=name).exclude(pk=request.user.pk).exists():
+                if users_matching(username=name).exclude(pk=request.user.pk).exists():
                     # Username taken
                     if request.headers.get('x-requested-with') == 'XMLHttpRequest':
                         return JsonResponse({'ok': False, 'error': 'username_taken', 'message': 'That username is already taken.'}, status=400)
                     else:
                         messages.error(request, 'That username is already taken.')
-                        return redirect('profile_segment')
+                        return redirect('profile')
                 try:
                     request.user.username = name
-                    request.user.save()
+                    with transaction.atomic():
+                        request.user.save()
                 except Exception:
                     # ignore save errors, continue
                     pass
         if date_of_birth:
             profile.date_of_birth = date_of_birth
+            edited.append('date_of_birth')
         if profile_picture:
             profile.profile_picture = profile_picture
+            edited.append('profile_picture')
 
-        profile.save()
-        print("=== PROFILE SAVED ===")
+        with transaction.atomic():
+            profile.save(update_fields=edited)
+            # Queued with the save; sync_supabase_profiles sends it to Supabase
+            enqueue_profile_sync(request.user, profile)
+            if profile_picture:
+                # Resized off-request by process_avatars
+                enqueue_avatar_job(profile)
+        logger.debug('Profile saved for user %s (new picture: %s)', request.user.pk, bool(profile_picture))
 
         # If the request is AJAX (upload from the profile card), return JSON with the new image URL
         is_ajax = request.headers.get('x-requested-with') == 'XMLHttpRequest'
-        # Attempt to sync to Supabase if configured
-        try:
-            SUPABASE_URL = getattr(settings, 'SUPABASE_URL', '')
-            SUPABASE_ANON_KEY = getattr(settings, 'SUPABASE_ANON_KEY', '')
-            if SUPABASE_URL and SUPABASE_ANON_KEY:
-                # call helper
-                try:
-                    update_supabase_profile(request.user, profile)
-                except Exception:
-                    pass
-        except Exception:
-            pass
         if is_ajax:
             # Build a sensible URL to return. If no profile picture, return empty string.
-            pic_url = ''
-            try:
-                if profile.profile_picture:
-                    pic_url = profile.profile_picture.url
-            except Exception:
-                pic_url = ''
+            pic_url = profile.avatar_url('md')
             # Return the updated values so client can use server-canonical data
             return JsonResponse({'ok': True, 'profile_picture_url': pic_url, 'username': request.user.username, 'bio': profile.bio})
 
@@ -255,16 +285,11 @@ def profile_segment(request):
         # If the form was submitted via fetch/AJAX (profile modal), return JSON
         if request.headers.get('x-requested-with') == 'XMLHttpRequest':
             # For modal/form AJAX saves return server-side canonical values
-            pic_url = ''
-            try:
-                if profile.profile_picture:
-                    pic_url = profile.profile_picture.url
-            except Exception:
-                pic_url = ''
+            pic_url = profile.avatar_url('md')
             return JsonResponse({'ok': True, 'username': request.user.username, 'bio': profile.bio, 'profile_picture_url': pic_url})
-        return redirect('profile_segment')  # make sure this matches your URL name
+        return redirect('profile')
 
-    return render(request, 'segments/profile.html', {'profile': profile})
+    return render_segment(request, 'segments/profile.html', {'profile': profile})
 
 
 
@@ -274,7 +299,6 @@ def upload_profile_photo(request):
     if request.method != 'POST':
         return JsonResponse({'ok': False, 'error': 'POST required'}, status=405)
 
-    profile, created = Profile.objects.get_or_create(user=request.user)
     profile_picture = request.FILES.get('profile_picture')
     if not profile_picture:
         return JsonResponse({'ok': False, 'error': 'no_file'}, status=400)
@@ -291,97 +315,30 @@ def upload_profile_photo(request):
         return JsonResponse({'ok': False, 'error': 'file_too_large', 'message': 'Image exceeds 5MB limit.'}, status=400)
 
     try:
+        profile = get_user_context(request).profile_for_write()
         profile.profile_picture = profile_picture
-        profile.save()
-        pic_url = ''
-        try:
-            if profile.profile_picture:
-                pic_url = profile.profile_picture.url
-        except Exception:
-            pic_url = ''
-        # Try to sync the profile photo/url to Supabase if configured
-        try:
-            SUPABASE_URL = getattr(settings, 'SUPABASE_URL', '')
-            SUPABASE_ANON_KEY = getattr(settings, 'SUPABASE_ANON_KEY', '')
-            if SUPABASE_URL and SUPABASE_ANON_KEY:
-                try:
-                    update_supabase_profile(request.user, profile)
-                except Exception:
-                    pass
-        except Exception:
-            pass
-        return JsonResponse({'ok': True, 'profile_picture_url': pic_url})
+        with transaction.atomic():
+            profile.save(update_fields=['profile_picture'])
+            # Queued with the save; sync_supabase_profiles sends it to Supabase
+            enqueue_profile_sync(request.user, profile)
+            # Resized off-request by process_avatars
+            enqueue_avatar_job(profile)
+        # The original is served until the variants are ready
+        return JsonResponse({'ok': True, 'profile_picture_url': profile.avatar_url('md'),
+                             'avatar_urls': profile.avatar_urls})
     except Exception as e:
         return JsonResponse({'ok': False, 'error': 'save_failed', 'message': str(e)}, status=500)
 
 
-def update_supabase_profile(user, profile):
-    """Attempt to PATCH the user's profile row in Supabase using the anon key.
-    Matches on email. This is best-effort and logs errors silently.
-    """
-    SUPABASE_URL = getattr(settings, 'SUPABASE_URL', '')
-    SUPABASE_ANON_KEY = getattr(settings, 'SUPABASE_ANON_KEY', '')
-    if not SUPABASE_URL or not SUPABASE_ANON_KEY:
-        return None
-
-    table = 'profiles'
-    # Build request URL to update rows where email matches
-    email = user.email
-    if not email:
-        return None
-
-    url = f"{SUPABASE_URL.rstrip('/')}/rest/v1/{table}?email=eq.{email}"
-    headers = {
-        'apikey': SUPABASE_ANON_KEY,
-        'Authorization': f'Bearer {SUPABASE_ANON_KEY}',
-        'Content-Type': 'application/json',
-        'Prefer': 'return=representation'
-    }
-    payload = {}
-    try:
-        # import requests lazily so Django can run without the dependency
-        try:
-            import requests
-        except ImportError:
-            try:
-                print('requests library not installed; skipping Supabase sync')
-            except Exception:
-                pass
-            return None
-
-        payload['username'] = user.username
-        payload['bio'] = profile.bio or ''
-        # include profile_picture url if present
-        try:
-            if profile.profile_picture:
-                payload['profile_picture'] = profile.profile_picture.url
-        except Exception:
-            pass
-
-        resp = requests.patch(url, headers=headers, data=json.dumps(payload), timeout=5)
-        if resp.status_code not in (200, 204):
-            # log but don't raise
-            try:
-                print('Supabase sync failed:', resp.status_code, resp.text)
-            except Exception:
-                pass
-        return resp
-    except Exception as e:
-        try:
-            print('Supabase update exception', e)
-        except Exception:
-            pass
-        return None
-
-
-
 @login_required(login_url='login')
+@cached_segment('segments/settings.html')
 def settings_segment(request):
-    # Use UserSettings for durations
-    user_settings, _ = UserSettings.objects.get_or_create(user=request.user)
-    # Ensure we have a profile available for the current user
-    profile, _ = Profile.objects.get_or_create(user=request.user)
+    # Use UserSettings for durations; settings and profile come from one joined query
+    context = get_user_context(request)
+    user_settings = context.settings
+    profile = context.profile
     if request.method == 'POST':
+        user_settings = context.settings_for_write()
         study = request.POST.get('study_duration')
         brk = request.POST.get('break_duration')
         # print("Received POST:", study, brk)
@@ -402,7 +359,7 @@ def settings_segment(request):
         # print("Saved settings:", user_settings.study_duration, user_settings.break_duration)
         return redirect('main')   # This matches the url name for /main/dashboard/
     # For template compatibility, provide a simple object with expected attributes
-    return render(request, 'segments/settings.html', {
+    return render_segment(request, 'segments/settings.html', {
         'user_settings': user_settings,
         'profile': profile,
     })
@@ -410,10 +367,115 @@ def settings_segment(request):
 
 @login_required(login_url='login')
 def api_routines(request):
-    # Return a simple JSON list of routines for the logged-in user to fetch
-    qs = Routine.objects.all().values('id', 'title', 'description', 'category',
-                                      'difficulty', 'duration_text', 'duration_minutes', 'instructions')
-    return JsonResponse(list(qs), safe=False)
+    # Return a simple JSON list of routines for the logged-in user to fetch.
+    # Filters (category, difficulty, min_duration, max_duration, ids), a
+    # fields= projection and keyset paging (cursor=<last id>, limit=) are
+    # applied in the database. With limit the next cursor is returned in the
+    # X-Next-Cursor header; without it the matching rows are streamed.
+    if catalog.wants_query(request.GET):
+        try:
+            query = catalog.parse_query(request.GET)
+        except ValueError as e:
+            return JsonResponse({'ok': False, 'error': str(e)}, status=400)
+        if query.limit is None:
+            response = StreamingHttpResponse(
+                catalog.stream_json_array(query),
+                content_type='application/json')
+        else:
+            rows, next_cursor = catalog.fetch_page(query)
+            response = JsonResponse(rows, safe=False)
+            if next_cursor is not None:
+                response['X-Next-Cursor'] = str(next_cursor)
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
+
+    # The full catalog comes pre-serialized from the catalog cache; a matching
+    # If-None-Match is answered with 304 without querying routines.
+    snapshot = catalog.get_snapshot()
+    response = get_conditional_response(request, etag=snapshot.etag)
+    if response is None:
+        response = HttpResponse(snapshot.body, content_type='application/json')
+    response['ETag'] = snapshot.etag
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+@login_required(login_url='login')
+def api_bootstrap(request):
+    # Same payload main_view inlines; lets the shell refresh its state in one call
+    response = JsonResponse(build_bootstrap(get_user_context(request)))
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+@login_required(login_url='login')
+def api_popular_routines(request):
+    # Most favorited routines, highest first; limit= defaults to 10 (max 50)
+    try:
+        limit = int(request.GET.get('limit', 10))
+    except ValueError:
+        return JsonResponse({'ok': False, 'error': 'limit must be an integer'}, status=400)
+    response = JsonResponse(favorites.most_favorited(limit), safe=False)
+    patch_cache_control(response, private=True, max_age=30)
+    return response
+
+
+@login_required(login_url='login')
+@require_http_methods(['GET', 'POST'])
+def api_sessions(request):
+    # POST: a batch of finished sessions from main.js, as an `events` form field
+    # (JSON list) so the CSRF token can travel in the same body. The batch is
+    # written before responding; the browser keeps its copy until it sees a 2xx.
+    # GET: the user's own history, newest first; from=/to= ISO datetimes, limit= (max 500).
+    if request.method == 'POST':
+        try:
+            raw = json.loads(request.POST.get('events') or '[]')
+            events, rejected = session_log.parse_events(raw, request.user.id)
+        except ValueError as e:
+            return JsonResponse({'ok': False, 'error': str(e)}, status=400)
+        session_log.write_events(events)
+        return JsonResponse({'ok': True, 'accepted': len(events), 'rejected': rejected})
+
+    qs = SessionEvent.objects.filter(user=request.user)
+    try:
+        for param, lookup in (('from', 'started_at__gte'), ('to', 'started_at__lt')):
+            if request.GET.get(param):
+                value = session_log.parse_time(request.GET[param])
+                if value is None:
+                    raise ValueError(f'{param} must be an ISO datetime')
+                qs = qs.filter(**{lookup: value})
+        limit = max(1, min(int(request.GET.get('limit', 100)), 500))
+    except ValueError as e:
+        return JsonResponse({'ok': False, 'error': str(e)}, status=400)
+    rows = list(qs.order_by('-started_at').values(
+        'kind', 'routine_id', 'started_at', 'duration_seconds', 'completed')[:limit])
+    return JsonResponse(rows, safe=False)
+
+
+def metrics_view(request):
+    # Prometheus scrape target, summed across all workers (see metrics.py)
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    allowed = request.user.is_authenticated and request.user.is_superuser
+    if token:
+        allowed = allowed or constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {token}')
+    else:
+        allowed = allowed or settings.DEBUG
+    if not allowed:
+        return HttpResponse('Forbidden', status=403, content_type='text/plain')
+    return HttpResponse(metrics.render_prometheus(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+@login_required(login_url='login')
+def api_search_routines(request):
+    # Ranked full-text search over title, category, description and instructions.
+    # Accepts q=, limit= (default 20) and the same filters and fields= projection as api_routines.
+    try:
+        query = catalog.parse_query(request.GET)
+    except ValueError as e:
+        return JsonResponse({'ok': False, 'error': str(e)}, status=400)
+    results = search.search_routines(request.GET.get('q', ''), query.fields, query.limit or 20,
+                                     query.filters)
+    return JsonResponse(results, safe=False)
 
 
 @login_required(login_url='login')
@@ -422,17 +484,74 @@ def admin_panel_segment(request):
     if not request.user.is_superuser:
         return redirect('dashboard')
     
-    # Fetch all routines (newest first)
-    routines = Routine.objects.all().order_by('-id')
-    
-    # Fetch all users (sorted by ID)
-    users = User.objects.all().order_by('id')
+    # Both tables are fetched page by page from api_admin_table by admin_panel.js
+    return render_segment(request, 'segments/admin_panel.html')
+
 
-    return render(request, 'segments/admin_panel.html', {
-        'routines': routines,
-        'users': users
+@login_required(login_url='login')
+def api_admin_table(request, table):
+    # One page of the routine or user table: q=, sort=, page=, page_size= (max 100)
+    if not request.user.is_superuser:
+        return JsonResponse({'ok': False, 'error': 'Unauthorized'}, status=403)
+    try:
+        return JsonResponse(admin_tables.get_page(table, request.GET))
+    except ValueError as e:
+        return JsonResponse({'ok': False, 'error': str(e)}, status=400)
+
+
+@login_required(login_url='login')
+def api_admin_routine(request, routine_id):
+    # Full routine for the edit form; the table pages leave out the long text fields
+    if not request.user.is_superuser:
+        return JsonResponse({'ok': False, 'error': 'Unauthorized'}, status=403)
+    routine = get_object_or_404(Routine.objects.values(
+        'id', 'title', 'category', 'difficulty', 'duration_minutes', 'description', 'instructions'), id=routine_id)
+    return JsonResponse(routine)
+
+
+@login_required(login_url='login')
+def api_admin_analytics(request):
+    # Chart data for the admin panel's Analytics tab; reads only the rollup
+    # tables kept by `manage.py update_rollups`. days= defaults to 30 (max 366).
+    if not request.user.is_superuser:
+        return JsonResponse({'ok': False, 'error': 'Unauthorized'}, status=403)
+    try:
+        days = int(request.GET.get('days', 30))
+    except ValueError:
+        return JsonResponse({'ok': False, 'error': 'days must be an integer'}, status=400)
+    response = JsonResponse(rollups.analytics(days))
+    patch_cache_control(response, private=True, max_age=60)
+    return response
+
+@login_required(login_url='login')
+def api_admin_profiles(request):
+    # Newest stored request profiles for the admin panel's Profiles tab
+    if not request.user.is_superuser:
+        return JsonResponse({'ok': False, 'error': 'Unauthorized'}, status=403)
+    return JsonResponse({
+        'results': profiling.list_profiles(),
+        'sample_rate': getattr(settings, 'PROFILE_SAMPLE_RATE', 0),
     })
 
+@login_required(login_url='login')
+def api_admin_profile(request, profile_id):
+    # One profile: folded stacks (sample mode) or top functions (cprofile mode);
+    # ?download=1 returns the raw file for flamegraph.pl / speedscope / snakeviz
+    if not request.user.is_superuser:
+        return JsonResponse({'ok': False, 'error': 'Unauthorized'}, status=403)
+    if request.method == 'DELETE':
+        if not profiling.PROFILE_ID_RE.match(profile_id):
+            return JsonResponse({'ok': False, 'error': 'Profile not found'}, status=404)
+        profiling.delete(profile_id)
+        return JsonResponse({'ok': True})
+    profile = profiling.get_profile(profile_id)
+    if profile is None:
+        return JsonResponse({'ok': False, 'error': 'Profile not found'}, status=404)
+    if request.GET.get('download'):
+        return FileResponse(open(profiling.data_path(profile), 'rb'), as_attachment=True,
+                            filename=profile['data_file'])
+    return JsonResponse(profile)
+
 @login_required(login_url='login')
 @require_POST
 def api_set_theme(request):
@@ -440,7 +559,7 @@ def api_set_theme(request):
         theme = request.POST.get('theme', '').lower().strip()
         if theme not in ('light', 'dark'):
             return JsonResponse({'ok': False, 'error': 'Invalid theme'}, status=400)
-        us, _ = UserSettings.objects.get_or_create(user=request.user)
+        us = get_user_context(request).settings_for_write()
         us.theme = theme
         us.save()
         return JsonResponse({'ok': True})
@@ -513,7 +632,9 @@ def update_routine(request, routine_id):
         routine.description = request.POST.get('description')
         routine.instructions = request.POST.get('instructions')
         
-        routine.save()
+        # Only the edited columns; the slug stays as it was (see Routine.slug)
+        routine.save(update_fields=['title', 'category', 'difficulty', 'duration_minutes', 'duration_text',
+                                    'description', 'instructions'])
         return JsonResponse({'ok': True})
     except Exception as e:
         return JsonResponse({'ok': False, 'error': str(e)})
@@ -36,7 +36,322 @@ document.addEventListener("DOMContentLoaded", () => {
   // Initial apply on page load
   applyDarkModeIfEnabled();
 
-  const loadPage = async (page) => {
+  // Per-user bootstrap state inlined by main_view; segments read favorites etc.
+  // from here instead of issuing their own requests
+  window.DS = window.DS || {};
+  try {
+    const el = document.getElementById('ds-bootstrap');
+    window.DS.bootstrap = el ? JSON.parse(el.textContent) : null;
+  } catch (_) { window.DS.bootstrap = null; }
+  window.DS.refreshBootstrap = async function () {
+    const resp = await fetch('/api/bootstrap/', { credentials: 'same-origin' });
+    if (resp.ok) window.DS.bootstrap = await resp.json();
+    return window.DS.bootstrap;
+  };
+  window.DS.setFavorite = function (routineId, favorited) {
+    const favs = window.DS.bootstrap && window.DS.bootstrap.favorites;
+    if (!favs) return;
+    const id = Number(routineId);
+    const ids = favs.ids.filter(x => x !== id);
+    if (favorited) ids.push(id);
+    favs.ids = ids;
+    favs.count = ids.length;
+  };
+
+  // Star clicks are queued, coalesced per routine (last click wins) and sent
+  // to /api/favorites/ as one batch once clicking pauses. Callers update the UI
+  // optimistically and get back the state the server settled on.
+  const FAVORITE_DEBOUNCE_MS = 300;
+  const FAVORITE_SEGMENTS = ['/main/favorites/', '/main/dashboard/'];
+  const pendingFavorites = new Map();  // routine id -> desired state
+  const favoriteOrigins = new Map();   // routine id -> state before the first queued click
+  let favoriteWaiters = [];
+  let favoriteTimer = null;
+
+  function csrfToken() {
+    const m = document.cookie.match(/(?:^|;\s*)csrftoken=([^;]+)/);
+    return m ? decodeURIComponent(m[1]) : '';
+  }
+
+  function isFavorite(id) {
+    const favs = window.DS.bootstrap && window.DS.bootstrap.favorites;
+    return !!(favs && favs.ids.includes(id));
+  }
+
+  async function flushFavorites(keepalive) {
+    clearTimeout(favoriteTimer);
+    favoriteTimer = null;
+    if (!pendingFavorites.size) return;
+    const add = [], remove = [];
+    pendingFavorites.forEach((fav, id) => (fav ? add : remove).push(id));
+    const origins = new Map(favoriteOrigins);
+    const waiters = favoriteWaiters;
+    pendingFavorites.clear();
+    favoriteOrigins.clear();
+    favoriteWaiters = [];
+
+    let result = { ok: false };
+    try {
+      const resp = await fetch('/api/favorites/', {
+        method: 'POST',
+        credentials: 'same-origin',
+        keepalive: !!keepalive,
+        headers: { 'Content-Type': 'application/json', 'X-CSRFToken': csrfToken() },
+        body: JSON.stringify({ add, remove })
+      });
+      result = await resp.json();
+    } catch (_) { result = { ok: false }; }
+
+    const favs = window.DS.bootstrap && window.DS.bootstrap.favorites;
+    if (result.ok && window.DS.invalidateSegments) {
+      // The favorites list and the dashboard's favorite count are cached segments
+      window.DS.invalidateSegments(FAVORITE_SEGMENTS);
+    }
+    if (result.ok && favs) {
+      // Server set, with clicks queued while this batch was in flight re-applied
+      favs.ids = result.favorites.slice();
+      favs.count = favs.ids.length;
+      pendingFavorites.forEach((fav, id) => window.DS.setFavorite(id, fav));
+    }
+    waiters.forEach(({ id, resolve }) => {
+      if (pendingFavorites.has(id)) {
+        resolve({ ok: true, pending: true, favorited: pendingFavorites.get(id) });
+      } else if (result.ok) {
+        resolve({ ok: true, favorited: result.favorites.includes(id) });
+      } else {
+        if (origins.has(id)) window.DS.setFavorite(id, origins.get(id));
+        resolve({ ok: false, favorited: origins.has(id) ? origins.get(id) : isFavorite(id) });
+      }
+    });
+  }
+
+  window.DS.queueFavorite = function (routineId, favorited) {
+    const id = Number(routineId);
+    if (!favoriteOrigins.has(id)) favoriteOrigins.set(id, isFavorite(id));
+    pendingFavorites.set(id, !!favorited);
+    window.DS.setFavorite(id, favorited);
+    clearTimeout(favoriteTimer);
+    favoriteTimer = setTimeout(flushFavorites, FAVORITE_DEBOUNCE_MS);
+    return new Promise(resolve => favoriteWaiters.push({ id, resolve }));
+  };
+  window.DS.flushFavorites = flushFavorites;
+
+  // Finished timer sessions are queued in localStorage (a reload or closed tab
+  // loses nothing) and sent to /api/sessions/ in batches. The server stores a
+  // batch before answering, so events leave the queue only after a 2xx; a batch
+  // whose answer never arrives (closed tab, failed worker) is sent again later.
+  // Each event carries a random id, so a batch that is sent twice is stored once.
+  const SESSION_QUEUE_KEY = 'ds_session_queue_' + ((window.DS.bootstrap && window.DS.bootstrap.user.id) || 'anon');
+  const SESSION_BATCH_SIZE = 20;
+  const SESSION_MAX_PER_REQUEST = 100;
+  const SESSION_FLUSH_MS = 60000;
+
+  function readSessionQueue() {
+    try { return JSON.parse(localStorage.getItem(SESSION_QUEUE_KEY)) || []; } catch (_) { return []; }
+  }
+  function writeSessionQueue(queue) {
+    try { localStorage.setItem(SESSION_QUEUE_KEY, JSON.stringify(queue.slice(-1000))); } catch (_) {}
+  }
+  function newSessionId() {
+    if (window.crypto && crypto.randomUUID) return crypto.randomUUID();
+    return 'xxxxxxxx-xxxx-4xxx-yxxx-xxxxxxxxxxxx'.replace(/[xy]/g, c => {
+      const r = Math.random() * 16 | 0;
+      return (c === 'x' ? r : (r & 0x3 | 0x8)).toString(16);
+    });
+  }
+
+  let sessionsInFlight = false;
+  function flushSessions() {
+    if (sessionsInFlight) return;
+    const queue = readSessionQueue();
+    if (!queue.length) return;
+    const batch = queue.slice(0, SESSION_MAX_PER_REQUEST);
+    const body = new URLSearchParams({ csrfmiddlewaretoken: csrfToken(), events: JSON.stringify(batch) });
+    const sentIds = new Set(batch.map(e => e.id));
+    sessionsInFlight = true;
+    // keepalive lets the request finish after the tab closes, like sendBeacon,
+    // but unlike sendBeacon its response says whether the batch was stored
+    fetch('/api/sessions/', { method: 'POST', body, credentials: 'same-origin', keepalive: true })
+      .then(resp => {
+        sessionsInFlight = false;
+        if (!resp.ok) return;
+        writeSessionQueue(readSessionQueue().filter(e => !sentIds.has(e.id)));
+        if (queue.length > batch.length) flushSessions();
+      })
+      .catch(() => { sessionsInFlight = false; });
+  }
+
+  // event: { kind: 'study'|'break'|'routine', started_at: ms epoch, duration: seconds,
+  //          completed: bool, routine_id?: number }
+  window.DS.logSession = function (event) {
+    const queue = readSessionQueue();
+    queue.push(Object.assign({ id: newSessionId(), completed: true }, event));
+    writeSessionQueue(queue);
+    if (queue.length >= SESSION_BATCH_SIZE) flushSessions();
+  };
+  window.DS.flushSessions = flushSessions;
+  setInterval(flushSessions, SESSION_FLUSH_MS);
+  flushSessions();
+
+  // Do not lose queued clicks or sessions when the tab is hidden or closed
+  document.addEventListener('visibilitychange', () => {
+    if (document.visibilityState === 'hidden') {
+      flushFavorites(true);
+      flushSessions();
+    }
+  });
+
+  // ===== Segments =====
+  // Segment HTML is kept in memory and in Cache Storage (per user, cleared on
+  // logout) and shown from there at once, then revalidated in the background:
+  // the server answers unchanged segments with 304s, and a changed one is
+  // re-rendered if it is still on screen (stale-while-revalidate). The other
+  // tabs are prefetched while the browser is idle. Segment scripts are
+  // downloaded and run once; every render then calls the segment's initX hook.
+  // Requests carry X-DS-Segment: 1, so the server sends a bare fragment; its
+  // stylesheets are moved into <head> once and only the current segment's are on.
+  const userId = (window.DS.bootstrap && window.DS.bootstrap.user.id) || 'anon';
+  const SEGMENT_CACHE_PREFIX = 'ds-segments-';
+  const SEGMENT_CACHE = SEGMENT_CACHE_PREFIX + 'v2-' + userId;
+  const hasCacheStorage = 'caches' in window;
+  const segmentMemory = new Map();    // page -> html
+  const segmentRequests = new Map();  // page -> in-flight fetch promise
+  const loadedScripts = new Set();    // absolute src of scripts already run
+  const segmentStyles = new Map();    // absolute href -> <link> moved into <head>
+  const STYLE_WAIT_MS = 1000;
+  let currentPage = null;
+  let renderSeq = 0;
+
+  if (hasCacheStorage) {
+    // Another account's segments must never be shown
+    caches.keys().then(names => names
+      .filter(n => n.startsWith(SEGMENT_CACHE_PREFIX) && n !== SEGMENT_CACHE)
+      .forEach(n => caches.delete(n))).catch(() => {});
+  }
+
+  async function readStoredSegment(page) {
+    if (!hasCacheStorage) return null;
+    try {
+      const cache = await caches.open(SEGMENT_CACHE);
+      const resp = await cache.match(page);
+      return resp ? await resp.text() : null;
+    } catch (_) { return null; }
+  }
+
+  function storeSegment(page, html) {
+    segmentMemory.set(page, html);
+    if (!hasCacheStorage) return;
+    caches.open(SEGMENT_CACHE)
+      .then(cache => cache.put(page, new Response(html, { headers: { 'Content-Type': 'text/html; charset=utf-8' } })))
+      .catch(() => {});
+  }
+
+  // Resolves to { html, cacheable }. Redirects (expired session, or the admin
+  // panel for a non-admin) are rendered but never cached.
+  function fetchSegment(page) {
+    if (segmentRequests.has(page)) return segmentRequests.get(page);
+    const request = fetch(page, { credentials: 'same-origin', headers: { 'X-DS-Segment': '1' } })
+      .then(async resp => {
+        const html = await resp.text();
+        const cacheable = resp.ok && !resp.redirected;
+        if (cacheable) storeSegment(page, html);
+        return { html, cacheable };
+      })
+      .finally(() => segmentRequests.delete(page));
+    segmentRequests.set(page, request);
+    return request;
+  }
+
+  async function cachedSegment(page) {
+    if (segmentMemory.has(page)) return segmentMemory.get(page);
+    const stored = await readStoredSegment(page);
+    if (stored !== null) segmentMemory.set(page, stored);
+    return stored;
+  }
+
+  window.DS.invalidateSegments = function (pages) {
+    const targets = pages || Array.from(segmentMemory.keys());
+    targets.forEach(page => segmentMemory.delete(page));
+    if (!hasCacheStorage) return Promise.resolve();
+    return caches.open(SEGMENT_CACHE).then(cache => {
+      if (!pages) return caches.delete(SEGMENT_CACHE);
+      return Promise.all(pages.map(page => cache.delete(page)));
+    }).catch(() => {});
+  };
+  window.DS.clearSegmentCache = function () {
+    segmentMemory.clear();
+    if (!hasCacheStorage) return Promise.resolve();
+    return caches.keys()
+      .then(names => Promise.all(names.filter(n => n.startsWith(SEGMENT_CACHE_PREFIX)).map(n => caches.delete(n))))
+      .catch(() => {});
+  };
+
+  function runScript(oldScript) {
+    const type = (oldScript.type || '').trim().toLowerCase();
+    if (type && type !== 'text/javascript' && type !== 'module' && type !== 'application/javascript') {
+      return Promise.resolve();  // data blocks such as application/json stay where they are
+    }
+    oldScript.remove();
+    if (oldScript.src) {
+      const src = new URL(oldScript.src, location.href).href;
+      if (loadedScripts.has(src)) return Promise.resolve();
+      loadedScripts.add(src);
+      return new Promise(resolve => {
+        const el = document.createElement('script');
+        if (oldScript.type) el.type = oldScript.type;
+        el.src = src;
+        el.onload = () => resolve();
+        el.onerror = (e) => { loadedScripts.delete(src); console.error('Failed loading script', src, e); resolve(); };
+        document.head.appendChild(el);
+      });
+    }
+    // Inline scripts carry per-render values (durations, config), so they run every time
+    const el = document.createElement('script');
+    if (oldScript.type) el.type = oldScript.type;
+    el.textContent = oldScript.textContent;
+    document.body.appendChild(el);
+    el.remove();
+    return Promise.resolve();
+  }
+
+  function initHookName(page) {
+    const parts = page.split('?')[0].split('/').filter(Boolean);
+    const last = (parts.pop() || '').split('.').shift();
+    if (!last) return null;
+    return { flag: '__' + last + '_inited', name: 'init' + last.split(/[-_]/).map(w => w.charAt(0).toUpperCase() + w.slice(1)).join('') };
+  }
+
+  // Move the fragment's stylesheets into <head> (once per href), switch off the
+  // other segments' sheets, and wait briefly for new ones to avoid a flash of unstyled content
+  function applySegmentStyles(fragment) {
+    const pending = [];
+    const wanted = new Set();
+    const shell = new Set(Array.from(document.head.querySelectorAll('link[rel="stylesheet"]:not([data-segment-style])'))
+      .map(l => l.href));
+    fragment.querySelectorAll('link[rel="stylesheet"]').forEach(link => {
+      link.remove();
+      const href = new URL(link.getAttribute('href'), location.href).href;
+      if (shell.has(href)) return;  // already part of the shell (main.css)
+      wanted.add(href);
+      if (!segmentStyles.has(href)) {
+        const el = document.createElement('link');
+        el.rel = 'stylesheet';
+        el.href = href;
+        el.setAttribute('data-segment-style', '');
+        pending.push(new Promise(resolve => { el.onload = el.onerror = resolve; }));
+        document.head.appendChild(el);
+        segmentStyles.set(href, el);
+      }
+    });
+    segmentStyles.forEach((el, href) => { el.disabled = !wanted.has(href); });
+    if (!pending.length) return Promise.resolve();
+    return Promise.race([Promise.all(pending), new Promise(resolve => setTimeout(resolve, STYLE_WAIT_MS))]);
+  }
+
+  async function renderSegment(page, html) {
+    const template = document.createElement('template');
+    template.innerHTML = html;
+    await applySegmentStyles(template.content);
     // Proactively stop any running dashboard timer loop before swapping segments
     try {
       if (window.DS && window.DS.dashboard && window.DS.dashboard.animationFrameId) {
@@ -44,62 +359,76 @@ document.addEventListener("DOMContentLoaded", () => {
         window.DS.dashboard.animationFrameId = null;
       }
     } catch (_) {}
-    try {
-      const response = await fetch(page);
-      const html = await response.text();
-      contentArea.innerHTML = html;
-
-      const scripts = Array.from(contentArea.querySelectorAll('script'));
-      const loadPromises = scripts.map((oldScript) => {
-        return new Promise((resolve) => {
-          const newScript = document.createElement('script');
-          if (oldScript.type) newScript.type = oldScript.type;
-          if (oldScript.src) {
-            newScript.src = oldScript.src;
-            newScript.async = false;
-            newScript.onload = () => resolve();
-            newScript.onerror = (e) => { console.error('Failed loading script', oldScript.src, e); resolve(); };
-            document.body.appendChild(newScript);
-          } else {
-            newScript.textContent = oldScript.textContent;
-            document.body.appendChild(newScript);
-            resolve();
-          }
-          try { oldScript.parentNode && oldScript.parentNode.removeChild(oldScript); } catch (e) {}
-        });
-      });
+    contentArea.replaceChildren(template.content);
 
-      await Promise.all(loadPromises);
+    // In document order, so inline scripts see the files loaded before them
+    for (const script of Array.from(contentArea.querySelectorAll('script'))) {
+      await runScript(script);
+    }
 
-      // If the page loads an initX function, run it (e.g. for dashboard, settings, etc)
+    // Run the segment's initX hook (e.g. initDashboard, initAdminPanel) on the fresh markup
+    const hook = initHookName(page);
+    if (hook && typeof window[hook.name] === 'function') {
       try {
-        const parts = page.split('/').filter(Boolean);
-        let last = parts.pop() || '';
-        last = last.split('.').shift();
-        if (last) {
-          const initName = 'init' + last.charAt(0).toUpperCase() + last.slice(1);
-          if (typeof window[initName] === 'function') {
-            try {
-              const flag = '__' + last + '_inited';
-              if (contentArea && Object.prototype.hasOwnProperty.call(contentArea, flag)) {
-                try { delete contentArea[flag]; } catch (e) { /* ignore */ }
-              }
-              window[initName](contentArea);
-            } catch (err) { console.error('Error running', initName, err); }
-          }
+        if (Object.prototype.hasOwnProperty.call(contentArea, hook.flag)) {
+          try { delete contentArea[hook.flag]; } catch (e) { /* ignore */ }
         }
-      } catch (e) {}
+        window[hook.name](contentArea);
+      } catch (err) { console.error('Error running', hook.name, err); }
+    }
 
-      // <<<< THIS is the important call for dark mode!
-      applyDarkModeIfEnabled();
+    // <<<< THIS is the important call for dark mode!
+    applyDarkModeIfEnabled();
+  }
 
+  const loadPage = async (page) => {
+    const seq = ++renderSeq;
+    currentPage = page;
+    try {
+      const cached = await cachedSegment(page);
+      if (seq !== renderSeq) return;
+      if (cached !== null) {
+        await renderSegment(page, cached);
+        fetchSegment(page).then(fresh => {
+          if (fresh.html !== cached && currentPage === page && seq === renderSeq) return renderSegment(page, fresh.html);
+        }).catch(() => {});
+        return;
+      }
+      const fresh = await fetchSegment(page);
+      if (seq !== renderSeq) return;  // another tab was clicked meanwhile
+      await renderSegment(page, fresh.html);
     } catch (err) {
+      if (seq !== renderSeq) return;
       contentArea.innerHTML = "<p>⚠️ Failed to load content.</p>";
       console.error(err);
     }
   };
+  window.DS.segments = { load: loadPage, fetch: fetchSegment };
 
-  if (tabs && tabs[0]) loadPage(tabs[0].getAttribute("data-page"));
+  // Warm the other tabs one at a time while the browser has nothing else to do
+  function prefetchSegments() {
+    const conn = navigator.connection;
+    if (conn && (conn.saveData || /2g/.test(conn.effectiveType || ''))) return;
+    const idle = window.requestIdleCallback || (cb => setTimeout(cb, 200));
+    const queue = Array.from(tabs).map(t => t.getAttribute('data-page'))
+      .filter(page => page && !segmentMemory.has(page));
+    const next = () => {
+      const page = queue.shift();
+      if (!page) return;
+      idle(() => {
+        (segmentMemory.has(page) ? Promise.resolve() : fetchSegment(page))
+          .catch(() => {}).then(next);
+      }, { timeout: 5000 });
+    };
+    next();
+  }
+
+  if (tabs && tabs[0]) {
+    loadPage(tabs[0].getAttribute("data-page")).then(() => {
+      if (document.readyState === 'complete') prefetchSegments();
+      else window.addEventListener('load', prefetchSegments, { once: true });
+    });
+  }
 
   tabs.forEach(tab => {
     tab.addEventListener("click", () => {
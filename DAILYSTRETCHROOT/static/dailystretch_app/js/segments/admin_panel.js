@@ -10,6 +10,405 @@
         const card = document.getElementById('tab-' + tabName);
         if (card) card.classList.add('active');
         if (btn && btn.classList) btn.classList.add('active');
+        if (tabName === 'analytics') loadAnalytics();
+        else if (tabName === 'profiles') loadProfiles();
+        else if (tables[tabName] && !tables[tabName].loaded) loadTable(tabName);
+    }
+
+    // ===== Routine and user tables, fetched one page at a time =====
+    const SEARCH_DEBOUNCE_MS = 250;
+    const tables = {
+        routines: { urlKey: 'routinesUrl', listId: 'routineList', page: 1, seq: 0, loaded: false, render: routineRow },
+        users: { urlKey: 'usersUrl', listId: 'userList', page: 1, seq: 0, loaded: false, render: userRow }
+    };
+
+    function textEl(tag, className, text) {
+        const el = document.createElement(tag);
+        if (className) el.className = className;
+        if (text !== undefined) el.textContent = text;
+        return el;
+    }
+
+    function button(className, label, onClick) {
+        const btn = textEl('button', 'btn btn-sm ' + className, label);
+        btn.type = 'button';
+        btn.addEventListener('click', onClick);
+        return btn;
+    }
+
+    function capitalize(s) { return s ? s.charAt(0).toUpperCase() + s.slice(1) : ''; }
+
+    function routineRow(r) {
+        const li = textEl('li', 'list-item');
+        li.id = 'routine-row-' + r.id;
+        const info = textEl('div', 'item-info');
+        info.append(textEl('h4', '', r.title),
+            textEl('p', '', `${capitalize(r.category)} • ${capitalize(r.difficulty)} • ${r.duration_text} • ★ ${r.favorite_count}`));
+        const actions = textEl('div', 'actions');
+        actions.append(button('btn-edit', 'Edit', () => editRoutineById(r.id)),
+            button('btn-delete', 'Delete', () => deleteRoutine(r.id)));
+        li.append(info, actions);
+        return li;
+    }
+
+    function userRow(u) {
+        const li = textEl('li', 'list-item');
+        const info = textEl('div', 'item-info');
+        const head = textEl('div');
+        head.style.cssText = 'display: flex; align-items: center; gap: 10px;';
+        head.append(textEl('h4', '', u.username),
+            textEl('span', 'badge ' + (u.is_superuser ? 'badge-admin' : 'badge-user'), u.is_superuser ? 'Admin' : 'User'));
+        const joined = new Date(u.date_joined).toLocaleDateString(undefined, { month: 'short', year: 'numeric' });
+        info.append(head, textEl('p', '', `${u.email} • Joined: ${joined} • ${u.favorite_count} favorites`));
+        const actions = textEl('div', 'actions');
+        if (u.id === (window.ADMIN_CONFIG || {}).currentUserId) {
+            const you = textEl('span', '', '(You)');
+            you.style.cssText = 'font-size: 0.8rem; color:#aaa; font-style: italic;';
+            actions.appendChild(you);
+        } else if (u.is_superuser) {
+            actions.appendChild(button('btn-demote', 'Remove Admin', () => toggleAdmin(u.id, 'demote')));
+        } else {
+            actions.appendChild(button('btn-promote', 'Make Admin', () => toggleAdmin(u.id, 'promote')));
+        }
+        li.append(info, actions);
+        return li;
+    }
+
+    function renderPager(name, data) {
+        const pager = document.querySelector(`.table-pager[data-table="${name}"]`);
+        if (!pager) return;
+        pager.innerHTML = '';
+        const go = page => { tables[name].page = page; loadTable(name); };
+        const prev = button('btn-secondary', '‹ Prev', () => go(data.page - 1));
+        prev.disabled = data.page <= 1;
+        const next = button('btn-secondary', 'Next ›', () => go(data.page + 1));
+        next.disabled = data.page >= data.pages;
+        const status = textEl('span', 'pager-status',
+            data.total ? `Page ${data.page} of ${data.pages} · ${data.total} total` : 'No results');
+        pager.append(prev, status, next);
+    }
+
+    async function loadTable(name) {
+        const table = tables[name];
+        const cfg = window.ADMIN_CONFIG || {};
+        const list = document.getElementById(table.listId);
+        const controls = document.querySelector(`.table-controls[data-table="${name}"]`);
+        if (!table || !list || !cfg[table.urlKey]) return;
+        const params = new URLSearchParams({ page: table.page });
+        if (controls) {
+            const q = controls.querySelector('.table-search').value.trim();
+            if (q) params.set('q', q);
+            params.set('sort', controls.querySelector('.table-sort').value);
+        }
+        // Only the latest request may render, whatever order responses arrive in
+        const seq = ++table.seq;
+        list.classList.add('loading');
+        try {
+            const resp = await fetch(`${cfg[table.urlKey]}?${params}`, { credentials: 'same-origin' });
+            const data = await resp.json();
+            if (seq !== table.seq) return;
+            if (!resp.ok) throw new Error(data.error || ('HTTP ' + resp.status));
+            if (!data.results.length && data.page > 1 && data.pages) {
+                // The page emptied (e.g. after a delete); show the new last page
+                table.page = data.pages;
+                return loadTable(name);
+            }
+            list.innerHTML = '';
+            if (!data.results.length) {
+                const empty = textEl('p', '', name === 'routines' ? 'No routines found.' : 'No users found.');
+                empty.style.cssText = 'color: #999; text-align: center;';
+                list.appendChild(empty);
+            }
+            data.results.forEach(row => list.appendChild(table.render(row)));
+            table.loaded = true;
+            renderPager(name, data);
+        } catch (err) {
+            if (seq !== table.seq) return;
+            console.error(err);
+            notifyAdmin('Could not load ' + name + '.', 'error', 'Error');
+        } finally {
+            if (seq === table.seq) list.classList.remove('loading');
+        }
+    }
+    window.DS.admin.loadTable = loadTable;
+
+    function bindTableControls() {
+        document.querySelectorAll('.table-controls').forEach(controls => {
+            if (controls.__bound) return;
+            controls.__bound = true;
+            const name = controls.getAttribute('data-table');
+            let timer = null;
+            const restart = () => { tables[name].page = 1; loadTable(name); };
+            controls.querySelector('.table-search').addEventListener('input', () => {
+                clearTimeout(timer);
+                timer = setTimeout(restart, SEARCH_DEBOUNCE_MS);
+            });
+            controls.querySelector('.table-sort').addEventListener('change', restart);
+        });
+    }
+
+    async function editRoutineById(id) {
+        try {
+            const resp = await fetch(`${window.ADMIN_CONFIG.routinesUrl}${id}/`, { credentials: 'same-origin' });
+            if (!resp.ok) throw new Error('HTTP ' + resp.status);
+            const r = await resp.json();
+            editRoutine(r.id, r.title, r.category, r.difficulty, r.duration_minutes, r.description, r.instructions);
+        } catch (err) {
+            console.error(err);
+            notifyAdmin('Could not load that exercise.', 'error', 'Error');
+        }
+    }
+    window.editRoutineById = editRoutineById;
+
+    // ===== Analytics tab: charts drawn from the rollups behind ADMIN_CONFIG.analyticsUrl =====
+    const SVG_NS = 'http://www.w3.org/2000/svg';
+
+    function svgEl(name, attrs) {
+        const el = document.createElementNS(SVG_NS, name);
+        Object.keys(attrs || {}).forEach(k => el.setAttribute(k, attrs[k]));
+        return el;
+    }
+
+    // Vertical bars over a time series: points = [{label, value}]
+    function columnChart(container, points) {
+        container.innerHTML = '';
+        if (!points.length) { container.textContent = 'No data yet.'; return; }
+        const w = 320, h = 120, max = Math.max(1, ...points.map(p => p.value));
+        const step = w / points.length, bar = Math.max(1, step * 0.8);
+        const svg = svgEl('svg', { viewBox: `0 0 ${w} ${h + 14}`, class: 'chart-svg', role: 'img' });
+        points.forEach((p, i) => {
+            const bh = Math.round((p.value / max) * h);
+            const rect = svgEl('rect', { x: i * step, y: h - bh, width: bar, height: bh, class: 'chart-bar' });
+            const title = svgEl('title');
+            title.textContent = `${p.label}: ${p.value}`;
+            rect.appendChild(title);
+            svg.appendChild(rect);
+        });
+        [[0, 'start'], [points.length - 1, 'end']].forEach(([i, anchor]) => {
+            const text = svgEl('text', { x: anchor === 'start' ? 0 : w, y: h + 12, 'text-anchor': anchor, class: 'chart-axis' });
+            text.textContent = points[i].label;
+            svg.appendChild(text);
+        });
+        const total = points.reduce((sum, p) => sum + p.value, 0);
+        container.appendChild(svg);
+        const caption = document.createElement('div');
+        caption.className = 'chart-caption';
+        caption.textContent = `Total ${total} · peak ${max}`;
+        container.appendChild(caption);
+    }
+
+    // Horizontal labelled bars: rows = [{label, value}]
+    function barList(container, rows) {
+        container.innerHTML = '';
+        if (!rows.length) { container.textContent = 'No data yet.'; return; }
+        const max = Math.max(1, ...rows.map(r => r.value));
+        rows.forEach(r => {
+            const row = document.createElement('div');
+            row.className = 'bar-row';
+            const label = document.createElement('span');
+            label.className = 'bar-label';
+            label.textContent = r.label;
+            label.title = r.label;
+            const track = document.createElement('span');
+            track.className = 'bar-track';
+            const fill = document.createElement('span');
+            fill.className = 'bar-fill';
+            fill.style.width = `${(r.value / max) * 100}%`;
+            track.appendChild(fill);
+            const value = document.createElement('span');
+            value.className = 'bar-value';
+            value.textContent = r.value;
+            row.append(label, track, value);
+            container.appendChild(row);
+        });
+    }
+
+    function renderAnalytics(data) {
+        const card = document.getElementById('tab-analytics');
+        if (!card) return;
+        const chart = name => card.querySelector(`[data-chart="${name}"]`);
+        ['signups', 'active_users', 'favorites'].forEach(key => {
+            const el = chart(key);
+            if (el) columnChart(el, data.days.map(d => ({ label: d.day, value: d[key] })));
+        });
+        const cats = chart('categories');
+        if (cats) barList(cats, data.favorites_by_category.map(c => ({ label: c.category || 'uncategorized', value: c.added })));
+        const top = chart('top_routines');
+        if (top) barList(top, data.top_routines.map(r => ({ label: r.title, value: r.added })));
+        Object.keys(data.settings.distributions).forEach(setting => {
+            const el = chart(setting);
+            if (el) barList(el, data.settings.distributions[setting].map(v => ({ label: v.value, value: v.users })));
+        });
+        const note = document.getElementById('analyticsUpdated');
+        if (note) {
+            note.textContent = data.updated_at
+                ? `Rollups last updated ${new Date(data.updated_at).toLocaleString()}`
+                : 'No rollups yet: run manage.py update_rollups.';
+        }
+    }
+
+    async function loadAnalytics() {
+        const cfg = window.ADMIN_CONFIG || {};
+        const select = document.getElementById('analyticsDays');
+        if (!cfg.analyticsUrl || !select) return;
+        if (!select.__bound) {
+            select.addEventListener('change', loadAnalytics);
+            select.__bound = true;
+        }
+        try {
+            const resp = await fetch(`${cfg.analyticsUrl}?days=${encodeURIComponent(select.value)}`, { credentials: 'same-origin' });
+            if (!resp.ok) throw new Error('HTTP ' + resp.status);
+            renderAnalytics(await resp.json());
+        } catch (err) {
+            console.error(err);
+            notifyAdmin('Could not load analytics.', 'error', 'Error');
+        }
+    }
+
+    // ===== Profiles tab: request profiles stored by ProfilingMiddleware =====
+    const FLAME_ROW_PX = 18;
+    const FLAME_MIN_PCT = 0.3;
+
+    function profileUrl(id) {
+        return `${(window.ADMIN_CONFIG || {}).profilesUrl}${encodeURIComponent(id)}/`;
+    }
+
+    function profileRow(p) {
+        const li = textEl('li', 'list-item');
+        const info = textEl('div', 'item-info');
+        const when = new Date(p.created_at).toLocaleString();
+        const samples = p.samples !== null && p.samples !== undefined ? ` • ${p.samples} samples` : '';
+        info.append(textEl('h4', '', `${p.method} ${p.path}`),
+            textEl('p', '', `${p.view} • ${p.status} • ${p.duration_ms} ms • ${p.mode} (${p.trigger})${samples} • ${when}`));
+        const actions = textEl('div', 'actions');
+        actions.append(button('btn-edit', 'View', () => showProfile(p.id)),
+            button('btn-delete', 'Delete', () => deleteProfile(p.id)));
+        li.append(info, actions);
+        return li;
+    }
+
+    async function loadProfiles() {
+        const cfg = window.ADMIN_CONFIG || {};
+        const list = document.getElementById('profileList');
+        if (!cfg.profilesUrl || !list) return;
+        const refresh = document.getElementById('profilesRefresh');
+        if (refresh && !refresh.__bound) {
+            refresh.addEventListener('click', loadProfiles);
+            refresh.__bound = true;
+        }
+        list.classList.add('loading');
+        try {
+            const resp = await fetch(cfg.profilesUrl, { credentials: 'same-origin' });
+            if (!resp.ok) throw new Error('HTTP ' + resp.status);
+            const data = await resp.json();
+            list.innerHTML = '';
+            if (!data.results.length) {
+                const empty = textEl('p', '', 'No profiles stored yet.');
+                empty.style.cssText = 'color: #999; text-align: center;';
+                list.appendChild(empty);
+            }
+            data.results.forEach(p => list.appendChild(profileRow(p)));
+        } catch (err) {
+            console.error(err);
+            notifyAdmin('Could not load profiles.', 'error', 'Error');
+        } finally {
+            list.classList.remove('loading');
+        }
+    }
+
+    async function deleteProfile(id) {
+        const cfg = window.ADMIN_CONFIG || {};
+        const resp = await fetch(profileUrl(id), { method: 'DELETE', headers: { 'X-CSRFToken': cfg.csrfToken || '' } });
+        if (!resp.ok) { notifyAdmin('Could not delete profile.', 'error', 'Error'); return; }
+        const detail = document.getElementById('profileDetail');
+        if (detail && detail.dataset.profileId === id) detail.hidden = true;
+        loadProfiles();
+    }
+
+    // Folded stacks ("a;b;c 12") to a call tree of sample counts
+    function buildFlameTree(stacks) {
+        const root = { name: 'all', value: 0, children: new Map() };
+        stacks.forEach(([stack, count]) => {
+            root.value += count;
+            let node = root;
+            stack.split(';').forEach(name => {
+                let child = node.children.get(name);
+                if (!child) { child = { name, value: 0, children: new Map() }; node.children.set(name, child); }
+                child.value += count;
+                node = child;
+            });
+        });
+        return root;
+    }
+
+    // Icicle chart: callers on top, width = share of samples; click a frame to zoom into it
+    function renderFlame(container, root, focus) {
+        container.innerHTML = '';
+        const total = focus.value || 1;
+        let depth = 0;
+        function place(node, level, left) {
+            const width = (node.value / total) * 100;
+            if (width < FLAME_MIN_PCT) return;
+            depth = Math.max(depth, level + 1);
+            const el = textEl('div', 'flame-frame', node.name);
+            el.style.cssText = `left:${left}%;width:${width}%;top:${level * FLAME_ROW_PX}px;`;
+            el.title = `${node.name}\n${node.value} samples (${(node.value / root.value * 100).toFixed(1)}% of request)`;
+            el.addEventListener('click', () => renderFlame(container, root, node === focus ? root : node));
+            container.appendChild(el);
+            let offset = left;
+            [...node.children.values()].sort((a, b) => b.value - a.value).forEach(child => {
+                place(child, level + 1, offset);
+                offset += (child.value / total) * 100;
+            });
+        }
+        place(focus, 0, 0);
+        container.style.height = `${depth * FLAME_ROW_PX}px`;
+    }
+
+    function renderFunctions(table, rows) {
+        table.innerHTML = '';
+        const head = textEl('tr');
+        ['Function', 'Calls', 'Own ms', 'Cumulative ms'].forEach(h => head.appendChild(textEl('th', '', h)));
+        table.appendChild(head);
+        rows.forEach(r => {
+            const tr = textEl('tr');
+            tr.append(textEl('td', '', r.function), textEl('td', '', r.calls),
+                textEl('td', '', r.own_ms), textEl('td', '', r.cumulative_ms));
+            table.appendChild(tr);
+        });
+    }
+
+    async function showProfile(id) {
+        const detail = document.getElementById('profileDetail');
+        if (!detail) return;
+        try {
+            const resp = await fetch(profileUrl(id), { credentials: 'same-origin' });
+            if (!resp.ok) throw new Error('HTTP ' + resp.status);
+            const p = await resp.json();
+            detail.hidden = false;
+            detail.dataset.profileId = id;
+            document.getElementById('profileTitle').textContent = `${p.method} ${p.path} · ${p.duration_ms} ms`;
+            document.getElementById('profileDownload').href = profileUrl(id) + '?download=1';
+            const flame = document.getElementById('profileFlame');
+            const functions = document.getElementById('profileFunctions');
+            const summary = document.getElementById('profileSummary');
+            flame.innerHTML = '';
+            functions.innerHTML = '';
+            if (p.mode === 'sample') {
+                const root = buildFlameTree(p.stacks);
+                summary.textContent = root.value
+                    ? `${root.value} samples. Width is the share of wall time; click a frame to zoom.`
+                    : 'The request finished before the first sample; lower PROFILE_INTERVAL_MS or use ?_profile=cprofile.';
+                if (root.value) renderFlame(flame, root, root);
+            } else {
+                summary.textContent = 'Top functions by cumulative time (cProfile). Download the .prof file for snakeviz.';
+                renderFunctions(functions, p.functions);
+            }
+            detail.scrollIntoView({ behavior: 'smooth', block: 'start' });
+        } catch (err) {
+            console.error(err);
+            notifyAdmin('Could not load profile.', 'error', 'Error');
+        }
     }
 
     window.editRoutine = function(id, title, category, difficulty, duration, description, instructions) {
@@ -72,7 +471,11 @@
             .then(data => {
                 if (data && data.ok) {
                     notifyAdmin('Saved successfully!', 'success', 'Success');
-                    setTimeout(() => location.reload(), 800);
+                    window.DS.admin.submitting = false;
+                    if (saveBtn) saveBtn.disabled = false;
+                    if (cancelBtn) cancelBtn.disabled = false;
+                    resetForm();
+                    loadTable('routines');
                 } else {
                     notifyAdmin('Error: ' + ((data && data.error) || 'Unknown error'), 'error', 'Error');
                     window.DS.admin.submitting = false;
@@ -103,6 +506,7 @@
                 const row = document.getElementById('routine-row-' + id);
                 if (row) row.remove();
                 notifyAdmin('Exercise deleted', 'error', 'Deleted');
+                loadTable('routines');
             } else {
                 notifyAdmin('Error: ' + ((data && data.error) || 'Unknown error'), 'error', 'Error');
             }
@@ -128,10 +532,18 @@
             if (data && data.ok) {
                 if (action === 'promote') notifyAdmin('User promoted to admin', 'success', 'Updated');
                 else notifyAdmin('Admin role removed', 'info', 'Updated');
-                setTimeout(() => location.reload(), 800);
+                loadTable('users');
             } else {
                 notifyAdmin('Error: ' + ((data && data.error) || 'Unknown error'), 'error', 'Error');
             }
         });
     }
-})();
\ No newline at end of file
+
+    // Called by main.js on every render; the markup is fresh, so reset and load the visible table
+    window.initAdminPanel = function() {
+        Object.keys(tables).forEach(name => { tables[name].page = 1; tables[name].loaded = false; });
+        bindTableControls();
+        loadTable('routines');
+    };
+    if (!(window.DS && window.DS.segments)) window.initAdminPanel();
+})();
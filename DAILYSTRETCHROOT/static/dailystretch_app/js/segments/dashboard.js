@@ -205,6 +205,13 @@ window.initDashboard = window.initDashboard || function initDashboard(root) {
         if (!state.isRunning) return;
         state.timerSeconds = 0;
         saveTimerState();
+        if (window.DS.logSession) {
+          window.DS.logSession({
+            kind: state.isStudy ? 'study' : 'break',
+            started_at: Date.now() - state.initialSeconds * 1000,
+            duration: Math.round(state.initialSeconds)
+          });
+        }
         if (Date.now() >= suppressNotifyUntil) {
           notifyFinish();
         }
@@ -492,10 +499,10 @@ window.initDashboard = window.initDashboard || function initDashboard(root) {
   } catch (err) { console.error('initDashboard error', err); }
 };
 
-// Auto-init: prefer content-area container to ensure proper re-init on segment switches
+// Auto-init only when opened on its own; main.js calls initDashboard on every render
 try {
   const contentArea = document.getElementById('content-area') || document;
-  if (contentArea.querySelector && contentArea.querySelector('#time-display')) {
+  if (!(window.DS && window.DS.segments) && contentArea.querySelector && contentArea.querySelector('#time-display')) {
     window.initDashboard(contentArea);
   }
 } catch (e) { console.warn('Dashboard auto-init failed', e); }
@@ -6,7 +6,7 @@
   function getTimer() { return window.DS.favorites.timerInterval || null; }
   function setTimer(v) { window.DS.favorites.timerInterval = v; }
 
-  function openRoutineModal(title, instructions, durationText, container) {
+  function openRoutineModal(title, instructions, durationText, container, routineId) {
   const favoritesTimerInterval = getTimer();
   if (favoritesTimerInterval) clearInterval(favoritesTimerInterval);
   const modalBg = document.getElementById('modalBg');
@@ -24,7 +24,7 @@
   if (modalStartBtn) modalStartBtn.style.display = '';
   if (modalStopBtn) modalStopBtn.style.display = 'none';
   const durationArg = durationText || '5 min';
-    if (modalStartBtn) modalStartBtn.onclick = function() { startFavoritesTimer(durationArg, title, container); };
+    if (modalStartBtn) modalStartBtn.onclick = function() { startFavoritesTimer(durationArg, title, container, routineId); };
     if (modalStopBtn) modalStopBtn.onclick = function() { closeFavoritesModal(container); };
   modalBg.onclick = function(e) { if (e.target === modalBg) closeFavoritesModal(); };
 }
@@ -41,8 +41,23 @@ function closeFavoritesModal() {
   if (timerDisplay) timerDisplay.innerText = '';
   const favoritesTimerInterval = getTimer();
   if (favoritesTimerInterval) clearInterval(favoritesTimerInterval);
+  logRoutineSession(false);
 }
-function startFavoritesTimer(duration, title, container) {
+// The routine timer currently running, logged once when it finishes or is stopped
+function logRoutineSession(completed) {
+  const session = window.DS.favorites.activeSession;
+  if (!session) return;
+  window.DS.favorites.activeSession = null;
+  if (!window.DS.logSession) return;
+  window.DS.logSession({
+    kind: 'routine',
+    routine_id: Number(session.routineId) || null,
+    started_at: session.startedAt,
+    duration: Math.round((Date.now() - session.startedAt) / 1000),
+    completed
+  });
+}
+function startFavoritesTimer(duration, title, container, routineId) {
   const modalStartBtn = document.getElementById('modalStartBtn');
   const modalStopBtn = document.getElementById('modalStopBtn');
   const timerArea = document.getElementById('timerArea');
@@ -54,11 +69,14 @@ function startFavoritesTimer(duration, title, container) {
   if (routineTitle) routineTitle.innerText = title;
   let seconds = durationSeconds(duration);
   updateFavoritesTimerDisplay(seconds);
+  logRoutineSession(false);
+  window.DS.favorites.activeSession = { routineId, startedAt: Date.now() };
   const interval = setInterval(function() {
     seconds--;
     updateFavoritesTimerDisplay(seconds);
     if (seconds <= 0) {
       clearInterval(interval);
+      logRoutineSession(true);
       if (timerDisplay) timerDisplay.innerText = 'Routine Complete!';
       setTimeout(closeFavoritesModal, 1500);
     }
@@ -108,6 +126,12 @@ function durationSeconds(dur) {
     try { return await resp.json(); } catch(_) { return { ok: false }; }
   }
 
+  function showEmptyIfNone(grid) {
+    if (grid.querySelectorAll('.lib-card').length === 0 && !grid.querySelector('.lib-empty')) {
+      grid.insertAdjacentHTML('beforeend', '<div class="lib-empty"><div style="text-align:center;padding:40px;color:#666"><div style="font-size:20px;margin-bottom:8px">No favorites yet</div><div style="font-size:13px">Add favorites from the Library by tapping the star.</div></div></div>');
+    }
+  }
+
 // Container-scoped initialization
   window.initFavorites = function(container) {
   const root = container || document;
@@ -122,7 +146,8 @@ function durationSeconds(dur) {
       const title = card ? card.querySelector('strong')?.textContent || '' : '';
       const desc = card ? card.querySelector('.lib-desc')?.textContent || '' : '';
       const dur = card ? (card.querySelector('.lib-tag.gray')?.textContent || '5 min') : '5 min';
-      openRoutineModal(title, desc, dur, root);
+      const routineId = card ? card.querySelector('.star')?.getAttribute('data-id') : null;
+      openRoutineModal(title, desc, dur, root, routineId);
     });
   });
 
@@ -132,47 +157,25 @@ function durationSeconds(dur) {
       star.__bound = true;
       star.addEventListener('click', async (e) => {
         e.stopPropagation();
-        const routineId = String(star.getAttribute('data-id'));
-        if (!routineId || routineId === 'null' || routineId === 'undefined') {
-          // Fallback: attempt to fetch by title if id missing
-          const title = star.closest('.lib-card')?.querySelector('strong')?.textContent || '';
-          if (!title) return;
-          try {
-            const resp = await fetch('/favorite-lookup-id/', {
-              method: 'POST',
-              headers: { 'X-CSRFToken': getCSRFToken(), 'Content-Type': 'application/x-www-form-urlencoded' },
-              credentials: 'same-origin',
-              body: `title=${encodeURIComponent(title)}`
-            });
-            const data = await resp.json();
-            if (data && data.id) {
-              star.setAttribute('data-id', String(data.id));
-            }
-          } catch(_) {}
-        }
-        const finalId = String(star.getAttribute('data-id'));
-        if (!finalId) return;
-        const res = await toggleFavorite(finalId);
-        if (res && res.ok) {
-          const card = star.closest('.lib-card');
-          if (res.favorited) {
-            // still favorited: reflect UI state
-            star.classList.add('active');
-            star.style.color = '#e7b900';
-          } else {
-            // unfavorited: remove card from favorites grid
-            star.classList.remove('active');
-            star.style.color = '#c6c6c6';
-            if (card && card.parentElement) {
-              card.parentElement.removeChild(card);
-            }
-            // If grid becomes empty, show empty message
-            const remaining = grid.querySelectorAll('.lib-card').length;
-            if (remaining === 0) {
-              grid.innerHTML = '<div class="lib-empty"><div style="text-align:center;padding:40px;color:#666"><div style="font-size:20px;margin-bottom:8px">No favorites yet</div><div style="font-size:13px">Add favorites from the Library by tapping the star.</div></div></div>';
-            }
-          }
+        const routineId = star.getAttribute('data-id');
+        if (!routineId) return;
+        const card = star.closest('.lib-card');
+        // Remove the card right away; main.js batches rapid unfavorites into one request
+        const placeholder = document.createComment('favorite');
+        if (card && card.parentElement) card.parentElement.replaceChild(placeholder, card);
+        showEmptyIfNone(grid);
+        const res = window.DS.queueFavorite
+          ? await window.DS.queueFavorite(routineId, false)
+          : await toggleFavorite(routineId);
+        if (res && res.ok && !res.favorited) {
+          if (window.DS.setFavorite) window.DS.setFavorite(routineId, false);
+          placeholder.remove();
+          return;
         }
+        // Not removed on the server (or re-favorited meanwhile): put the card back
+        const empty = grid.querySelector('.lib-empty');
+        if (empty) empty.remove();
+        if (card && placeholder.parentNode) placeholder.parentNode.replaceChild(card, placeholder);
       });
     });
 };
@@ -51,18 +51,61 @@ window.initLibrary = window.initLibrary || async function initLibrary(root) {
     if (root.__library_inited) return;
     root.__library_inited = true;
 
-    async function fetchApiRoutines() {
-      const resp = await fetch('/api/routines/', { credentials: 'same-origin' });
+    // Card fields only; long instructions are fetched when a routine is opened
+    const LIST_FIELDS = 'id,title,description,category,difficulty,duration_text,duration_minutes';
+
+    async function fetchApiRoutines(cat, diff) {
+      // Unfiltered first render can use the catalog inlined by the segment
+      if (!cat && !diff && Array.isArray(window.INIT_ROUTINES) && window.INIT_ROUTINES.length) {
+        const inline = window.INIT_ROUTINES;
+        window.INIT_ROUTINES = null;
+        return inline;
+      }
+      const params = new URLSearchParams();
+      if (cat) params.set('category', cat);
+      if (diff) params.set('difficulty', diff);
+      if (cat || diff) params.set('fields', LIST_FIELDS);
+      const qs = params.toString();
+      const resp = await fetch('/api/routines/' + (qs ? '?' + qs : ''), { credentials: 'same-origin' });
+      if (!resp.ok) return [];
+      return await resp.json();
+    }
+    async function fetchSearchResults(q, cat, diff) {
+      const params = new URLSearchParams({ q: q, fields: LIST_FIELDS, limit: '100' });
+      if (cat) params.set('category', cat);
+      if (diff) params.set('difficulty', diff);
+      const resp = await fetch('/api/routines/search/?' + params.toString(), { credentials: 'same-origin' });
       if (!resp.ok) return [];
       return await resp.json();
     }
+    async function fetchInstructions(routineId) {
+      const resp = await fetch('/api/routines/?fields=instructions&ids=' + encodeURIComponent(routineId), { credentials: 'same-origin' });
+      if (!resp.ok) return '';
+      const rows = await resp.json();
+      return (rows && rows[0] && rows[0].instructions) || '';
+    }
     async function fetchFavoriteList() {
+      const boot = window.DS && window.DS.bootstrap;
+      if (boot && boot.favorites) return boot.favorites.ids;
       const resp = await fetch('/favorite-list/', { credentials: 'same-origin' });
       if (!resp.ok) return [];
       return await resp.json();
     }
     
+    function paintStar(starEl, favorited) {
+      starEl.classList.toggle('active', favorited);
+      starEl.style.color = favorited ? "#e7b900" : "#c6c6c6";
+    }
+
     async function toggleFavorite(routineId, starEl) {
+      // Flip immediately; rapid clicks are coalesced into one batched request by main.js
+      const favorited = !starEl.classList.contains('active');
+      paintStar(starEl, favorited);
+      if (window.DS.queueFavorite) {
+        const result = await window.DS.queueFavorite(routineId, favorited);
+        if (!result.pending) paintStar(starEl, result.favorited);
+        return;
+      }
       const resp = await fetch('/favorite-toggle/', {
         method: 'POST',
         headers: {
@@ -73,15 +116,7 @@ window.initLibrary = window.initLibrary || async function initLibrary(root) {
         credentials: 'same-origin'
       });
       const result = await resp.json();
-      if (result.ok) {
-        if (result.favorited) {
-          starEl.classList.add('active');
-          starEl.style.color = "#e7b900";
-        } else {
-          starEl.classList.remove('active');
-          starEl.style.color = "#c6c6c6";
-        }
-      }
+      paintStar(starEl, result.ok ? result.favorited : !favorited);
     }
 
     function renderRoutineCard(r, favs) {
@@ -109,9 +144,16 @@ window.initLibrary = window.initLibrary || async function initLibrary(root) {
       // FIX 3: Clear grid before rendering to prevent doubling
       grid.innerHTML = '';
 
-      // fetch backend data
-      let routines = await fetchApiRoutines();
-      let favs = await fetchFavoriteList();
+      const catEl = root.querySelector('#category');
+      const diffEl = root.querySelector('#difficulty');
+      const searchEl = root.querySelector('#routineSearch');
+      const cat = catEl ? catEl.value : '';
+      const diff = diffEl ? diffEl.value : '';
+      const q = searchEl ? searchEl.value.trim() : '';
+
+      // fetch backend data (filtering and search happen server-side)
+      const routinesPromise = q ? fetchSearchResults(q, cat, diff) : fetchApiRoutines(cat, diff);
+      let [routines, favs] = await Promise.all([routinesPromise, fetchFavoriteList()]);
       routines = routines || [];
       favs = favs || [];
 
@@ -124,27 +166,14 @@ window.initLibrary = window.initLibrary || async function initLibrary(root) {
         difficulty: r.difficulty ?? '',
         duration_text: r.duration_text ?? r.duration ?? (r.duration_minutes ? String(r.duration_minutes) + ' min' : ''),
         duration_minutes: r.duration_minutes ?? (r.duration ? parseInt(String(r.duration).replace(/[^0-9]/g, ''), 10) : null),
-        instructions: r.instructions ?? ''
+        instructions: r.instructions ?? null
       }));
 
       // Store for modal lookup:
       root.__library_items = normalized;
 
-      const catEl = root.querySelector('#category');
-      const diffEl = root.querySelector('#difficulty');
-      const cat = catEl ? catEl.value : '';
-      const diff = diffEl ? diffEl.value : '';
-
-      let count = 0;
-      normalized.forEach(r => {
-        const catMatch = !cat || r.category === cat;
-        const diffMatch = !diff || r.difficulty === diff;
-        if (catMatch && diffMatch) {
-          grid.innerHTML += renderRoutineCard(r, favs);
-          count++;
-        }
-      });
-      if (count === 0) {
+      grid.innerHTML = normalized.map(r => renderRoutineCard(r, favs)).join('');
+      if (normalized.length === 0) {
         grid.innerHTML = '<div class="lib-empty"><div style="text-align:center;padding:40px;color:#666"><div style="font-size:20px;margin-bottom:8px">No routines found</div><div style="font-size:13px">Add routines via the admin, the /api/routines/ endpoint, or connect Supabase and add rows to your `routines` table.</div></div></div>';
       }
 
@@ -183,6 +212,14 @@ window.initLibrary = window.initLibrary || async function initLibrary(root) {
       if (!modalBg || !modalContent) return;
       modalBg.style.display = 'flex';
       modalContent.innerHTML = `<strong>${r.title}</strong><br/><br/><span>${r.instructions || r.description || ''}</span>`;
+      if (r.instructions === null) {
+        fetchInstructions(r.id).then(text => {
+          r.instructions = text;
+          if (text && modalBg.style.display !== 'none') {
+            modalContent.innerHTML = `<strong>${r.title}</strong><br/><br/><span>${text}</span>`;
+          }
+        }).catch(() => {});
+      }
       if (routineTitle) routineTitle.innerText = r.title;
       if (timerArea) timerArea.style.display = 'none';
       if (modalStartBtn) modalStartBtn.style.display = '';
@@ -190,7 +227,7 @@ window.initLibrary = window.initLibrary || async function initLibrary(root) {
       
       const durationArg = r.duration_text || (r.duration_minutes ? String(r.duration_minutes) + ' min' : '5 min');
       
-      if (modalStartBtn) modalStartBtn.onclick = function() { startTimer(durationArg, r.title); };
+      if (modalStartBtn) modalStartBtn.onclick = function() { startTimer(durationArg, r.title, r.id); };
       if (modalStopBtn) modalStopBtn.onclick = function() { closeModal(); };
       modalBg.onclick = function(e) { if (e.target === modalBg) closeModal(); };
     };
@@ -208,9 +245,26 @@ window.initLibrary = window.initLibrary || async function initLibrary(root) {
       if (timerDisplay) timerDisplay.innerText = '';
       const libraryTimerInterval = getLibTimer();
       if (libraryTimerInterval) clearInterval(libraryTimerInterval);
+      logRoutineSession(false);
     }
 
-    function startTimer(duration, title) {
+    // The routine timer currently running, logged once when it finishes or is stopped
+    let activeSession = null;
+    function logRoutineSession(completed) {
+      if (!activeSession) return;
+      const session = activeSession;
+      activeSession = null;
+      if (!window.DS.logSession) return;
+      window.DS.logSession({
+        kind: 'routine',
+        routine_id: Number(session.routineId) || null,
+        started_at: session.startedAt,
+        duration: Math.round((Date.now() - session.startedAt) / 1000),
+        completed
+      });
+    }
+
+    function startTimer(duration, title, routineId) {
       const modalStartBtn = root.querySelector('#modalStartBtn');
       const modalStopBtn = root.querySelector('#modalStopBtn');
       const timerArea = root.querySelector('#timerArea');
@@ -223,11 +277,14 @@ window.initLibrary = window.initLibrary || async function initLibrary(root) {
       
       let seconds = durationSeconds(duration);
       updateTimerDisplay(seconds);
+      logRoutineSession(false);
+      activeSession = { routineId, startedAt: Date.now() };
       const interval = setInterval(function() {
         seconds--;
         updateTimerDisplay(seconds);
         if (seconds <= 0) {
           clearInterval(interval);
+          logRoutineSession(true);
           const timerDisplay = root.querySelector('#timerDisplay');
           if (timerDisplay) timerDisplay.innerText = 'Routine Complete!';
           setTimeout(closeModal, 1500);
@@ -246,8 +303,16 @@ window.initLibrary = window.initLibrary || async function initLibrary(root) {
 
     const catEl = root.querySelector('#category');
     const diffEl = root.querySelector('#difficulty');
+    const searchEl = root.querySelector('#routineSearch');
     if (catEl) catEl.onchange = renderRoutines;
     if (diffEl) diffEl.onchange = renderRoutines;
+    if (searchEl) {
+      let searchTimer = null;
+      searchEl.oninput = function () {
+        if (searchTimer) clearTimeout(searchTimer);
+        searchTimer = setTimeout(renderRoutines, 250);
+      };
+    }
 
     // Initial render
     renderRoutines();
@@ -257,11 +322,11 @@ window.initLibrary = window.initLibrary || async function initLibrary(root) {
   }
 };
 
-// Boot on page load:
+// Boot on page load when opened on its own; main.js calls initLibrary on every render
 try {
   const grid = document.querySelector('#libraryGrid');
   // Check if grid exists and not already inited
-  if (grid && !document.__library_inited) {
+  if (grid && !document.__library_inited && !(window.DS && window.DS.segments)) {
       window.initLibrary(document);
   }
 } catch (e) { }
\ No newline at end of file
@@ -1,3 +1,16 @@
+// The segment HTML is cached per user, so the token comes from this browser's cookie
+function getCSRFCookie() {
+    const m = document.cookie.match(/(?:^|;\s*)csrftoken=([^;]+)/);
+    return m ? decodeURIComponent(m[1]) : '';
+}
+
+// Segments cached by main.js that show the username, bio or picture
+function forgetCachedProfileSegments() {
+    if (window.DS && window.DS.invalidateSegments) {
+        window.DS.invalidateSegments(['/main/profile/', '/main/dashboard/', '/main/settings/']);
+    }
+}
+
 // Initialize the profile segment behaviors for the current container
 function initProfileInternal(container) {
     // Query elements from the provided container to avoid stale references
@@ -7,6 +20,13 @@ function initProfileInternal(container) {
     const uploadBtn = container.querySelector('#uploadPicBtn');
     const fileInput = container.querySelector('#profile_picture_external');
 
+    // Point the avatar at a new URL; drops <picture> sources that would still win over img.src
+    function setProfileImage(imgEl, url) {
+        const picture = imgEl.parentElement && imgEl.parentElement.tagName === 'PICTURE' ? imgEl.parentElement : null;
+        if (picture) picture.querySelectorAll('source').forEach(src => src.remove());
+        imgEl.src = url + (url.indexOf('?') === -1 ? '?' : '&') + 't=' + Date.now();
+    }
+
     function safeOpenModal() {
         if (!modal) return;
         modal.classList.add('active');
@@ -93,20 +113,7 @@ function initProfileInternal(container) {
         fd.append('profile_picture', file);
 
 
-        let csrf = null;
-        const profileFormEl = container.querySelector('#profileForm');
-        if (profileFormEl) {
-            const csrfEl = profileFormEl.querySelector('input[name=csrfmiddlewaretoken]');
-            if (csrfEl) csrf = csrfEl.value;
-        }
-
-        if (!csrf) {
-            const getCookie = (name) => {
-                const v = document.cookie.match('(^|;)\\s*' + name + '\\s*=\\s*([^;]+)');
-                return v ? v.pop() : '';
-            };
-            csrf = getCookie('csrftoken');
-        }
+        const csrf = getCSRFCookie();
 
 
         uploadBtn.disabled = true;
@@ -151,10 +158,11 @@ function initProfileInternal(container) {
 
             
             if (data && data.ok) {
+                forgetCachedProfileSegments();
                 const url = data.profile_picture_url || '';
                 if (url) {
                     const imgEl = container.querySelector('.profile-image') || container.querySelector('#profileImg');
-                    if (imgEl) imgEl.src = url + '?t=' + Date.now();
+                    if (imgEl) setProfileImage(imgEl, url);
                 }
                 showToast('Profile photo updated', 1600);
             } else {
@@ -241,9 +249,8 @@ function initProfileInternal(container) {
                 try { if (nameInput) fd.set('name', nameInput.value); } catch(e){}
                 try { if (bioInput) fd.set('bio', bioInput.value); } catch(e){}
 
-                // CSRF token
-                const csrfEl = profileForm.querySelector('input[name=csrfmiddlewaretoken]');
-                const csrf = csrfEl ? csrfEl.value : null;
+                // CSRF token from the cookie; the cached segment HTML carries none
+                const csrf = getCSRFCookie();
 
                 try {
                     const headers = csrf ? { 'X-CSRFToken': csrf, 'X-Requested-With': 'XMLHttpRequest' } : { 'X-Requested-With': 'XMLHttpRequest' };
@@ -275,6 +282,7 @@ function initProfileInternal(container) {
                         if (contentType.includes('application/json')) {
                             const data = await resp.json().catch(() => null);
                             if (data && data.ok) {
+                                forgetCachedProfileSegments();
                                 // Update inline fields using server-returned canonical values when available
                                 try {
                                     const inlineName = container.querySelector('#pf-name');
@@ -286,7 +294,7 @@ function initProfileInternal(container) {
                                     // if server returned a profile picture url, update it
                                     if (data.profile_picture_url) {
                                         const imgEl = container.querySelector('.profile-image') || container.querySelector('#profileImg');
-                                        if (imgEl) imgEl.src = data.profile_picture_url + '?t=' + Date.now();
+                                        if (imgEl) setProfileImage(imgEl, data.profile_picture_url);
                                     }
                                 } catch (e) { console.warn('update inline fields', e); }
                                 showToast('Profile saved', 1200);
@@ -20,10 +20,9 @@ function initSettingsDarkMode(container) {
     // Persist to server
     try {
       const theme = darkModeToggle.checked ? 'dark' : 'light';
-      const csrftoken = (document.cookie.split('; ').find(r => r.startsWith('csrftoken=')) || '').split('=')[1] || '';
       fetch('/api/set-theme/', {
         method: 'POST',
-        headers: { 'X-CSRFToken': csrftoken },
+        headers: { 'X-CSRFToken': getCSRFCookie() },
         body: new URLSearchParams({ theme })
       }).catch(() => {});
     } catch (_) {}
@@ -31,6 +30,11 @@ function initSettingsDarkMode(container) {
 }
 
 
+function getCSRFCookie() {
+  const m = document.cookie.match(/(?:^|;\s*)csrftoken=([^;]+)/);
+  return m ? decodeURIComponent(m[1]) : '';
+}
+
 function clearDashboardState() {
     try {
         localStorage.removeItem('ds_timer_state_v2');
@@ -44,6 +48,8 @@ function clearDashboardState() {
 // Global init called from settings.html, idempotent and container-scoped
 window.initSettings = function(opts) {
   try {
+    // The segment loader passes the content element; the URLs come from settings.html
+    if (!opts || opts instanceof Element) opts = window.SETTINGS_CONFIG || {};
     const contentArea = document.getElementById('content-area') || document;
     const container = contentArea;
     initSettingsDarkMode(container);
@@ -53,7 +59,10 @@ window.initSettings = function(opts) {
       logoutBtn.__bound = true;
       logoutBtn.addEventListener('click', (e) => {
         clearDashboardState();
-        if (opts && opts.logoutUrl) window.location.href = opts.logoutUrl;
+        const leave = () => { if (opts && opts.logoutUrl) window.location.href = opts.logoutUrl; };
+        // Cached segments hold this user's data; drop them before signing out
+        if (window.DS && window.DS.clearSegmentCache) window.DS.clearSegmentCache().then(leave, leave);
+        else leave();
       });
     }
 
@@ -61,6 +70,8 @@ window.initSettings = function(opts) {
     if (settingsForm && !settingsForm.__bound) {
       settingsForm.__bound = true;
       settingsForm.addEventListener('submit', () => {
+        const csrfEl = settingsForm.querySelector('input[name=csrfmiddlewaretoken]');
+        if (csrfEl) csrfEl.value = getCSRFCookie();
         try { localStorage.removeItem('ds_timer_state_v2'); } catch (e) { console.warn('Failed to clear old timer state', e); }
       });
     }